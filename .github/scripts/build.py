@@ -6,9 +6,25 @@ an index.html file that lists all the notebooks. It handles both regular noteboo
 (from the notebooks/ directory) and apps (from the apps/ directory).
 
 The script can be run from the command line with optional arguments:
-    uv run .github/scripts/build.py [--output-dir OUTPUT_DIR]
+    uv run .github/scripts/build.py [--output-dir OUTPUT_DIR] [--jobs N] [--force]
 
 The exported files will be placed in the specified output directory (default: _site).
+A build manifest, kept outside the output directory so that it is not deployed,
+records the inputs of every export, so notebooks that did not change since the
+previous build are not exported again.
+Notebooks with the same PEP 723 dependencies share one pre-resolved environment,
+kept in a cache directory that can be persisted between builds. With --report the
+build writes a JSON timing and size report, optionally compared to a previous one.
+
+Apps using the shared package are then run once as scripts, and the Cellar results
+of their default view are baked into public/snapshots/<app>/ for a fast first paint.
+
+After exporting, the frontend assets of all folders are moved to one shared, content
+addressed directory (_assets/<hash>/), so browsers download the runtime once for all
+notebooks and can cache it forever. With --precompress, text files also get
+pre-compressed .br/.gz siblings, for hosts that serve them (e.g. nginx with
+gzip_static/brotli_static). GitHub Pages compresses on its own and ignores them,
+so the Pages workflow leaves this off.
 """
 
 # /// script
@@ -16,20 +32,280 @@ The exported files will be placed in the specified output directory (default: _s
 # dependencies = [
 #     "jinja2==3.1.3",
 #     "fire==0.7.0",
-#     "loguru==0.7.0"
+#     "loguru==0.7.0",
+#     "brotli==1.1.0"
 # ]
 # ///
 
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
 import subprocess
-from typing import List, Union
+import sys
+import tempfile
+import threading
+import time
+import tomllib
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Union
 from pathlib import Path
 
 import jinja2
 import fire
+import brotli
 
 from loguru import logger
 
-def _export_html_wasm(notebook_path: Path, output_dir: Path, as_app: bool = False) -> bool:
+# Default path of the build manifest, outside the output directory so that it is not deployed
+MANIFEST_PATH = ".cache/build-manifest.json"
+
+# PEP 723 inline script metadata block at the top of a notebook
+SCRIPT_HEADER = re.compile(r"^# /// script\s*$(.*?)^# ///\s*$", re.MULTILINE | re.DOTALL)
+
+# Where the query results of the apps' default view are baked, see ted_open_data/snapshots.py
+SNAPSHOTS_DIR = Path("public") / "snapshots"
+SNAPSHOT_TIMEOUT = 15 * 60
+
+# Geometry of the maps of the apps, see ted_open_data/geo.py, and where its source is kept between builds
+GEOMETRY_MODULE = "geo"
+GEOMETRY_CACHE = Path(".cache") / "geo" / "world-110m.json"
+
+# Shared directory of the deduplicated frontend assets
+SHARED_ASSETS = "_assets"
+
+# Files worth pre-compressing, and the smallest size at which it pays off
+COMPRESSIBLE_SUFFIXES = {".css", ".html", ".js", ".json", ".map", ".mjs", ".svg", ".txt", ".wasm", ".xml"}
+MIN_COMPRESS_BYTES = 1024
+
+# Per notebook metrics compared against the baseline report
+REPORT_METRICS = ["export_seconds", "env_seconds", "peak_rss_bytes", "html_bytes"]
+
+# Timings closer than this to the baseline are noise, not regressions
+MIN_SECONDS_CHANGE = 1.0
+
+# Age after which a cached export environment is upgraded to the latest releases of its
+# dependencies, so the exported marimo runtime does not stay at the first resolution
+ENV_MAX_AGE = 24 * 3600
+
+# Shared export environments being set up or ready, by environment key
+_environments: Dict[str, Future] = {}
+_environments_lock = threading.Lock()
+
+
+def _script_metadata(notebook_path: Path) -> dict:
+    """Read the PEP 723 inline script metadata of a notebook.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file)
+
+    Returns:
+        dict: The parsed metadata (dependencies, requires-python, ...), empty if there is none
+    """
+    header = SCRIPT_HEADER.search(notebook_path.read_text(encoding="utf-8"))
+    if not header:
+        return {}
+    content = "".join(
+        line[2:] if line.startswith("# ") else line[1:]
+        for line in header.group(1).splitlines(keepends=True)
+    )
+    return tomllib.loads(content)
+
+
+def _environment_spec(notebook_path: Path) -> Tuple[str, List[str], str]:
+    """Describe the export environment a notebook needs.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file)
+
+    Returns:
+        Tuple[str, List[str], str]: Key shared by all notebooks with the same requirements,
+                                    the sorted dependencies (always including marimo) and
+                                    the requires-python specifier
+    """
+    metadata = _script_metadata(notebook_path)
+    dependencies = sorted(set(metadata.get("dependencies", [])))
+    if not any(re.match(r"marimo\b", dep, re.IGNORECASE) for dep in dependencies):
+        dependencies.append("marimo")
+    requires_python = metadata.get("requires-python", "")
+    key = _hash(json.dumps([requires_python, dependencies]).encode("utf-8"))[:16]
+    return key, dependencies, requires_python
+
+
+def _create_environment(env_dir: Path, dependencies: List[str], requires_python: str) -> Optional[Path]:
+    """Create a virtual environment with the given dependencies, unless it is already cached.
+
+    A cached environment older than ENV_MAX_AGE is upgraded to the latest releases
+    matching its dependencies, as an export resolving its own sandbox would get.
+
+    Args:
+        env_dir (Path): Where the environment lives
+        dependencies (List[str]): Requirements to install
+        requires_python (str): Python version specifier, empty for the default Python
+
+    Returns:
+        Path | None: The environment directory, or None if it could not be created
+    """
+    ready: Path = env_dir / ".ready"
+    try:
+        created = json.loads(ready.read_text()).get("created", 0)
+    except (OSError, ValueError):
+        created = None
+    if created is not None and time.time() - created < ENV_MAX_AGE:
+        logger.info(f"Reusing cached environment {env_dir}")
+        return env_dir
+
+    start = time.perf_counter()
+    cmds: List[List[str]] = []
+    if created is None:
+        venv_cmd: List[str] = ["uv", "venv", "--clear", str(env_dir)]
+        if requires_python:
+            venv_cmd.extend(["--python", requires_python])
+        cmds.append(venv_cmd)
+    cmds.append(["uv", "pip", "install", "--upgrade", "--python", str(env_dir), *dependencies])
+
+    try:
+        logger.info(f"{'Creating' if created is None else 'Upgrading'} environment {env_dir} with {dependencies}")
+        for cmd in cmds:
+            subprocess.run(cmd, capture_output=True, text=True, check=True)
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.warning(f"Could not create environment {env_dir}: {getattr(e, 'stderr', e)}")
+        return None
+
+    ready.write_text(json.dumps({
+        "dependencies": dependencies,
+        "requires-python": requires_python,
+        "created": time.time(),
+    }))
+    logger.info(f"Prepared environment {env_dir} in {time.perf_counter() - start:.1f}s")
+    return env_dir
+
+
+def _shared_environment(notebook_path: Path, env_cache_dir: Path) -> Optional[Path]:
+    """Return the pre-resolved environment for a notebook, creating it once per dependency set.
+
+    Notebooks with the same PEP 723 dependencies and Python requirement share one
+    environment. When several exports need the same environment at the same time,
+    the first one creates it and the others wait for it.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file)
+        env_cache_dir (Path): Directory holding the environments
+
+    Returns:
+        Path | None: The environment directory, or None if it could not be created
+
+    Raises:
+        Exception: Errors reading the script metadata, or preparing the environment other
+                   than a failed install; notebooks waiting for the environment get them too
+    """
+    key, dependencies, requires_python = _environment_spec(notebook_path)
+
+    with _environments_lock:
+        environment = _environments.get(key)
+        owner = environment is None
+        if owner:
+            environment = _environments[key] = Future()
+
+    if owner:
+        # Always resolve the future, or the exports waiting for it would block forever
+        try:
+            environment.set_result(_create_environment(env_cache_dir / key, dependencies, requires_python))
+        except Exception as e:
+            environment.set_exception(e)
+    return environment.result()
+
+
+@lru_cache(maxsize=None)
+def _marimo_version(python_env: Optional[Path]) -> str:
+    """Return the version of marimo an export runs with.
+
+    Args:
+        python_env (Path, optional): The shared environment of the export, None for the
+                                     latest marimo that uvx resolves
+
+    Returns:
+        str: The version, empty if it could not be found
+    """
+    if python_env is not None:
+        python = python_env / ("Scripts" if os.name == "nt" else "bin") / "python"
+        cmd = [str(python), "-c", "from importlib.metadata import version; print(version('marimo'))"]
+    else:
+        cmd = ["uvx", "marimo", "--version"]
+    try:
+        return subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.strip()
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.warning(f"Could not find the marimo version of {python_env or 'uvx'}: {getattr(e, 'stderr', e)}")
+        return ""
+
+
+def _export_environment(notebook_path: Path, env_cache_dir: Optional[Path]) -> Tuple[Optional[Path], dict, float]:
+    """Prepare the environment a notebook is exported from, and describe it for the build manifest.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file)
+        env_cache_dir (Path, optional): Directory of the shared export environments, None
+                                        to let the export resolve its own sandbox
+
+    Returns:
+        Tuple[Path | None, dict, float]: The shared environment (None without one), its key
+                                         and resolved marimo version, and the time spent
+                                         getting it
+    """
+    start = time.perf_counter()
+    key = _environment_spec(notebook_path)[0]
+    python_env = _shared_environment(notebook_path, env_cache_dir) if env_cache_dir else None
+    environment = {"key": key, "marimo": _marimo_version(python_env)}
+    return python_env, environment, time.perf_counter() - start
+
+
+def _run_measured(cmd: List[str]) -> Optional[int]:
+    """Run a command to completion and measure its peak memory use.
+
+    Args:
+        cmd (List[str]): The command to run
+
+    Returns:
+        int | None: Peak resident set size of the command in bytes, None where it cannot be measured
+
+    Raises:
+        subprocess.CalledProcessError: If the command exits with a non-zero status
+    """
+    if not hasattr(os, "wait4"):
+        subprocess.run(cmd, capture_output=True, text=True, check=True)
+        return None
+
+    # Reap the process ourselves with wait4 to get its resource usage
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(cmd, stdout=stdout, stderr=stderr)
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        if process.returncode != 0:
+            stdout.seek(0)
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(
+                process.returncode, cmd,
+                output=stdout.read().decode(errors="replace"),
+                stderr=stderr.read().decode(errors="replace"),
+            )
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+
+def _export_html_wasm(
+    notebook_path: Path,
+    output_dir: Path,
+    as_app: bool = False,
+    python_env: Optional[Path] = None,
+    stats: Optional[dict] = None,
+) -> bool:
     """Export a single marimo notebook to HTML/WebAssembly format.
 
     This function takes a marimo notebook (.py file) and exports it to HTML/WebAssembly format.
@@ -41,6 +317,10 @@ def _export_html_wasm(notebook_path: Path, output_dir: Path, as_app: bool = Fals
         output_dir (Path): Directory where the exported HTML file will be saved
         as_app (bool, optional): Whether to export as an app (run mode) or notebook (edit mode).
                                 Defaults to False.
+        python_env (Path, optional): Pre-resolved environment to run marimo from. If None,
+                                     the export resolves its own sandbox with uvx.
+        stats (dict, optional): Filled with the peak memory use of the export ("peak_rss_bytes")
+                                and the size of the exported HTML file ("html_bytes")
 
     Returns:
         bool: True if export succeeded, False otherwise
@@ -49,7 +329,11 @@ def _export_html_wasm(notebook_path: Path, output_dir: Path, as_app: bool = Fals
     output_path: Path = notebook_path.with_suffix(".html")
 
     # Base command for marimo export
-    cmd: List[str] = ["uvx", "marimo", "export", "html-wasm", "--sandbox"]
+    if python_env is not None:
+        marimo: Path = python_env / ("Scripts" if os.name == "nt" else "bin") / "marimo"
+        cmd: List[str] = [str(marimo), "export", "html-wasm"]
+    else:
+        cmd: List[str] = ["uvx", "marimo", "export", "html-wasm", "--sandbox"]
 
     # Configure export mode based on whether it's an app or a notebook
     if as_app:
@@ -69,8 +353,12 @@ def _export_html_wasm(notebook_path: Path, output_dir: Path, as_app: bool = Fals
 
         # Run marimo export command
         logger.debug(f"Running command: {cmd}")
-        subprocess.run(cmd, capture_output=True, text=True, check=True)
+        peak_rss = _run_measured(cmd)
         logger.info(f"Successfully exported {notebook_path}")
+
+        if stats is not None:
+            stats["peak_rss_bytes"] = peak_rss
+            stats["html_bytes"] = output_file.stat().st_size
         return True
     except subprocess.CalledProcessError as e:
         # Handle marimo export errors
@@ -83,6 +371,98 @@ def _export_html_wasm(notebook_path: Path, output_dir: Path, as_app: bool = Fals
         return False
 
 
+def _is_package_module(path: Path, folder: Path) -> bool:
+    """Check whether a Python file belongs to a package rather than being a notebook.
+
+    Shared code used by the notebooks lives in regular Python packages (directories
+    with an __init__.py) inside the notebook folders. Those modules must not be
+    exported as notebooks themselves.
+
+    Args:
+        path (Path): Path to the Python file
+        folder (Path): Notebook folder that is being exported
+
+    Returns:
+        bool: True if the file is part of a package, False otherwise
+    """
+    for parent in path.parents:
+        if parent == folder:
+            break
+        if (parent / "__init__.py").exists():
+            return True
+    return False
+
+
+def _bundle_packages(folder: Path, output_dir: Path) -> List[Path]:
+    """Zip the shared packages of a notebook folder into its exported public/ directory.
+
+    WebAssembly notebooks cannot import modules from the repository, so every package
+    found directly in the folder is written as a zip archive to public/<package>.zip
+    next to the exported notebooks. The notebooks download the archive and put it on
+    sys.path when running in the browser.
+
+    Args:
+        folder (Path): Path to the folder containing the notebooks and packages
+        output_dir (Path): Directory where the exported files are saved
+
+    Returns:
+        List[Path]: Paths of the written zip archives
+    """
+    if not folder.exists():
+        return []
+
+    archives = []
+    for package in sorted(p.parent for p in folder.glob("*/__init__.py")):
+        archive: Path = output_dir / folder / "public" / f"{package.name}.zip"
+        archive.parent.mkdir(parents=True, exist_ok=True)
+
+        logger.info(f"Bundling package {package} to {archive}")
+        with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for file in sorted(package.rglob("*")):
+                if file.is_file() and "__pycache__" not in file.parts:
+                    zf.write(file, file.relative_to(folder))
+        archives.append(archive)
+
+    return archives
+
+
+def _prepare_geometry(folder: Path, output_dir: Path, cache_path: Path = GEOMETRY_CACHE) -> List[Path]:
+    """Write the map geometry of the shared packages of a notebook folder to its public/ directory.
+
+    The geo module of every package of the folder (see ted_open_data/geo.py) is run as
+    a script, which writes a topology clipped to the area the maps show, so the apps
+    do not download the world geometry in the browser. The source geometry is
+    downloaded once and kept in cache_path.
+
+    Args:
+        folder (Path): Path to the folder containing the notebooks and packages
+        output_dir (Path): Directory where the exported files are saved
+        cache_path (Path, optional): Where to keep the downloaded source geometry
+
+    Returns:
+        List[Path]: Packages whose geometry was written
+    """
+    if not folder.exists():
+        return []
+
+    written = []
+    for module in sorted(folder.glob(f"*/{GEOMETRY_MODULE}.py")):
+        if not (module.parent / "__init__.py").exists():
+            continue
+        cmd = [sys.executable, "-m", f"{module.parent.name}.{GEOMETRY_MODULE}",
+               str((output_dir / folder).absolute()), str(cache_path.absolute())]
+        try:
+            result = subprocess.run(cmd, cwd=folder, capture_output=True, text=True, check=True)
+            logger.info(result.stdout.strip())
+            written.append(module.parent)
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"Could not prepare the map geometry of {module.parent}: {e}")
+            if e.stderr:
+                logger.warning(f"Error details: {e.stderr}")
+
+    return written
+
+
 def _generate_index(output_dir: Path, template_file: Path, notebooks_data: List[dict] | None = None, apps_data: List[dict] | None = None) -> None:
     """Generate an index.html file that lists all the notebooks.
 
@@ -133,28 +513,413 @@ def _generate_index(output_dir: Path, template_file: Path, notebooks_data: List[
         logger.error(f"Error rendering template: {e}")
 
 
-def _export(folder: Path, output_dir: Path, as_app: bool=False) -> List[dict]:
-    """Export all marimo notebooks in a folder to HTML/WebAssembly format.
+def _bake_snapshots(folder: Path, output_dir: Path, env_cache_dir: Optional[Path] = None) -> Dict[str, bool]:
+    """Run the apps of a folder once and keep the Cellar results of their default view.
+
+    Every notebook of the folder that uses the shared ted_open_data package is run as a
+    script, with its queries recorded to public/snapshots/<notebook>/ (see
+    ted_open_data/snapshots.py). Each run starts from an empty result cache so that
+    it sends the same queries as a first visit in the browser. A failed run keeps the
+    results recorded so far; snapshots of notebooks that no longer exist are removed.
+
+    Args:
+        folder (Path): Path to the folder containing the apps
+        output_dir (Path): Directory where the exported files are saved
+        env_cache_dir (Path, optional): Directory of the shared environments, None to run
+                                        every notebook with uv run
+
+    Returns:
+        Dict[str, bool]: Whether the run succeeded, by notebook
+    """
+    snapshots_root: Path = output_dir / folder / SNAPSHOTS_DIR
+    notebooks = [nb for nb in sorted(folder.glob("*.py")) if "ted_open_data" in nb.read_text()]
+
+    if snapshots_root.exists():
+        for stale in snapshots_root.iterdir():
+            if stale.name not in {nb.stem for nb in notebooks}:
+                shutil.rmtree(stale)
+
+    results = {}
+    for nb in notebooks:
+        snapshots: Path = snapshots_root / nb.stem
+        shutil.rmtree(snapshots, ignore_errors=True)
+
+        try:
+            python_env = _shared_environment(nb, env_cache_dir) if env_cache_dir else None
+        except Exception as e:
+            logger.warning(f"Could not bake the snapshots of {nb}, it will query Cellar on first paint: {e}")
+            results[str(nb)] = False
+            continue
+        if python_env is not None:
+            cmd = [str(python_env / ("Scripts" if os.name == "nt" else "bin") / "python"), str(nb)]
+        else:
+            cmd = ["uv", "run", "--script", str(nb)]
+
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            env = {
+                **os.environ,
+                "TED_OPEN_DATA_RECORD_SNAPSHOTS": str(snapshots.absolute()),
+                "TED_OPEN_DATA_CACHE_DIR": cache_dir,
+            }
+            try:
+                subprocess.run(cmd, env=env, capture_output=True, text=True, check=True, timeout=SNAPSHOT_TIMEOUT)
+                results[str(nb)] = True
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+                logger.warning(f"Could not bake the snapshots of {nb}, it will query Cellar on first paint: {e}")
+                if getattr(e, "stderr", None):
+                    logger.warning(f"Error details: {e.stderr}")
+                results[str(nb)] = False
+
+        recorded = len(list(snapshots.glob("*.parquet")))
+        if not recorded:
+            shutil.rmtree(snapshots, ignore_errors=True)
+        logger.info(f"Baked {recorded} query results of {nb} in {time.perf_counter() - start:.1f}s")
+
+    return results
+
+
+def _dedupe_assets(output_dir: Path) -> Dict[str, str]:
+    """Move the exported assets of every folder to one shared, content addressed directory.
+
+    Every export writes the marimo frontend to an assets/ directory next to the HTML file,
+    so notebooks/ and apps/ each carry a copy. Each copy is moved to
+    _assets/<hash of its content>/, and the HTML files of the folder are rewritten to
+    load it from there. Identical copies end up in the same directory, which never
+    changes once written and can be cached forever. Relative imports between the asset
+    files keep working since the layout inside the directory is unchanged. Shared
+    directories no longer referenced by any HTML file are removed.
+
+    Args:
+        output_dir (Path): Directory holding the build
+
+    Returns:
+        Dict[str, str]: Shared asset directory by folder whose assets were moved
+    """
+    shared_root: Path = output_dir / SHARED_ASSETS
+    moved = {}
+
+    for assets in sorted(output_dir.glob("*/assets")):
+        if not assets.is_dir():
+            continue
+
+        digest = hashlib.sha256()
+        for file in sorted(f for f in assets.rglob("*") if f.is_file()):
+            digest.update(file.relative_to(assets).as_posix().encode() + b"\0")
+            digest.update(hashlib.sha256(file.read_bytes()).digest())
+        shared: Path = shared_root / digest.hexdigest()[:16]
+
+        if shared.exists():
+            shutil.rmtree(assets)
+        else:
+            shared_root.mkdir(parents=True, exist_ok=True)
+            shutil.move(assets, shared)
+
+        prefix = os.path.relpath(shared, assets.parent).replace(os.sep, "/")
+        for html in assets.parent.glob("*.html"):
+            text = html.read_text()
+            rewritten = re.sub(r"""(["'(])(?:\./)?assets/""", rf"\g<1>{prefix}/", text)
+            if rewritten != text:
+                html.write_text(rewritten)
+
+        logger.info(f"Moved {assets} to shared assets {shared}")
+        moved[assets.parent.name] = shared.name
+
+    # Drop shared directories that no HTML file refers to anymore
+    if shared_root.exists():
+        pages = "\n".join(html.read_text() for html in output_dir.rglob("*.html"))
+        for shared in shared_root.iterdir():
+            if f"{SHARED_ASSETS}/{shared.name}/" not in pages:
+                logger.info(f"Removing unused shared assets {shared}")
+                shutil.rmtree(shared)
+
+    return moved
+
+
+def _precompress(output_dir: Path) -> int:
+    """Write pre-compressed .br and .gz siblings of the text files of the build.
+
+    Files smaller than MIN_COMPRESS_BYTES are skipped, and siblings that are newer than
+    their file are kept, so unchanged files are not compressed again. Siblings of files
+    that no longer exist are removed.
+
+    Args:
+        output_dir (Path): Directory holding the build
+
+    Returns:
+        int: Number of files compressed
+    """
+    compressed = 0
+    for file in sorted(output_dir.rglob("*")):
+        if file.suffix in (".br", ".gz"):
+            if not file.with_suffix("").exists():
+                file.unlink()
+            continue
+        if not file.is_file() or file.name.startswith(".") or file.suffix not in COMPRESSIBLE_SUFFIXES:
+            continue
+        if file.stat().st_size < MIN_COMPRESS_BYTES:
+            continue
+
+        br, gz = Path(f"{file}.br"), Path(f"{file}.gz")
+        mtime = file.stat().st_mtime
+        if all(sibling.exists() and sibling.stat().st_mtime >= mtime for sibling in (br, gz)):
+            continue
+
+        data = file.read_bytes()
+        br.write_bytes(brotli.compress(data, quality=11))
+        gz.write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+        compressed += 1
+
+    logger.info(f"Pre-compressed {compressed} files")
+    return compressed
+
+
+def _remove_precompressed(output_dir: Path) -> int:
+    """Remove the .br and .gz siblings written by an earlier build with --precompress.
+
+    Args:
+        output_dir (Path): Directory holding the build
+
+    Returns:
+        int: Number of files removed
+    """
+    removed = 0
+    for sibling in sorted(output_dir.rglob("*")):
+        if sibling.suffix in (".br", ".gz") and sibling.with_suffix("").is_file():
+            sibling.unlink()
+            removed += 1
+    if removed:
+        logger.info(f"Removed {removed} pre-compressed files")
+    return removed
+
+
+def _hash(data: bytes) -> str:
+    """Return the SHA-256 hex digest of some bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _notebook_inputs(notebook_path: Path, as_app: bool, environment: dict) -> dict:
+    """Describe everything an export depends on, for the build manifest.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file)
+        as_app (bool): Whether the notebook is exported as an app (run mode)
+        environment (dict): Key and marimo version of the export environment
+
+    Returns:
+        dict: Hashes of the notebook source and its PEP 723 script header, the export
+              environment, the export mode and the output file
+    """
+    source = notebook_path.read_bytes()
+    header = SCRIPT_HEADER.search(source.decode("utf-8", errors="replace"))
+    return {
+        "source": _hash(source),
+        "header": _hash(header.group(1).encode("utf-8") if header else b""),
+        "environment": environment,
+        "mode": "run" if as_app else "edit",
+        "output": str(notebook_path.with_suffix(".html")),
+    }
+
+
+def _load_manifest(manifest_path: Path) -> Dict[str, dict]:
+    """Load the build manifest of a previous build, or an empty one.
+
+    Args:
+        manifest_path (Path): Path of the manifest of the previous build
+
+    Returns:
+        Dict[str, dict]: The inputs of each exported notebook, by notebook path
+    """
+    try:
+        return json.loads(manifest_path.read_text())["notebooks"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def _save_manifest(manifest_path: Path, notebooks: Dict[str, dict]) -> None:
+    """Write the build manifest.
+
+    Args:
+        manifest_path (Path): Path of the manifest
+        notebooks (Dict[str, dict]): The inputs of each exported notebook, by notebook path
+    """
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    manifest_path.write_text(json.dumps({"notebooks": notebooks}, indent=2, sort_keys=True))
+    logger.info(f"Wrote build manifest to {manifest_path}")
+
+
+def _prune(output_dir: Path, previous: Dict[str, dict], current: Dict[str, dict]) -> None:
+    """Remove the exported files of notebooks that no longer exist.
+
+    Args:
+        output_dir (Path): Directory holding the build
+        previous (Dict[str, dict]): Manifest entries of the previous build
+        current (Dict[str, dict]): Manifest entries of the notebooks found in this build
+    """
+    for notebook, inputs in previous.items():
+        if notebook not in current:
+            stale: Path = output_dir / inputs["output"]
+            logger.info(f"Removing {stale} of deleted notebook {notebook}")
+            stale.unlink(missing_ok=True)
+
 
-    This function finds all Python files in the specified folder and exports them
-    to HTML/WebAssembly format using the export_html_wasm function. It returns a
-    list of dictionaries containing the data needed for the template.
+def _timed_export(
+    notebook_path: Path,
+    output_dir: Path,
+    as_app: bool = False,
+    python_env: Optional[Path] = None,
+    env_seconds: float = 0.0,
+) -> Tuple[bool, dict]:
+    """Export a single notebook and measure the export.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file) to export
+        output_dir (Path): Directory where the exported HTML file will be saved
+        as_app (bool, optional): Whether to export as an app (run mode) or notebook (edit mode).
+        python_env (Path, optional): Shared export environment, None to let the export
+                                     resolve its own sandbox
+        env_seconds (float, optional): Time spent getting the shared environment
+
+    Returns:
+        Tuple[bool, dict]: Whether the export succeeded, and its metrics: the time spent
+                           getting the shared environment ("env_seconds"), the wall time of
+                           the export subprocess ("export_seconds"), its peak memory use and
+                           the size of the exported HTML file
+    """
+    stats: dict = {"skipped": False, "env_seconds": env_seconds}
+
+    start = time.perf_counter()
+    success = _export_html_wasm(notebook_path, output_dir, as_app=as_app, python_env=python_env, stats=stats)
+    stats["export_seconds"] = time.perf_counter() - start
+
+    logger.info(f"Export of {notebook_path} took {stats['env_seconds'] + stats['export_seconds']:.1f}s")
+    return success, stats
+
+
+def _write_report(report_path: Path, output_dir: Path, exports: List[Tuple[Path, Future]], jobs: int, total_seconds: float) -> dict:
+    """Write the build report and log it as a table.
+
+    Args:
+        report_path (Path): Where to write the JSON report
+        output_dir (Path): Directory holding the build
+        exports (List[Tuple[Path, Future]]): The notebooks and their finished exports
+        jobs (int): Number of concurrent exports
+        total_seconds (float): Wall time of the whole build
+
+    Returns:
+        dict: The report
+    """
+    notebooks = {}
+    for nb, future in exports:
+        success, stats = future.result()
+        notebooks[str(nb)] = {"success": success, **stats}
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "jobs": jobs,
+        "total_seconds": total_seconds,
+        "site_bytes": sum(f.stat().st_size for f in output_dir.rglob("*") if f.is_file()),
+        "notebooks": notebooks,
+    }
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report_path.write_text(json.dumps(report, indent=2, sort_keys=True))
+
+    logger.info(f"{'notebook':<45} {'env s':>7} {'export s':>9} {'peak RSS MB':>12} {'HTML KB':>9}")
+    for nb, stats in notebooks.items():
+        if stats["skipped"]:
+            logger.info(f"{nb:<45} {'skipped (unchanged)':>40}")
+            continue
+        rss = stats.get("peak_rss_bytes")
+        html = stats.get("html_bytes")
+        logger.info(
+            f"{nb:<45} {stats['env_seconds']:>7.1f} {stats['export_seconds']:>9.1f} "
+            f"{rss / 2**20 if rss else float('nan'):>12.1f} {html / 2**10 if html else float('nan'):>9.1f}"
+        )
+    logger.info(f"Build took {total_seconds:.1f}s, site is {report['site_bytes'] / 2**20:.1f} MB")
+    logger.info(f"Wrote build report to {report_path}")
+    return report
+
+
+def _compare_reports(report: dict, baseline_path: Path, threshold: float) -> List[str]:
+    """Compare a build report with a previous one and log the regressions.
+
+    A metric regresses when it grew by more than the threshold (relative), and timings
+    also by more than MIN_SECONDS_CHANGE. Notebooks skipped in either build are not compared.
+
+    Args:
+        report (dict): The report of this build
+        baseline_path (Path): Path to the previous report
+        threshold (float): Allowed relative growth, e.g. 0.2 for 20%
+
+    Returns:
+        List[str]: Description of every regression found
+    """
+    try:
+        baseline = json.loads(baseline_path.read_text())
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read baseline report {baseline_path}: {e}")
+        return []
+
+    def grew(new, old, floor: float = 0) -> bool:
+        return bool(new) and bool(old) and new > old * (1 + threshold) and new - old > floor
+
+    regressions = []
+    for nb, stats in report["notebooks"].items():
+        previous = baseline.get("notebooks", {}).get(nb)
+        if previous is None or stats["skipped"] or previous.get("skipped"):
+            continue
+        for metric in REPORT_METRICS:
+            floor = MIN_SECONDS_CHANGE if metric.endswith("_seconds") else 0
+            if grew(stats.get(metric), previous.get(metric), floor):
+                regressions.append(f"{nb}: {metric} {previous[metric]:.6g} -> {stats[metric]:.6g}")
+    if grew(report["site_bytes"], baseline.get("site_bytes")):
+        regressions.append(f"site_bytes {baseline['site_bytes']} -> {report['site_bytes']}")
+
+    for regression in regressions:
+        logger.warning(f"Regression: {regression}")
+    if not regressions:
+        logger.info(f"No regressions above {threshold:.0%} compared to {baseline_path}")
+    return regressions
+
+
+def _export(
+    folder: Path,
+    output_dir: Path,
+    executor: ThreadPoolExecutor,
+    as_app: bool = False,
+    manifest: Optional[Dict[str, dict]] = None,
+    inputs: Optional[Dict[str, dict]] = None,
+    env_cache_dir: Optional[Path] = None,
+) -> List[Tuple[Path, Future]]:
+    """Submit the export of all marimo notebooks in a folder to a worker pool.
+
+    This function finds all Python files in the specified folder and submits their
+    export to HTML/WebAssembly format to the executor, so that the notebooks of all
+    folders are exported concurrently. Use _collect to wait for the results.
+
+    The export environments are prepared first, since the marimo version they resolve
+    to is one of the inputs of an export. Notebooks whose inputs match the manifest of
+    the previous build, and whose output still exists, are not exported again.
 
     Args:
         folder (Path): Path to the folder containing marimo notebooks
         output_dir (Path): Directory where the exported HTML files will be saved
+        executor (ThreadPoolExecutor): Pool running the exports
         as_app (bool, optional): Whether to export as apps (run mode) or notebooks (edit mode).
+        manifest (Dict[str, dict], optional): Manifest of the previous build, None to export everything
+        inputs (Dict[str, dict], optional): Filled with the inputs of every notebook found
+        env_cache_dir (Path, optional): Directory of the shared export environments
 
     Returns:
-        List[dict]: List of dictionaries with "display_name" and "html_path" for each notebook
+        List[Tuple[Path, Future]]: Each notebook with the future of its export, in a stable order
     """
     # Check if the folder exists
     if not folder.exists():
         logger.warning(f"Directory not found: {folder}")
         return []
 
-    # Find all Python files recursively in the folder
-    notebooks = list(folder.rglob("*.py"))
+    # Find all Python files recursively in the folder, skipping shared packages
+    notebooks = sorted(nb for nb in folder.rglob("*.py") if not _is_package_module(nb, folder))
     logger.debug(f"Found {len(notebooks)} Python files in {folder}")
 
     # Exit if no notebooks were found
@@ -162,22 +927,73 @@ def _export(folder: Path, output_dir: Path, as_app: bool=False) -> List[dict]:
         logger.warning(f"No notebooks found in {folder}!")
         return []
 
+    environments = {nb: executor.submit(_export_environment, nb, env_cache_dir) for nb in notebooks}
+
+    exports = []
+    for nb in notebooks:
+        try:
+            python_env, environment, env_seconds = environments[nb].result()
+        except Exception as e:
+            # e.g. an invalid script header: only this notebook fails, not the build
+            logger.error(f"Could not prepare the environment of {nb}: {e}")
+            failed: Future = Future()
+            failed.set_result((False, {"skipped": False, "env_seconds": 0.0, "export_seconds": 0.0}))
+            exports.append((nb, failed))
+            continue
+
+        nb_inputs = _notebook_inputs(nb, as_app, environment)
+        if inputs is not None:
+            inputs[str(nb)] = nb_inputs
+
+        if manifest is not None and manifest.get(str(nb)) == nb_inputs and (output_dir / nb_inputs["output"]).exists():
+            logger.info(f"Skipping unchanged {nb}")
+            skipped: Future = Future()
+            skipped.set_result((True, {"skipped": True}))
+            exports.append((nb, skipped))
+        else:
+            exports.append((nb, executor.submit(_timed_export, nb, output_dir, as_app, python_env, env_seconds)))
+    return exports
+
+
+def _collect(folder: Path, exports: List[Tuple[Path, Future]]) -> List[dict]:
+    """Wait for the exports of a folder and return the data needed for the template.
+
+    Args:
+        folder (Path): Path to the folder containing the notebooks
+        exports (List[Tuple[Path, Future]]): The notebooks and export futures returned by _export
+
+    Returns:
+        List[dict]: List of dictionaries with "display_name" and "html_path" for each
+                    successfully exported notebook, in the order of the notebooks
+    """
     # For each successfully exported notebook, add its data to the notebook_data list
     notebook_data = [
         {
             "display_name": (nb.stem.replace("_", " ").title()),
             "html_path": str(nb.with_suffix(".html")),
         }
-        for nb in notebooks
-        if _export_html_wasm(nb, output_dir, as_app=as_app)
+        for nb, future in exports
+        if future.result()[0]
     ]
 
-    logger.info(f"Successfully exported {len(notebook_data)} out of {len(notebooks)} files from {folder}")
+    if exports:
+        logger.info(f"Successfully exported {len(notebook_data)} out of {len(exports)} files from {folder}")
     return notebook_data
 
+
 def main(
     output_dir: Union[str, Path] = "_site",
     template: Union[str, Path] = "templates/index.html.j2",
+    jobs: int = os.cpu_count() or 1,
+    force: bool = False,
+    manifest_path: Union[str, Path] = MANIFEST_PATH,
+    env_cache_dir: Union[str, Path] = ".cache/marimo-envs",
+    shared_envs: bool = True,
+    snapshots: bool = True,
+    precompress: bool = False,
+    report: Union[str, Path, None] = None,
+    baseline: Union[str, Path, None] = None,
+    regression_threshold: float = 0.2,
 ) -> None:
     """Main function to export marimo notebooks.
 
@@ -189,11 +1005,23 @@ def main(
     Command line arguments:
         --output-dir: Directory where the exported files will be saved (default: _site)
         --template: Path to the template file (default: templates/index.html.j2)
+        --jobs: Number of notebooks exported concurrently (default: number of CPUs)
+        --force: Export all notebooks, even those unchanged since the previous build
+        --manifest-path: Path of the build manifest (default: .cache/build-manifest.json)
+        --env-cache-dir: Directory of the shared export environments (default: .cache/marimo-envs)
+        --no-shared-envs: Let every export resolve its own sandbox instead
+        --no-snapshots: Do not bake the query results of the apps' default view
+        --precompress: Write .br/.gz siblings of the text files, for hosts serving them
+                       (not GitHub Pages, which compresses on its own)
+        --report: Write a JSON report with the time, peak memory and output size of every export
+        --baseline: Previous report to compare with; growth above --regression-threshold
+                    (default: 0.2) is logged as a regression
 
     Returns:
         None
     """
     logger.info("Starting marimo build process")
+    build_start = time.perf_counter()
 
     # Convert output_dir explicitly to Path (not done by fire)
     output_dir: Path = Path(output_dir)
@@ -206,11 +1034,40 @@ def main(
     template_file: Path = Path(template)
     logger.info(f"Using template file: {template_file}")
 
-    # Export notebooks from the notebooks/ directory
-    notebooks_data = _export(Path("notebooks"), output_dir, as_app=False)
+    # Inputs of the previous build, to skip notebooks that did not change
+    manifest_path = Path(manifest_path)
+    previous = _load_manifest(manifest_path)
+    manifest = None if force else previous
+    inputs: Dict[str, dict] = {}
+
+    # Notebooks with the same dependencies share one pre-resolved environment
+    shared_env_dir: Optional[Path] = Path(env_cache_dir).absolute() if shared_envs else None
+    if shared_env_dir:
+        logger.info(f"Using shared export environments in {shared_env_dir}")
 
-    # Export apps from the apps/ directory
-    apps_data = _export(Path("apps"), output_dir, as_app=True)
+    logger.info(f"Exporting with {jobs} concurrent jobs")
+    with ThreadPoolExecutor(max_workers=max(1, int(jobs))) as executor:
+        # Export notebooks from the notebooks/ directory and apps from the apps/ directory
+        notebook_exports = _export(Path("notebooks"), output_dir, executor, as_app=False, manifest=manifest,
+                                   inputs=inputs, env_cache_dir=shared_env_dir)
+        app_exports = _export(Path("apps"), output_dir, executor, as_app=True, manifest=manifest,
+                              inputs=inputs, env_cache_dir=shared_env_dir)
+
+        notebooks_data = _collect(Path("notebooks"), notebook_exports)
+        apps_data = _collect(Path("apps"), app_exports)
+
+    # Bake the data of the apps' default view, the data changes even when the apps do not
+    if snapshots:
+        _bake_snapshots(Path("apps"), output_dir, env_cache_dir=shared_env_dir)
+
+    # Record the inputs of the successful exports only, so failed ones are retried
+    exported = {str(nb) for nb, future in notebook_exports + app_exports if future.result()[0]}
+    _prune(output_dir, previous, inputs)
+    _save_manifest(manifest_path, {nb: nb_inputs for nb, nb_inputs in inputs.items() if nb in exported})
+
+    # Ship the shared packages imported by the apps, and the geometry of their maps
+    _bundle_packages(Path("apps"), output_dir)
+    _prepare_geometry(Path("apps"), output_dir)
 
     # Exit if no notebooks or apps were found
     if not notebooks_data and not apps_data:
@@ -220,6 +1077,20 @@ def main(
     # Generate the index.html file that lists all notebooks and apps
     _generate_index(output_dir=output_dir, notebooks_data=notebooks_data, apps_data=apps_data, template_file=template_file)
 
+    # Serve the frontend once for all folders, pre-compressed for hosts that serve the siblings
+    _dedupe_assets(output_dir)
+    if precompress:
+        _precompress(output_dir)
+    else:
+        _remove_precompressed(output_dir)
+
+    # Report the cost of every export, and how it changed since the baseline build
+    if report:
+        build_report = _write_report(Path(report), output_dir, notebook_exports + app_exports,
+                                     jobs=int(jobs), total_seconds=time.perf_counter() - build_start)
+        if baseline:
+            _compare_reports(build_report, Path(baseline), threshold=float(regression_threshold))
+
     logger.info(f"Build completed successfully. Output directory: {output_dir}")
 
 
@@ -3,11 +3,10 @@
 # dependencies = [
 #     "altair==5.4.1",
 #     "marimo",
-#     "vega-datasets==0.9.0",
-#     "pyarrow",
 #     "pandas",
-#     "requests",
-#     "SPARQLWrapper",
+#     "pyarrow",
+#     "requests==2.32.5",
+#     "vega-datasets==0.9.0",
 # ]
 # ///
 
@@ -21,11 +20,45 @@ app = marimo.App(width="full")
 def _():
     import pandas as pd
     import marimo as mo
-    import requests
 
     from pandas import json_normalize
-    from SPARQLWrapper import SPARQLWrapper, JSON
-    return JSON, SPARQLWrapper, mo, pd, requests
+    return mo, pd
+
+
+@app.cell
+async def _():
+    import sys
+
+    if sys.platform == "emscripten":
+        # In the WebAssembly export the shared package is shipped as a zip
+        # next to the notebook, see build.py
+        import micropip
+        from pyodide.http import pyfetch
+        from marimo import notebook_location
+
+        _response = await pyfetch(str(notebook_location() / "public" / "ted_open_data.zip"))
+        with open("/tmp/ted_open_data.zip", "wb") as _f:
+            _f.write(await _response.bytes())
+        sys.path.insert(0, "/tmp/ted_open_data.zip")
+
+        import ted_open_data
+        await micropip.install(ted_open_data.REQUIREMENTS)
+
+        # Results of the default view, baked into the site by build.py
+        import ted_open_data.snapshots
+        await ted_open_data.snapshots.fetch_snapshots(
+            str(notebook_location() / "public" / "snapshots" / "01-cellar-daily")
+        )
+
+    import ted_open_data.cache
+    import ted_open_data.charts
+    import ted_open_data.concurrency
+    import ted_open_data.labels
+    import ted_open_data.profiling
+    import ted_open_data.reconcile
+    import ted_open_data.sparql
+    import ted_open_data.ted_api
+    return (ted_open_data,)
 
 
 @app.cell
@@ -43,30 +76,35 @@ def _(mo, selected_date):
 
 
 @app.cell
-def _(do_query, notices_per_day_query):
-    notices_raw = do_query(notices_per_day_query)
-    return (notices_raw,)
+async def _(
+    do_query_async,
+    fetch_ted_daily_notices,
+    labels,
+    notices_per_day_query,
+    selected_date,
+    ted_open_data,
+):
+    # The Cellar notices, the TED daily total and the labels do not depend on
+    # each other, so they are fetched at the same time, in the browser too
+    _results = await ted_open_data.concurrency.gather_async(
+        notices_raw=lambda: do_query_async(
+            notices_per_day_query,
+            dtype_backend="pyarrow",
+            stream=True,
+            ttl=ted_open_data.cache.ttl_for_dates(selected_date.value),
+        ),
+        ted_daily=lambda: fetch_ted_daily_notices(selected_date.value.isoformat()),
+        labels=lambda: ted_open_data.concurrency.run_blocking(lambda: labels.version),  # loads the label snapshot
+    )
+    notices_raw, ted_daily = _results["notices_raw"], _results["ted_daily"]
+    return notices_raw, ted_daily
 
 
 @app.cell
-def _(form_type_dict, mo, notice_type_dict, notices_raw):
-    notices = notices_raw.copy()
-    if (len(notices)):
-        notices['noticeType'] = notices['noticeTypeUri'].map(notice_type_dict)
-        notices['formType'] = notices['formTypeUri'].map(form_type_dict)
-
-        # Create TED URL for each notice
-        notices['tedUrl'] = notices['publicationNumber'].apply(
-            lambda x: f"https://ted.europa.eu/en/notice/-/detail/{x}"
-        )
-
-        # Remove URI columns
-        notices = notices.drop(columns=['noticeTypeUri', 'formTypeUri'])
-
-        # Reorder columns
-        notices = notices[['publicationNumber', 'noticeType', 'formType', 'tedUrl']]
-
-    mo.ui.table(notices, selection=None)
+def _(labels, mo, notices_raw):
+    notices = enrich_notices(notices_raw, labels)
+    # The widget gets the Arrow table and only sends the page shown to the browser
+    mo.ui.table(notices, selection=None, pagination=True, page_size=25)
     return (notices,)
 
 
@@ -102,6 +140,44 @@ def _(
     return
 
 
+@app.cell
+def _(get_default_date, mo, timedelta):
+    reconciliation_period = mo.ui.date_range(
+        value=(get_default_date() - timedelta(days=6), get_default_date()),
+    )
+    reconcile_button = mo.ui.run_button(label="Reconcile")
+    return reconcile_button, reconciliation_period
+
+
+@app.cell
+def _(mo, reconcile_button, reconciliation_period):
+    mo.md(
+        rf"""
+    ## Reconciliation with TED API over a period
+
+    Compares Cellar and the TED API notice by notice and lists, for each day, the
+    publication numbers missing on either side.
+
+    Period: {reconciliation_period} {reconcile_button}
+    """
+    )
+    return
+
+
+@app.cell
+def _(mo, reconcile_button, reconciliation_period, ted_open_data, timedelta):
+    mo.stop(not reconcile_button.value)
+
+    _first_day, _last_day = reconciliation_period.value
+    reconciliation = ted_open_data.reconcile.reconcile(_first_day, _last_day + timedelta(days=1))
+
+    mo.vstack([
+        mo.ui.table(reconciliation.summary, selection=None, label="Notices per day"),
+        mo.ui.table(reconciliation.differences, selection=None, label="Missing notices"),
+    ])
+    return
+
+
 @app.cell
 def _(mo, notices_per_day_query):
     mo.md(
@@ -141,51 +217,10 @@ def _(selected_date):
 
 
 @app.cell
-def _(do_query):
-    # Fetch notice type labels (cached)
-    notice_type_query = """
-    PREFIX euvoc: <http://publications.europa.eu/ontology/euvoc#>
-    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-    PREFIX epo: <http://data.europa.eu/a4g/ontology#>
-    PREFIX cdm: <http://publications.europa.eu/ontology/cdm#>
-    PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-
-    SELECT ?noticeTypeUri ?label
-    WHERE {
-      ?noticeTypeUri a skos:Concept ;
-          skos:topConceptOf <http://publications.europa.eu/resource/authority/notice-type> ;
-          skos:prefLabel ?label .
-      FILTER (lang(?label) = "en") .
-    }
-    """
-
-    notice_type_labels = do_query(notice_type_query)
-    notice_type_dict = dict(zip(notice_type_labels['noticeTypeUri'], notice_type_labels['label']))
-    return (notice_type_dict,)
-
-
-@app.cell
-def _(do_query):
-    # Fetch form type labels (cached)
-    form_type_query = """
-    PREFIX euvoc: <http://publications.europa.eu/ontology/euvoc#>
-    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-    PREFIX epo: <http://data.europa.eu/a4g/ontology#>
-    PREFIX cdm: <http://publications.europa.eu/ontology/cdm#>
-    PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-
-    SELECT ?formTypeUri ?label
-    WHERE {
-      ?formTypeUri a skos:Concept ;
-          skos:topConceptOf <http://publications.europa.eu/resource/authority/form-type> ;
-          skos:prefLabel ?label .
-      FILTER (lang(?label) = "en") .
-    }
-    """
-
-    form_type_labels = do_query(form_type_query)
-    form_type_dict = dict(zip(form_type_labels['formTypeUri'], form_type_labels['label']))
-    return (form_type_dict,)
+def _(ted_open_data):
+    # Notice type and form type labels, from the bundled vocabulary snapshot
+    labels = ted_open_data.labels.get_label_store()
+    return (labels,)
 
 
 @app.cell
@@ -195,57 +230,23 @@ def _(get_default_date, mo):
 
 
 @app.cell
-def _(fetch_ted_daily_notices, selected_date):
-    ted_daily = fetch_ted_daily_notices(selected_date.value.isoformat())
-    return (ted_daily,)
-
-
-@app.cell
-def _(fetch_ted_daily_notices, notices_raw, selected_date):
+async def _(fetch_ted_daily_notices, notices_raw, selected_date):
     notice_types = get_distinct_notice_types(notices_raw)
 
     ted_daily_same_set = (
-        {"totalNoticeCount": 0, "results": []}
+        {"totalNoticeCount": 0}
         if not notice_types
-        else fetch_ted_daily_notices(selected_date.value.isoformat(), notice_types)
+        else await fetch_ted_daily_notices(selected_date.value.isoformat(), notice_types)
     )
     return notice_types, ted_daily_same_set
 
 
-@app.function
-def build_ted_query(date,notice_types):
-    date_formatted = date.replace("-", "")
-    # Base condition
-    conditions = [f"publication-date = {date_formatted}"]
-
-    # Add notice type filter if provided
-    if notice_types:
-        type_conditions = [f"notice-type = {nt}" for nt in notice_types]
-        conditions.append("(" + " or ".join(type_conditions) + ")")
-
-    query_str = " and ".join(conditions)
-    return query_str
-
-
 @app.cell
-def _(requests):
-    def fetch_ted_daily_notices(date: str, notice_types: list[str] | None = None) -> dict:
-        api_url = "https://api.acceptance.ted.europa.eu/v3/notices/search"
-
-        query_str = build_ted_query(date,notice_types)
-
-        request_body = {
-            "query": query_str,
-            "scope": "ALL",
-            "fields": ["publication-date", "notice-type"],
-        }
-
-        response = requests.post(
-            api_url, headers={"Accept": "application/json"}, json=request_body
-        )
-        response.raise_for_status()
-
-        return response.json()
+def _(ted_open_data):
+    async def fetch_ted_daily_notices(date: str, notice_types: list[str] | None = None) -> dict:
+        # Only the total is shown, so ask the API for the count alone
+        query_str = ted_open_data.ted_api.build_ted_query(date, notice_types)
+        return {"totalNoticeCount": await ted_open_data.ted_api.get_ted_client().count_async(query_str)}
     return (fetch_ted_daily_notices,)
 
 
@@ -261,7 +262,30 @@ def _():
         else:
             return (today - timedelta(days=1)).date()  # Yesterday
 
-    return (get_default_date,)
+    return get_default_date, timedelta
+
+
+@app.function
+def enrich_notices(notices_raw, labels):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if not len(notices_raw):
+        return pa.table({c: pa.array([], type=pa.string()) for c in ['publicationNumber', 'noticeType', 'formType', 'tedUrl']})
+
+    # pyarrow-backed columns convert without a copy
+    table = pa.Table.from_pandas(notices_raw, preserve_index=False)
+
+    return pa.table({
+        'publicationNumber': table['publicationNumber'],
+        # Dictionary-encoded labels, looked up once per distinct URI
+        'noticeType': labels.dictionary(table['noticeTypeUri'], "notice-type"),
+        'formType': labels.dictionary(table['formTypeUri'], "form-type"),
+        # Create TED URL for each notice
+        'tedUrl': pc.binary_join_element_wise(
+            "https://ted.europa.eu/en/notice/-/detail/", table['publicationNumber'], ""
+        ),
+    })
 
 
 @app.function
@@ -269,23 +293,27 @@ def get_distinct_notice_types(notices_raw) -> list[str]:
     uris = getattr(notices_raw, "noticeTypeUri", None)
     if uris is None:
         return []
-    return sorted({uri.rsplit("/", 1)[-1] for uri in uris})
+    return sorted({uri.rsplit("/", 1)[-1] for uri in uris.dropna().unique()})
 
 
 @app.cell
-def _(notices):
+def _(notices, ted_open_data):
     import altair as alt
 
+    # The charts get one row per bar, not one per notice
+    notice_type_counts = ted_open_data.charts.count_by(notices, "noticeType")
+    form_type_counts = ted_open_data.charts.count_by(notices, "formType")
+
     # Chart 1 - Notice Type (Bar Chart)
     chart1 = (
-        alt.Chart(notices)
+        alt.Chart(notice_type_counts)
         .mark_bar()
         .encode(
-            x=alt.X("count():Q", title="Count"),
+            x=alt.X("count:Q", title="Count"),
             y=alt.Y("noticeType:N", title="Notice Type", sort="-x"),
             color=alt.Color("noticeType:N", title="Notice Type", legend=None),
             tooltip=[
-                alt.Tooltip("count()", title="Count"),
+                alt.Tooltip("count:Q", title="Count"),
                 alt.Tooltip("noticeType:N", title="Notice Type"),
             ],
         )
@@ -298,14 +326,14 @@ def _(notices):
 
     # Chart 2 - Form Type (Bar Chart)
     chart2 = (
-        alt.Chart(notices)
+        alt.Chart(form_type_counts)
         .mark_bar()
         .encode(
-            x=alt.X("count():Q", title="Count"),
+            x=alt.X("count:Q", title="Count"),
             y=alt.Y("formType:N", title="Form Type", sort="-x"),
             color=alt.Color("formType:N", title="Form Type", legend=None),
             tooltip=[
-                alt.Tooltip("count()", title="Count"),
+                alt.Tooltip("count:Q", title="Count"),
                 alt.Tooltip("formType:N", title="Form Type"),
             ],
         )
@@ -319,20 +347,23 @@ def _(notices):
 
 
 @app.cell
-def _(JSON, SPARQLWrapper, pd):
-    sparql_service_url = "https://publications.europa.eu/webapi/rdf/sparql"
-
-    def do_query(sparql_query):
-        sparql = SPARQLWrapper(sparql_service_url, agent="Sparql Wrapper")
+def _(ted_open_data):
+    do_query_async = ted_open_data.sparql.do_query_async
+    return (do_query_async,)
 
-        sparql.setQuery(sparql_query)
-        sparql.setReturnFormat(JSON)
 
-        # ask for the result
-        result = sparql.query().convert()
-        pd.DataFrame(result["results"]["bindings"])
-        return pd.DataFrame(result["results"]["bindings"]).map(lambda x: x["value"])
-    return (do_query,)
+@app.cell
+def _(mo, notices, ted_daily_same_set, ted_open_data):
+    # Timings of every Cellar and TED API query since the app started (not only
+    # those of the current selection), newest first
+    _profiler = ted_open_data.profiling.get_profiler()
+    mo.accordion({
+        "⏱️ Performance": mo.vstack([
+            mo.ui.table(_profiler.summary(), selection=None, label="Totals per source since the app started"),
+            mo.ui.table(_profiler.frame(), selection=None, label="Queries since the app started"),
+        ])
+    })
+    return
 
 
 if __name__ == "__main__":
@@ -3,9 +3,10 @@
 # dependencies = [
 #     "altair==5.4.1",
 #     "marimo",
-#     "sparqlwrapper==2.0.0",
-#     "vega-datasets==0.9.0",
+#     "pandas",
 #     "pyarrow",
+#     "requests==2.32.5",
+#     "vega-datasets==0.9.0",
 # ]
 # ///
 
@@ -40,8 +41,42 @@ def _():
     import marimo as mo
 
     from pandas import json_normalize
-    from SPARQLWrapper import SPARQLWrapper, JSON
-    return JSON, SPARQLWrapper, mo, pd
+    return mo, pd
+
+
+@app.cell
+async def _():
+    import sys
+
+    if sys.platform == "emscripten":
+        # In the WebAssembly export the shared package is shipped as a zip
+        # next to the notebook, see build.py
+        import micropip
+        from pyodide.http import pyfetch
+        from marimo import notebook_location
+
+        _response = await pyfetch(str(notebook_location() / "public" / "ted_open_data.zip"))
+        with open("/tmp/ted_open_data.zip", "wb") as _f:
+            _f.write(await _response.bytes())
+        sys.path.insert(0, "/tmp/ted_open_data.zip")
+
+        import ted_open_data
+        await micropip.install(ted_open_data.REQUIREMENTS)
+
+        # Results of the default view, baked into the site by build.py
+        import ted_open_data.snapshots
+        await ted_open_data.snapshots.fetch_snapshots(
+            str(notebook_location() / "public" / "snapshots" / "02-cellar-period")
+        )
+
+    import ted_open_data.cache
+    import ted_open_data.charts
+    import ted_open_data.daily_store
+    import ted_open_data.labels
+    import ted_open_data.profiling
+    import ted_open_data.shard
+    import ted_open_data.sparql
+    return (ted_open_data,)
 
 
 @app.cell
@@ -151,64 +186,94 @@ def _(mo):
         label="End Date",
     )
 
-    return period_end, period_start
+    return period_end, period_start, timedelta
 
 
 @app.cell
-def _(period_end, period_start):
-    start_iso, end_iso = (
-        period_start.value.isoformat(),
-        period_end.value.isoformat(),
+def _(period_end, period_start, timedelta):
+    # The queries filter on the half-open range [period_from, period_until)
+    period_from, period_until = (
+        period_start.value,
+        period_end.value + timedelta(days=1),
     )
-    return end_iso, start_iso
+    return period_from, period_until
 
 
 @app.cell
-def _(end_iso, start_iso):
-    notice_raw_count_query = """
-    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-    PREFIX epo: <http://data.europa.eu/a4g/ontology#>
-    PREFIX cdm: <http://publications.europa.eu/ontology/cdm#>
-    PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-
-    SELECT ?publicationDate ?noticeTypeUri (COUNT(?notice) AS ?documentCount)
-    WHERE {
-      GRAPH ?g {
-        ?notice a epo:Notice ;
-                epo:hasPublicationDate ?publicationDate ;
-                epo:hasNoticePublicationNumber ?publicationNumber ;
-                epo:hasNoticeType ?noticeTypeUri .
-        FILTER (?publicationDate >= "%s"^^xsd:dateTime &&
-                ?publicationDate <= "%s"^^xsd:dateTime)
-      }
-    }
-    GROUP BY ?publicationDate ?noticeTypeUri
-    """ % (start_iso, end_iso)
-    return (notice_raw_count_query,)
+def _(period_from, period_until):
+    def build_notice_raw_count_query(start, end):
+        return """
+        PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+        PREFIX epo: <http://data.europa.eu/a4g/ontology#>
+        PREFIX cdm: <http://publications.europa.eu/ontology/cdm#>
+        PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
+
+        SELECT ?publicationDate ?noticeTypeUri (COUNT(?notice) AS ?documentCount)
+        WHERE {
+          GRAPH ?g {
+            ?notice a epo:Notice ;
+                    epo:hasPublicationDate ?publicationDate ;
+                    epo:hasNoticePublicationNumber ?publicationNumber ;
+                    epo:hasNoticeType ?noticeTypeUri .
+            FILTER (?publicationDate >= "%s"^^xsd:dateTime &&
+                    ?publicationDate < "%s"^^xsd:dateTime)
+          }
+        }
+        GROUP BY ?publicationDate ?noticeTypeUri
+        """ % (start.isoformat(), end.isoformat())
+
+    notice_raw_count_query = build_notice_raw_count_query(period_from, period_until)
+    return build_notice_raw_count_query, notice_raw_count_query
 
 
 @app.cell
-def _(do_query, notice_raw_count_query, notice_type_mapping, pd):
-    notice_raw_count = do_query(notice_raw_count_query)
-    notice_raw_count = notice_raw_count.assign(
-        publicationDate=pd.to_datetime(notice_raw_count["publicationDate"], errors="coerce"),
-        documentCount=pd.to_numeric(
-            notice_raw_count["documentCount"], errors="coerce"
+def _(
+    build_notice_raw_count_query,
+    load_daily,
+    notice_type_mapping,
+    ted_open_data,
+):
+    # Missing days are queried month by month in parallel so that long periods
+    # stay within the endpoint timeouts
+    notice_raw_count = load_daily(
+        "notice_counts",
+        "publicationDate",
+        lambda start, end: ted_open_data.shard.sharded_query(
+            build_notice_raw_count_query,
+            start,
+            end,
+            keys=["publicationDate", "noticeTypeUri"],
+            aggregations={"documentCount": "sum"},
+            stream=True,
+            dtypes={"publicationDate": "date", "documentCount": "integer"},
         ),
-        noticeTypeLabel=notice_raw_count["noticeTypeUri"].map(notice_type_mapping)
     )
+    notice_raw_count = label_notice_types(notice_raw_count, notice_type_mapping)
     return (notice_raw_count,)
 
 
+@app.function
+def label_notice_types(notice_raw_count, notice_type_mapping):
+    return notice_raw_count.assign(
+        noticeTypeLabel=notice_raw_count["noticeTypeUri"].map(notice_type_mapping)
+    )
+
+
 @app.cell
-def _(alt, notice_raw_count):
+def _(alt, notice_raw_count, ted_open_data):
+    # The charts get daily (or weekly, monthly for long periods) totals per notice
+    # type, so the spec does not grow with the period
+    notice_cube = ted_open_data.charts.binned_cube(
+        notice_raw_count, "publicationDate", "noticeTypeLabel", "documentCount"
+    )
+    notice_totals = ted_open_data.charts.totals(notice_cube, "publicationDate", "documentCount")
 
     # selection: brush on x axis
     brush = alt.selection_interval(encodings=["x"])
 
     # first chart: publication date histogram
     scatter = (
-        alt.Chart(notice_raw_count)
+        alt.Chart(notice_totals)
         .mark_bar()
         .encode(
             x=alt.X("publicationDate:T", title="Publication Date"),
@@ -219,7 +284,7 @@ def _(alt, notice_raw_count):
 
     # second chart: notice type distribution filtered by brush
     bars = (
-        alt.Chart(notice_raw_count)
+        alt.Chart(notice_cube)
         .mark_bar()
         .encode(
             x=alt.X("sum(documentCount):Q", title="Documents"),
@@ -236,20 +301,28 @@ def _(alt, notice_raw_count):
 
 
 @app.cell
-def _(do_query, pd, pipeline_activity_query):
-    pipeline_activity = do_query(pipeline_activity_query)
-    pipeline_activity = pipeline_activity.assign(
-        dateUpdated=pd.to_datetime(
-            pipeline_activity["dateUpdated"], errors="coerce"
-        ),
-        minPublicationDate=pd.to_datetime(
-            pipeline_activity["minPublicationDate"], errors="coerce"
-        ),
-        maxPublicationDate=pd.to_datetime(
-            pipeline_activity["maxPublicationDate"], errors="coerce"
-        ),
-        documentCount=pd.to_numeric(
-            pipeline_activity["documentCount"], errors="coerce"
+def _(build_pipeline_activity_query, load_daily, ted_open_data):
+    # Upload days never span two shards, the merge only has to re-sort them
+    pipeline_activity = load_daily(
+        "upload_activity",
+        "dateUpdated",
+        lambda start, end: ted_open_data.shard.sharded_query(
+            build_pipeline_activity_query,
+            start,
+            end,
+            keys=["dateUpdated"],
+            aggregations={
+                "minPublicationDate": "min",
+                "maxPublicationDate": "max",
+                "documentCount": "sum",
+            },
+            stream=True,
+            dtypes={
+                "dateUpdated": "date",
+                "minPublicationDate": "date",
+                "maxPublicationDate": "date",
+                "documentCount": "integer",
+            },
         ),
     )
     return (pipeline_activity,)
@@ -292,86 +365,71 @@ def _(alt, pipeline_activity):
 
 
 @app.cell
-def _(end_iso, start_iso):
-    pipeline_activity_query = """
-    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-    PREFIX epo: <http://data.europa.eu/a4g/ontology#>
-    PREFIX cdm: <http://publications.europa.eu/ontology/cdm#>
-
-    SELECT ?dateUpdated
-           (MIN(?date) AS ?minPublicationDate)
-           (MAX(?date) AS ?maxPublicationDate)
-           (COUNT(?s) AS ?documentCount)
-    WHERE {
-      GRAPH ?metsNamedGraph {
-        ?s a cdm:procurement_public .
-        ?s cdm:procurement_public_number_document_in_official-journal ?journalNumber .
-        ?s cdm:work_date_document ?date .
-        ?s <http://publications.europa.eu/ontology/cdm/cmr#lastModificationDate> ?cellarLastUpdated .
-
-        BIND(STRDT(SUBSTR(STR(?cellarLastUpdated), 1, 10), xsd:date) AS ?dateUpdated)
-      }
-      FILTER (?cellarLastUpdated >= "%s"^^xsd:dateTime &&
-              ?cellarLastUpdated <= "%s"^^xsd:dateTime)
-    }
-    GROUP BY ?dateUpdated
-    ORDER BY ?dateUpdated
-
-    """ % (start_iso, end_iso)
-    return (pipeline_activity_query,)
-
-
-@app.cell
-def _():
-    notice_type_labels_query = """
-    PREFIX euvoc: <http://publications.europa.eu/ontology/euvoc#>
-    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-    PREFIX epo: <http://data.europa.eu/a4g/ontology#>
-    PREFIX cdm: <http://publications.europa.eu/ontology/cdm#>
-    PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-
-    SELECT ?noticeTypeUri ?label
-    WHERE {
-      ?noticeTypeUri a skos:Concept ;
-          skos:topConceptOf <http://publications.europa.eu/resource/authority/notice-type> ;
-          skos:prefLabel ?label .
-      FILTER (lang(?label) = "en") .
-    }
-    """
-    return (notice_type_labels_query,)
+def _(period_from, period_until):
+    def build_pipeline_activity_query(start, end):
+        return """
+        PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+        PREFIX epo: <http://data.europa.eu/a4g/ontology#>
+        PREFIX cdm: <http://publications.europa.eu/ontology/cdm#>
+
+        SELECT ?dateUpdated
+               (MIN(?date) AS ?minPublicationDate)
+               (MAX(?date) AS ?maxPublicationDate)
+               (COUNT(?s) AS ?documentCount)
+        WHERE {
+          GRAPH ?metsNamedGraph {
+            ?s a cdm:procurement_public .
+            ?s cdm:procurement_public_number_document_in_official-journal ?journalNumber .
+            ?s cdm:work_date_document ?date .
+            ?s <http://publications.europa.eu/ontology/cdm/cmr#lastModificationDate> ?cellarLastUpdated .
+
+            BIND(STRDT(SUBSTR(STR(?cellarLastUpdated), 1, 10), xsd:date) AS ?dateUpdated)
+          }
+          FILTER (?cellarLastUpdated >= "%s"^^xsd:dateTime &&
+                  ?cellarLastUpdated < "%s"^^xsd:dateTime)
+        }
+        GROUP BY ?dateUpdated
+        ORDER BY ?dateUpdated
+
+        """ % (start.isoformat(), end.isoformat())
+
+    pipeline_activity_query = build_pipeline_activity_query(period_from, period_until)
+    return build_pipeline_activity_query, pipeline_activity_query
 
 
 @app.cell
-def _(do_query, notice_type_labels_query):
-    # Fetch notice type labels (this runs once since labels never change)
-    notice_type_labels_df = do_query(notice_type_labels_query)
-
-    # Create mapping from URI to human-readable label
-    notice_type_mapping = dict(zip(
-        notice_type_labels_df["noticeTypeUri"],
-        notice_type_labels_df["label"]
-    ))
+def _(ted_open_data):
+    # Mapping from notice type URI to human-readable label, from the bundled vocabulary snapshot
+    notice_type_mapping = ted_open_data.labels.get_label_store().labels("notice-type")
     return (notice_type_mapping,)
 
 
 @app.cell
-def _(JSON, SPARQLWrapper, mo, pd):
-    sparql_service_url = "https://publications.europa.eu/webapi/rdf/sparql"
+def _(mo, pd, period_from, period_until, ted_open_data):
+    daily_store = ted_open_data.daily_store.get_daily_store()
 
-
-    def do_query(sparql_query):
+    def load_daily(table, day_column, fetch):
+        # Past days are answered from the local store, only missing or stale days are fetched
         try:
-            sparql = SPARQLWrapper(sparql_service_url, agent="Sparql Wrapper")
-            sparql.setQuery(sparql_query)
-            sparql.setReturnFormat(JSON)
-
-            # ask for the result
-            result = sparql.query().convert()
-            return pd.DataFrame(result["results"]["bindings"]).map(lambda x: x["value"])
+            return daily_store.get(table, day_column, period_from, period_until, fetch)
         except Exception as e:
-            mo.md(f"⚠️ **Query Error**: {str(e)}")
+            mo.output.append(mo.md(f"⚠️ **Query Error**: {str(e)}"))
             return pd.DataFrame()  # Return empty DataFrame on error
-    return (do_query,)
+    return (load_daily,)
+
+
+@app.cell
+def _(mo, notice_raw_count, pipeline_activity, ted_open_data):
+    # Timings of every Cellar and TED API query since the app started (not only
+    # those of the current selection), newest first
+    _profiler = ted_open_data.profiling.get_profiler()
+    mo.accordion({
+        "⏱️ Performance": mo.vstack([
+            mo.ui.table(_profiler.summary(), selection=None, label="Totals per source since the app started"),
+            mo.ui.table(_profiler.frame(), selection=None, label="Queries since the app started"),
+        ])
+    })
+    return
 
 
 if __name__ == "__main__":
@@ -3,8 +3,9 @@
 # dependencies = [
 #     "altair==5.4.1",
 #     "marimo",
+#     "pandas",
+#     "pyarrow",
 #     "requests==2.32.5",
-#     "sparqlwrapper==2.0.0",
 #     "vega-datasets==0.9.0",
 # ]
 # ///
@@ -20,33 +21,81 @@ def _():
     import altair as alt
     import pandas as pd
     import marimo as mo
-    import requests
-    from vega_datasets import data
 
     from pandas import json_normalize
-    from SPARQLWrapper import SPARQLWrapper, JSON
-    return JSON, SPARQLWrapper, alt, data, mo, pd
+    return alt, mo, pd
 
 
 @app.cell
-def _(mo, selected_date):
+async def _():
+    import sys
+
+    if sys.platform == "emscripten":
+        # In the WebAssembly export the shared package is shipped as a zip
+        # next to the notebook, see build.py
+        import micropip
+        from pyodide.http import pyfetch
+        from marimo import notebook_location
+
+        _response = await pyfetch(str(notebook_location() / "public" / "ted_open_data.zip"))
+        with open("/tmp/ted_open_data.zip", "wb") as _f:
+            _f.write(await _response.bytes())
+        sys.path.insert(0, "/tmp/ted_open_data.zip")
+
+        import ted_open_data
+        await micropip.install(ted_open_data.REQUIREMENTS)
+
+        # Results of the default view, baked into the site by build.py
+        import ted_open_data.snapshots
+        await ted_open_data.snapshots.fetch_snapshots(
+            str(notebook_location() / "public" / "snapshots" / "03-competition-notices-daily")
+        )
+
+    import ted_open_data.cache
+    import ted_open_data.charts
+    import ted_open_data.competition
+    import ted_open_data.daily_store
+    import ted_open_data.geo
+    import ted_open_data.labels
+    import ted_open_data.profiling
+    import ted_open_data.shard
+    import ted_open_data.sparql
+    return (ted_open_data,)
+
+
+@app.cell
+def _(mo, mode, period_end, period_start, selected_date):
     mo.md(
         rf"""
     # Competition Notices in Cellar by Date
 
-    Choose a date to analyze. The dashboard will update automatically based on your selection.
+    Choose a date, or a period to see the trends over weeks or months. The dashboard will update automatically based on your selection.
+
+    The data shown represents the competition notices available in Cellar for the chosen date or period.
 
-    The data shown represents the competition notices available in Cellar for the chosen date.
+    {mode}
 
-    Selected date: {selected_date}
+    {f"Selected date: {selected_date}" if mode.value == "Day" else f"From {period_start} to {period_end}"}
     """
     )
     return
 
 
 @app.cell
-def _(notices):
-    notices
+def _(mode, notices):
+    notices if mode.value == "Day" else None
+    return
+
+
+@app.cell
+def _(trend):
+    trend
+    return
+
+
+@app.cell
+def _(buyers, mo):
+    mo.vstack([mo.md("## Top Buyers"), buyers]) if len(buyers) else None
     return
 
 
@@ -57,93 +106,177 @@ def _(map):
 
 
 @app.cell
-def _(do_query, notices_per_day_query):
-    notices = do_query(notices_per_day_query)
+def _(procedure_breakdown):
+    procedure_breakdown
+    return
+
+
+@app.cell
+def _(do_query, mode, notices_per_day_query, pd, selected_date, ted_open_data):
+    # Procedure types and countries are resolved locally, see competition.py
+    notices = ted_open_data.competition.resolve(
+        do_query(
+            notices_per_day_query,
+            stream=True,
+            ttl=ted_open_data.cache.ttl_for_dates(selected_date.value),
+        ) if mode.value == "Day" else pd.DataFrame(),
+        ted_open_data.labels.get_label_store(),
+    )
     return (notices,)
 
 
 @app.cell
-def _(create_country_map, notices):
-    map = None
+def _(load_daily, mode, pd, ted_open_data):
+    # Periods are counted per day by Cellar, month by month in parallel, and the
+    # days already counted are answered from the local store
+    def load_period(table, build_query, keys):
+        if mode.value != "Period":
+            return pd.DataFrame()
+        return ted_open_data.competition.resolve_uris(
+            load_daily(
+                table,
+                "publicationDate",
+                lambda start, end: ted_open_data.shard.sharded_query(
+                    build_query,
+                    start,
+                    end,
+                    keys=keys,
+                    aggregations=ted_open_data.competition.AGGREGATIONS,
+                    stream=True,
+                    dtypes=ted_open_data.competition.DTYPES,
+                ),
+            ),
+            ted_open_data.labels.get_label_store(),
+        )
 
-    if len(notices):
-        df = process_your_data(notices)
-        map = create_country_map(df)
-    return (map,)
+    period_counts = load_period(
+        "competition_counts",
+        ted_open_data.competition.build_counts_query,
+        ted_open_data.competition.COUNTS_KEYS,
+    )
+    period_buyers = load_period(
+        "competition_buyers",
+        ted_open_data.competition.build_buyers_query,
+        ted_open_data.competition.BUYERS_KEYS,
+    )
+    return period_buyers, period_counts
 
 
 @app.cell
-def _(alt, data):
-    def create_country_map(df, country_col='country', count_col='count'):
-        # If count column doesn't exist, create it by counting occurrences
-        if count_col not in df.columns:
-            country_counts = df[country_col].value_counts().reset_index()
-            country_counts.columns = [country_col, count_col]
-        else:
-            country_counts = df.groupby(country_col)[count_col].sum().reset_index()
-
-        # Load world map data from vega_datasets
-        countries = alt.topo_feature(data.world_110m.url, 'countries')
-
-        # Your data already has numeric ISO codes, so just use them directly
-        # Convert country codes to integers (they're already the right format)
-        country_counts['id'] = country_counts[country_col].astype(int)
-
-        # Add readable country names
-        country_names = {
-            40: 'Austria', 56: 'Belgium', 100: 'Bulgaria', 191: 'Croatia',
-            196: 'Cyprus', 203: 'Czech Republic', 208: 'Denmark', 233: 'Estonia',
-            246: 'Finland', 250: 'France', 276: 'Germany', 300: 'Greece',
-            348: 'Hungary', 352: 'Iceland', 372: 'Ireland', 380: 'Italy',
-            428: 'Latvia', 440: 'Lithuania', 442: 'Luxembourg', 470: 'Malta',
-            528: 'Netherlands', 578: 'Norway', 616: 'Poland', 620: 'Portugal',
-            642: 'Romania', 703: 'Slovakia', 705: 'Slovenia', 724: 'Spain',
-            752: 'Sweden', 756: 'Switzerland', 826: 'United Kingdom'
-        }
-        country_counts['country_name'] = country_counts['id'].map(country_names)
-
-        # Create the base map (gray background)
-        base = alt.Chart(countries).mark_geoshape(
-            fill='lightgray',
-            stroke='white',
-            strokeWidth=0.5
+def _(mode, notices, period_buyers, period_counts, ted_open_data):
+    # One pass over the notices (or the daily counts of the period), the map and
+    # the breakdowns sum it
+    if mode.value == "Day":
+        country_counts = ted_open_data.competition.country_procedure_counts(notices)
+        buyers = ted_open_data.competition.top_buyers(notices)
+    else:
+        country_counts = ted_open_data.competition.country_procedure_counts(
+            period_counts, by=["publicationDate"], value_column="noticeCount"
+        )
+        buyers = ted_open_data.competition.top_buyers(period_buyers, value_column="noticeCount")
+    return buyers, country_counts
+
+
+@app.cell
+def _(alt, mode, period_counts, ted_open_data):
+    trend = None
+
+    if mode.value == "Period" and len(period_counts):
+        # Daily (or weekly, monthly for long periods) counts per procedure type, of
+        # every notice, including those of buyers outside the countries of the map
+        _counts = period_counts.assign(
+            procedureType=period_counts["procedureType"].fillna(ted_open_data.competition.UNKNOWN)
+        ).rename(columns={"noticeCount": "count"})
+        _cube = ted_open_data.charts.binned_cube(_counts, "publicationDate", "procedureType", "count")
+        trend = alt.Chart(_cube).mark_bar().encode(
+            x=alt.X('publicationDate:T', title='Publication Date'),
+            y=alt.Y('count:Q', title='Publications'),
+            color=alt.Color('procedureType:N', title='Procedure Type'),
+            tooltip=[
+                alt.Tooltip('publicationDate:T', title='From'),
+                alt.Tooltip('procedureType:N', title='Procedure Type'),
+                alt.Tooltip('count:Q', title='Publications')
+            ]
         ).properties(
-            width=800,
-            height=500
-        ).project(
-            type='mercator',
-            scale=600,
-            center=[10, 54]
+            width=800
         )
+    return (trend,)
 
-        # Create the choropleth layer (colored countries)
-        choropleth = alt.Chart(countries).mark_geoshape(        ).transform_lookup(
-            lookup='id',
-            from_=alt.LookupData(country_counts, 'id', [count_col, 'country_name'])
-        ).encode(
-            color=alt.Color(
-                f'{count_col}:Q',
-                scale=alt.Scale(scheme='blues'),
-                legend=alt.Legend(title='Publication Count')
-            ),
+
+@app.cell
+def _(country_counts, ted_open_data):
+    map = None
+
+    if len(country_counts):
+        map = create_country_map(
+            ted_open_data.competition.country_totals(country_counts),
+            ted_open_data.geo.topology_url(),
+        )
+    return (map,)
+
+
+@app.cell
+def _(alt, country_counts, ted_open_data):
+    procedure_breakdown = None
+
+    if len(country_counts):
+        procedure_breakdown = alt.Chart(
+            ted_open_data.competition.country_totals(country_counts, by=["procedureType"])
+        ).mark_bar().encode(
+            x=alt.X('sum(count):Q', title='Publications'),
+            y=alt.Y('name:N', sort='-x', title='Country'),
+            color=alt.Color('procedureType:N', title='Procedure Type'),
             tooltip=[
-                alt.Tooltip('country_name:N', title='Country'),
-                alt.Tooltip(f'{count_col}:Q', title='Publications')
+                alt.Tooltip('name:N', title='Country'),
+                alt.Tooltip('procedureType:N', title='Procedure Type'),
+                alt.Tooltip('count:Q', title='Publications')
             ]
         ).properties(
-            width=800,
-            height=500
-        ).project(
-            type='mercator',
-            scale=600,
-            center=[10, 54]
+            width=800
         )
+    return (procedure_breakdown,)
+
+
+@app.function
+def create_country_map(country_counts, topology_url):
+    import altair as alt
 
-        # Combine base map and choropleth
-        chart = base + choropleth
+    # Europe only, prepared by the build (see ted_open_data/geo.py)
+    countries = alt.topo_feature(topology_url, 'countries')
+
+    # One layer: countries without publications get a count of 0 and stay gray
+    chart = alt.Chart(countries).mark_geoshape(
+        stroke='white',
+        strokeWidth=0.5
+    ).transform_lookup(
+        lookup='id',
+        from_=alt.LookupData(country_counts[['id', 'count', 'name']], 'id', ['count', 'name'])
+    ).transform_calculate(
+        count='isValid(datum.count) ? datum.count : 0'
+    ).encode(
+        color=alt.condition(
+            'datum.count > 0',
+            alt.Color(
+                'count:Q',
+                scale=alt.Scale(scheme='blues'),
+                legend=alt.Legend(title='Publication Count')
+            ),
+            alt.value('lightgray')
+        ),
+        tooltip=[
+            alt.Tooltip('name:N', title='Country'),
+            alt.Tooltip('count:Q', title='Publications')
+        ]
+    ).properties(
+        width=800,
+        height=500
+    ).project(
+        type='mercator',
+        scale=600,
+        center=[10, 54]
+    )
 
-        return chart
-    return (create_country_map,)
+    return chart
 
 
 @app.cell
@@ -157,42 +290,11 @@ def _():
             return (today - timedelta(days=2)).date()  # Friday
         else:
             return (today - timedelta(days=1)).date()  # Yesterday
-    return (get_default_date,)
-
-
-@app.function
-def process_your_data(df):
-    # Get country mapping
-    country_mapping = get_country_mapping()
-
-    # Filter for mapped countries only
-    mapped_df = df[df['country'].isin(country_mapping.keys())].copy()
-
-    # Check if any countries were mapped
-    if len(mapped_df) == 0:
-        available_countries = df['country'].unique().tolist()
-        mapped_countries = list(country_mapping.keys())
-        raise ValueError(f"No countries found in mapping! "
-                        f"Available countries in data: {available_countries}. "
-                        f"Countries in mapping: {mapped_countries}")
-
-    # Count publications per country
-    country_counts = mapped_df['country'].value_counts().reset_index()
-    country_counts.columns = ['country_code', 'count']
-
-    # Map to numeric country IDs
-    country_counts['country'] = country_counts['country_code'].map(country_mapping)
-    country_counts = country_counts.dropna(subset=['country'])
-
-    # Final check - if mapping failed completely
-    if len(country_counts) == 0:
-        raise ValueError("All country mappings failed! No valid country codes found.")
-
-    return country_counts[['country', 'count']]
+    return get_default_date, timedelta
 
 
 @app.cell
-def _(mo, notices_per_day_query):
+def _(mo, mode, notices_per_day_query, period_counts_query):
     mo.md(
         rf"""
     ## Queries
@@ -200,7 +302,7 @@ def _(mo, notices_per_day_query):
     The following query was used
 
     ```sparql
-    {notices_per_day_query}
+    {notices_per_day_query if mode.value == "Day" else period_counts_query}
     ```
     """
     )
@@ -208,118 +310,74 @@ def _(mo, notices_per_day_query):
 
 
 @app.cell
-def _(selected_date):
-    notices_per_day_query = """
-    PREFIX cccev: <http://data.europa.eu/m8g/>
-    PREFIX dc: <http://purl.org/dc/elements/1.1/>
-    PREFIX epo: <http://data.europa.eu/a4g/ontology#>
-    PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-
-    SELECT DISTINCT ?publicationNumber ?legalName ?procedureType ?country
-
-    WHERE {
-
-    	FILTER (?publicationDate = "%s"^^xsd:date)
-    	FILTER (?formType = <http://publications.europa.eu/resource/authority/form-type/competition>)
-
-      GRAPH ?g {
-        ?notice
-            epo:hasPublicationDate ?publicationDate ;
-            epo:refersToProcedure [
-                epo:hasProcedureType ?procedureTypeUri ;
-                a epo:Procedure
-            ] ;
-            epo:hasNoticePublicationNumber ?publicationNumber ;
-            epo:hasFormType ?formType ;
-            epo:announcesRole [
-                a epo:Buyer ;
-                epo:playedBy [
-                    epo:hasLegalName ?legalName ;
-                    cccev:registeredAddress [
-                        epo:hasCountryCode ?countryUri
-                    ]
-                ]
-            ]
-        }
-
-        ?procedureTypeUri a skos:Concept ;
-            skos:prefLabel ?procedureType.
-        FILTER (lang(?procedureType) = "en")
+def _(selected_date, ted_open_data):
+    notices_per_day_query = ted_open_data.competition.build_competition_query(selected_date.value)
+    return (notices_per_day_query,)
 
-        ?countryUri dc:identifier ?country .
-    }
 
-    """ % (selected_date.value.isoformat())
-    return (notices_per_day_query,)
+@app.cell
+def _(period_from, period_until, ted_open_data):
+    period_counts_query = ted_open_data.competition.build_counts_query(period_from, period_until)
+    return (period_counts_query,)
 
 
 @app.cell
-def _(JSON, SPARQLWrapper, pd):
-    sparql_service_url = "https://publications.europa.eu/webapi/rdf/sparql"
-    def do_query(sparql_query):
-        sparql = SPARQLWrapper(sparql_service_url, agent="Sparql Wrapper")
-
-        sparql.setQuery(sparql_query)
-        sparql.setReturnFormat(JSON)
-
-        # ask for the result
-        result = sparql.query().convert()
-        pd.DataFrame(result["results"]["bindings"])
-        return pd.DataFrame(result["results"]["bindings"]).map(lambda x: x["value"])
+def _(ted_open_data):
+    do_query = ted_open_data.sparql.do_query
     return (do_query,)
 
 
 @app.cell
-def _(get_default_date, mo):
+def _(get_default_date, mo, timedelta):
+    mode = mo.ui.radio(options=["Day", "Period"], value="Day", inline=True)
     selected_date = mo.ui.date(value=get_default_date().isoformat())
-    return (selected_date,)
+    period_start = mo.ui.date(
+        value=get_default_date() - timedelta(days=90),
+        label="Start Date",
+    )
+    period_end = mo.ui.date(
+        value=get_default_date(),
+        label="End Date",
+    )
+    return mode, period_end, period_start, selected_date
 
 
-@app.function
-def get_country_mapping():
-    """
-    Mapping of 3-digit country codes to ISO numeric codes
-    """
-    return {
-        'AUT': '040',  # Austria
-        'BEL': '056',  # Belgium
-        'BGR': '100',  # Bulgaria
-        'HRV': '191',  # Croatia
-        'CYP': '196',  # Cyprus
-        'CZE': '203',  # Czech Republic
-        'DNK': '208',  # Denmark
-        'EST': '233',  # Estonia
-        'FIN': '246',  # Finland
-        'FRA': '250',  # France
-        'DEU': '276',  # Germany
-        'GRC': '300',  # Greece
-        'HUN': '348',  # Hungary
-        'IRL': '372',  # Ireland
-        'ITA': '380',  # Italy
-        'LVA': '428',  # Latvia
-        'LTU': '440',  # Lithuania
-        'LUX': '442',  # Luxembourg
-        'MLT': '470',  # Malta
-        'NLD': '528',  # Netherlands
-        'POL': '616',  # Poland
-        'PRT': '620',  # Portugal
-        'ROU': '642',  # Romania
-        'SVK': '703',  # Slovakia
-        'SVN': '705',  # Slovenia
-        'ESP': '724',  # Spain
-        'SWE': '752',  # Sweden
-        'GBR': '826',  # United Kingdom
-        'NOR': '578',  # Norway
-        'CHE': '756',  # Switzerland
-        'ISL': '352',  # Iceland
-        'LIE': '438',  # Liechtenstein
-        'MKD': '807',  # North Macedonia
-        'MNE': '499',  # Montenegro
-        'SRB': '688',  # Serbia
-        'ALB': '008',  # Albania
-        'BIH': '070',  # Bosnia and Herzegovina
-    }
+@app.cell
+def _(period_end, period_start, timedelta):
+    # The period queries filter on the half-open range [period_from, period_until)
+    period_from, period_until = (
+        period_start.value,
+        period_end.value + timedelta(days=1),
+    )
+    return period_from, period_until
+
+
+@app.cell
+def _(mo, pd, period_from, period_until, ted_open_data):
+    daily_store = ted_open_data.daily_store.get_daily_store()
+
+    def load_daily(table, day_column, fetch):
+        # Past days are answered from the local store, only missing or stale days are fetched
+        try:
+            return daily_store.get(table, day_column, period_from, period_until, fetch)
+        except Exception as e:
+            mo.output.append(mo.md(f"⚠️ **Query Error**: {str(e)}"))
+            return pd.DataFrame()  # Return empty DataFrame on error
+    return (load_daily,)
+
+
+@app.cell
+def _(buyers, country_counts, mo, ted_open_data):
+    # Timings of every Cellar and TED API query since the app started (not only
+    # those of the current selection), newest first
+    _profiler = ted_open_data.profiling.get_profiler()
+    mo.accordion({
+        "⏱️ Performance": mo.vstack([
+            mo.ui.table(_profiler.summary(), selection=None, label="Totals per source since the app started"),
+            mo.ui.table(_profiler.frame(), selection=None, label="Queries since the app started"),
+        ])
+    })
+    return
 
 
 if __name__ == "__main__":
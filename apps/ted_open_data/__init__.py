@@ -0,0 +1,13 @@
+"""
+Shared helpers for the TED Open Data notebooks.
+
+The marimo apps in this folder import this package instead of carrying their
+own copy of the query code. When the apps are exported to WebAssembly, the
+build script zips the package next to the exported HTML so the notebooks can
+put it on ``sys.path`` inside the browser (see ``build.py``).
+"""
+
+# Packages the modules of ted_open_data import. marimo only installs the
+# imports it sees in the notebook itself, so the WebAssembly notebooks install
+# these explicitly before importing the package.
+REQUIREMENTS = ["pandas", "pyarrow", "requests"]
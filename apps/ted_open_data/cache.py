@@ -0,0 +1,191 @@
+"""
+Content-addressed on-disk cache for SPARQL query results.
+
+Results are stored as Parquet files named after a hash of the endpoint and the
+normalised query text. Every entry has its own time-to-live (None keeps it
+forever, e.g. for closed past dates) and the least recently used entries are
+evicted once the cache grows beyond its size budget. There is no shared index
+file, so processes sharing the directory cannot lose each other's entries.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Optional, Union
+
+import pandas as pd
+
+DEFAULT_CACHE_DIR = Path(
+    os.environ.get("TED_OPEN_DATA_CACHE_DIR", Path.home() / ".cache" / "ted-open-data-notebooks")
+)
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# TTL used for results that may still change (today and the last few days)
+RECENT_TTL = 10 * 60
+
+
+def normalise_query(sparql_query: str) -> str:
+    """Collapse whitespace so that re-indented copies of a query share a cache entry."""
+    return " ".join(sparql_query.split())
+
+
+def cache_key(sparql_query: str, endpoint: str) -> str:
+    """Return the content address of a query sent to an endpoint."""
+    text = endpoint + "\n" + normalise_query(sparql_query)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def ttl_for_dates(*dates: date, open_days: int = 2, recent_ttl: float = RECENT_TTL) -> Optional[float]:
+    """Pick a TTL for a query filtered on the given dates.
+
+    Cellar keeps loading notices for a few days after their publication date, so
+    only results for dates older than open_days are considered closed.
+
+    Args:
+        *dates (date): The dates the query is filtered on (e.g. the end of a period)
+        open_days (int, optional): Number of days before today that may still change
+        recent_ttl (float, optional): TTL in seconds for results that may still change
+
+    Returns:
+        float | None: recent_ttl if any date is recent, None (forever) otherwise
+    """
+    if any(d >= date.today() - timedelta(days=open_days) for d in dates):
+        return recent_ttl
+    return None
+
+
+def write_atomically(path: Path, write: Callable[[Path], object]) -> None:
+    """Write a file through a temporary file renamed over it, so readers never see it half written.
+
+    Args:
+        path (Path): The file to write
+        write (Callable): Writes the content to the temporary path it is given
+    """
+    # Unique per process and thread, so concurrent writers never share a temporary file
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+class ResultCache:
+    """Persistent cache of query results with per-entry TTL and LRU eviction.
+
+    The directory is the index: every entry is a Parquet file and a small
+    <key>.meta.json sidecar with its expiry time, both written atomically, so
+    several processes (marimo kernels, the parallel exports of the build) can
+    share a cache without overwriting each other's entries. Reads do not write to
+    disk; the recency used for eviction is the time an entry was written, or the
+    last time this process read it.
+
+    Args:
+        directory (str | Path, optional): Where the Parquet files are kept
+        max_bytes (int, optional): Size budget; least recently used entries are evicted
+                                   when the total size of the cached files exceeds it
+    """
+
+    # Temporary files older than this were left by a process that died while writing
+    STALE_TMP_AGE = 3600
+
+    def __init__(self, directory: Union[str, Path] = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._accessed: Dict[str, float] = {}
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.parquet"
+
+    def _meta_path(self, key: str) -> Path:
+        return self.directory / f"{key}.meta.json"
+
+    def _drop(self, key: str) -> None:
+        self._accessed.pop(key, None)
+        self._path(key).unlink(missing_ok=True)
+        self._meta_path(key).unlink(missing_ok=True)
+
+    def get(self, key: str, dtype_backend: Optional[str] = None) -> Optional[pd.DataFrame]:
+        """Return the cached frame for a key, or None if it is missing, expired or unreadable."""
+        with self._lock:
+            try:
+                meta = json.loads(self._meta_path(key).read_text())
+            except (OSError, ValueError):
+                return None
+            if meta["expires"] is not None and meta["expires"] <= time.time():
+                self._drop(key)
+                return None
+            try:
+                kwargs = {"dtype_backend": dtype_backend} if dtype_backend else {}
+                frame = pd.read_parquet(self._path(key), **kwargs)
+            except (OSError, ValueError):
+                # A missing, truncated or corrupt file (pyarrow.ArrowInvalid is a ValueError)
+                self._drop(key)
+                return None
+            self._accessed[key] = time.time()
+            return frame
+
+    def put(self, key: str, frame: pd.DataFrame, ttl: Optional[float] = None) -> None:
+        """Store a frame under a key for ttl seconds (None keeps it until evicted)."""
+        with self._lock:
+            now = time.time()
+            meta = {"created": now, "expires": None if ttl is None else now + ttl}
+            # The results first: a sidecar never points to the results of an older put
+            write_atomically(self._path(key), lambda tmp: frame.to_parquet(tmp, index=False))
+            write_atomically(self._meta_path(key), lambda tmp: tmp.write_text(json.dumps(meta)))
+            self._accessed[key] = now
+            self._evict()
+
+    def _evict(self) -> None:
+        # Scan the directory rather than trusting an index, so entries written by other
+        # processes, and files without a sidecar, count towards the budget too
+        now = time.time()
+        entries = []
+        for path in self.directory.iterdir():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if path.name.endswith(".tmp"):
+                if now - stat.st_mtime > self.STALE_TMP_AGE:
+                    path.unlink(missing_ok=True)
+            elif path.suffix == ".parquet":
+                key = path.stem
+                entries.append((max(stat.st_mtime, self._accessed.get(key, 0)), stat.st_size, key))
+            elif path.name.endswith(".meta.json") and not self._path(path.name[: -len(".meta.json")]).exists():
+                path.unlink(missing_ok=True)
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            total -= size
+            self._drop(key)
+
+    def clear(self) -> None:
+        """Remove every cached result."""
+        with self._lock:
+            for path in self.directory.glob("*.parquet"):
+                self._drop(path.stem)
+
+
+_default_cache: Optional[ResultCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResultCache:
+    """Return the process-wide result cache shared by all notebooks."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
@@ -0,0 +1,131 @@
+"""
+Small, pre-aggregated tables for the Altair charts of the apps.
+
+Altair embeds the data of a chart in its Vega-Lite spec, so charting row-level
+frames makes the spec, and the time the browser takes to render it, grow with the
+number of rows. These helpers aggregate with pandas first, so that only one row
+per bar, or per time bin and group, ends up in the spec.
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+import pandas as pd
+
+# Upper bounds of the size of a binned cube: time bins x groups
+DEFAULT_MAX_BINS = 120
+DEFAULT_MAX_GROUPS = 15
+
+OTHER = "Other"
+
+# Bin widths tried in order until the period fits in max_bins, as pandas period frequencies
+BIN_FREQUENCIES = ["D", "W", "M", "Q", "Y"]
+
+
+def count_by(frame: pd.DataFrame, column: str, count_column: str = "count") -> pd.DataFrame:
+    """Count the rows of a frame per value of a column, largest count first.
+
+    Missing values are counted too, so that the counts add up to the number of rows.
+
+    Args:
+        frame (pd.DataFrame | pyarrow.Table): Row-level data, e.g. one row per notice
+        column (str): Column to count the values of
+        count_column (str, optional): Name of the count column
+
+    Returns:
+        pd.DataFrame: One row per value, with the value and count columns
+    """
+    columns = getattr(frame, "column_names", None) or frame.columns
+    if column not in columns:
+        return pd.DataFrame({column: pd.Series(dtype=object), count_column: pd.Series(dtype="int64")})
+    if hasattr(frame, "column_names"):
+        # A pyarrow Table: count in Arrow, only the counts become a DataFrame
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        values, counts = pc.value_counts(frame[column]).flatten()
+        if pa.types.is_dictionary(values.type):
+            values = values.dictionary_decode()
+        return (
+            pd.DataFrame({column: values.to_pandas(), count_column: counts.to_pandas()})
+            .sort_values(count_column, ascending=False, ignore_index=True)
+        )
+    return frame[column].value_counts(dropna=False).rename_axis(column).reset_index(name=count_column)
+
+
+def top_groups(values: pd.Series, weights: Optional[pd.Series] = None, max_groups: int = DEFAULT_MAX_GROUPS, other: str = OTHER) -> pd.Series:
+    """Keep the max_groups - 1 largest groups of a Series and merge the others into one.
+
+    Args:
+        values (pd.Series): Group of every row
+        weights (pd.Series, optional): Weight of every row, e.g. a count column. Defaults to 1.
+        max_groups (int, optional): Number of groups to keep, including the merged one
+        other (str, optional): Name of the merged group
+
+    Returns:
+        pd.Series: The values, with the smaller groups replaced by other
+    """
+    totals = (weights if weights is not None else pd.Series(1, index=values.index)).groupby(values).sum()
+    if len(totals) <= max_groups:
+        return values
+    keep = totals.nlargest(max_groups - 1).index
+    return values.where(values.isin(keep), other)
+
+
+def bin_frequency(start, end, max_bins: int = DEFAULT_MAX_BINS) -> str:
+    """Return the narrowest bin width (day, week, month, ...) that splits a period in at most max_bins bins."""
+    days = max(1, (pd.Timestamp(end) - pd.Timestamp(start)).days + 1)
+    for freq, length in zip(BIN_FREQUENCIES, (1, 7, 30, 91, 365)):
+        if days / length <= max_bins:
+            return freq
+    return BIN_FREQUENCIES[-1]
+
+
+def binned_cube(
+    frame: pd.DataFrame,
+    date_column: str,
+    group_column: str,
+    value_column: str,
+    max_bins: int = DEFAULT_MAX_BINS,
+    max_groups: int = DEFAULT_MAX_GROUPS,
+) -> pd.DataFrame:
+    """Sum a value per time bin and group, for brush-linked charts.
+
+    The dates are floored to bins wide enough for the period to fit in max_bins bins,
+    and the smaller groups are merged into one, so the cube never has more than
+    max_bins x max_groups rows, however long the period or detailed the data.
+
+    Args:
+        frame (pd.DataFrame): Data with a date, a group and a value column
+        date_column (str): Column with the dates; it holds the start of the bin in the cube
+        group_column (str): Column with the groups, e.g. notice type labels
+        value_column (str): Column with the values to sum, e.g. document counts
+        max_bins (int, optional): Maximum number of time bins
+        max_groups (int, optional): Maximum number of groups
+
+    Returns:
+        pd.DataFrame: One row per bin and group, with the date, group and value columns
+    """
+    columns = [date_column, group_column, value_column]
+    if frame.empty or not set(columns) <= set(frame.columns):
+        return pd.DataFrame(columns=columns)
+
+    dates = pd.to_datetime(frame[date_column])
+    freq = bin_frequency(dates.min(), dates.max(), max_bins)
+    bins = dates.dt.to_period(freq).dt.start_time if freq != "D" else dates.dt.normalize()
+    groups = top_groups(frame[group_column].fillna(OTHER), frame[value_column], max_groups)
+
+    return (
+        frame[value_column]
+        .groupby([bins.rename(date_column), groups.rename(group_column)])
+        .sum()
+        .reset_index()
+    )
+
+
+def totals(cube: pd.DataFrame, date_column: str, value_column: str) -> pd.DataFrame:
+    """Sum the value of a cube per time bin."""
+    if cube.empty:
+        return pd.DataFrame(columns=[date_column, value_column])
+    return cube.groupby(date_column, as_index=False)[value_column].sum()
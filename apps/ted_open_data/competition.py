@@ -0,0 +1,338 @@
+"""
+Competition notices by buyer country and procedure type.
+
+Cellar only returns the publication number, buyer name, procedure type URI and
+buyer country URI of every competition notice (the "lean" plan). The procedure
+type labels and country codes are then looked up locally in the label store
+(see labels.py), instead of joining skos:prefLabel and dc:identifier in the
+store for every row and deduplicating the result there. The "cellar" plan, which
+resolves them in the query, is kept for comparison.
+
+The notices are then counted per buyer country and procedure type in a single
+groupby; the map and the breakdowns of the apps are sums of these counts.
+
+Over periods, Cellar counts the notices per day instead (COUNTS_QUERY and
+BUYERS_QUERY), so the apps can shard the queries by month and keep the daily
+counts in the daily aggregate store (see shard.py and daily_store.py).
+"""
+
+from __future__ import annotations
+
+from datetime import date
+from typing import Literal, Optional, Sequence
+
+import pandas as pd
+
+from .labels import LabelStore, get_label_store
+
+COMPETITION = "http://publications.europa.eu/resource/authority/form-type/competition"
+
+COLUMNS = ["publicationNumber", "legalName", "procedureType", "country"]
+
+Plan = Literal["lean", "cellar"]
+
+# Countries shown on the maps: ISO 3166 alpha-3 code (the identifier of the country
+# authority table), ISO 3166 numeric id (the id of the map topology, see geo.py) and name
+COUNTRIES = pd.DataFrame(
+    [
+        ("ALB", 8, "Albania"),
+        ("AUT", 40, "Austria"),
+        ("BEL", 56, "Belgium"),
+        ("BIH", 70, "Bosnia and Herzegovina"),
+        ("BGR", 100, "Bulgaria"),
+        ("HRV", 191, "Croatia"),
+        ("CYP", 196, "Cyprus"),
+        ("CZE", 203, "Czechia"),
+        ("DNK", 208, "Denmark"),
+        ("EST", 233, "Estonia"),
+        ("FIN", 246, "Finland"),
+        ("FRA", 250, "France"),
+        ("DEU", 276, "Germany"),
+        ("GRC", 300, "Greece"),
+        ("HUN", 348, "Hungary"),
+        ("ISL", 352, "Iceland"),
+        ("IRL", 372, "Ireland"),
+        ("ITA", 380, "Italy"),
+        ("LVA", 428, "Latvia"),
+        ("LIE", 438, "Liechtenstein"),
+        ("LTU", 440, "Lithuania"),
+        ("LUX", 442, "Luxembourg"),
+        ("MLT", 470, "Malta"),
+        ("MNE", 499, "Montenegro"),
+        ("NLD", 528, "Netherlands"),
+        ("NOR", 578, "Norway"),
+        ("POL", 616, "Poland"),
+        ("PRT", 620, "Portugal"),
+        ("ROU", 642, "Romania"),
+        ("SRB", 688, "Serbia"),
+        ("SVK", 703, "Slovakia"),
+        ("SVN", 705, "Slovenia"),
+        ("ESP", 724, "Spain"),
+        ("SWE", 752, "Sweden"),
+        ("CHE", 756, "Switzerland"),
+        ("MKD", 807, "North Macedonia"),
+        ("GBR", 826, "United Kingdom"),
+    ],
+    columns=["country", "id", "name"],
+).set_index("country")
+
+# Codes of other countries become missing values when cast to this
+COUNTRY_CODES = pd.CategoricalDtype(COUNTRIES.index)
+
+COUNT_COLUMNS = ["country", "id", "name", "procedureType", "count"]
+
+UNKNOWN = "Unknown"
+
+# Number of buyers listed by top_buyers
+TOP_BUYERS = 20
+
+# Competition notices of the period and their buyers, shared by the lean and aggregate queries
+NOTICE_PATTERN = """
+  GRAPH ?g {
+    ?notice
+        epo:hasPublicationDate ?publicationDate ;
+        epo:hasFormType <%(form_type)s> ;
+        epo:hasNoticePublicationNumber ?publicationNumber ;
+        epo:refersToProcedure ?procedure ;
+        epo:announcesRole ?buyer .
+    ?procedure a epo:Procedure ;
+        epo:hasProcedureType ?procedureTypeUri .
+    ?buyer a epo:Buyer ;
+        epo:playedBy ?organisation .
+    ?organisation epo:hasLegalName ?legalName ;
+        cccev:registeredAddress ?address .
+    ?address epo:hasCountryCode ?countryUri .
+  }
+  FILTER (%(date_filter)s)
+"""
+
+PREFIXES = """
+PREFIX cccev: <http://data.europa.eu/m8g/>
+PREFIX epo: <http://data.europa.eu/a4g/ontology#>
+PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+"""
+
+LEAN_QUERY = PREFIXES + """
+SELECT ?publicationNumber ?legalName ?procedureTypeUri ?countryUri
+
+WHERE {""" + NOTICE_PATTERN + """}
+"""
+
+# Notices per day, procedure type and buyer country
+COUNTS_QUERY = PREFIXES + """
+SELECT ?publicationDate ?procedureTypeUri ?countryUri (COUNT(DISTINCT ?publicationNumber) AS ?noticeCount)
+
+WHERE {""" + NOTICE_PATTERN + """}
+GROUP BY ?publicationDate ?procedureTypeUri ?countryUri
+"""
+
+# Notices per day and buyer
+BUYERS_QUERY = PREFIXES + """
+SELECT ?publicationDate ?legalName ?countryUri (COUNT(DISTINCT ?publicationNumber) AS ?noticeCount)
+
+WHERE {""" + NOTICE_PATTERN + """}
+GROUP BY ?publicationDate ?legalName ?countryUri
+"""
+
+# GROUP BY columns of the aggregate queries, and how to merge their shards (see shard.py)
+COUNTS_KEYS = ["publicationDate", "procedureTypeUri", "countryUri"]
+BUYERS_KEYS = ["publicationDate", "legalName", "countryUri"]
+AGGREGATIONS = {"noticeCount": "sum"}
+DTYPES = {"publicationDate": "date", "noticeCount": "integer"}
+
+CELLAR_QUERY = """
+PREFIX cccev: <http://data.europa.eu/m8g/>
+PREFIX dc: <http://purl.org/dc/elements/1.1/>
+PREFIX epo: <http://data.europa.eu/a4g/ontology#>
+PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
+PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+
+SELECT DISTINCT ?publicationNumber ?legalName ?procedureType ?country
+
+WHERE {
+
+	FILTER (%(date_filter)s)
+	FILTER (?formType = <%(form_type)s>)
+
+  GRAPH ?g {
+    ?notice
+        epo:hasPublicationDate ?publicationDate ;
+        epo:refersToProcedure [
+            epo:hasProcedureType ?procedureTypeUri ;
+            a epo:Procedure
+        ] ;
+        epo:hasNoticePublicationNumber ?publicationNumber ;
+        epo:hasFormType ?formType ;
+        epo:announcesRole [
+            a epo:Buyer ;
+            epo:playedBy [
+                epo:hasLegalName ?legalName ;
+                cccev:registeredAddress [
+                    epo:hasCountryCode ?countryUri
+                ]
+            ]
+        ]
+    }
+
+    ?procedureTypeUri a skos:Concept ;
+        skos:prefLabel ?procedureType.
+    FILTER (lang(?procedureType) = "en")
+
+    ?countryUri dc:identifier ?country .
+}
+"""
+
+
+def _date_filter(start: date, end: Optional[date] = None) -> str:
+    if end is None:
+        return '?publicationDate = "%s"^^xsd:date' % start.isoformat()
+    return '?publicationDate >= "%s"^^xsd:date && ?publicationDate < "%s"^^xsd:date' % (
+        start.isoformat(),
+        end.isoformat(),
+    )
+
+
+def build_competition_query(start: date, end: Optional[date] = None, plan: Plan = "lean") -> str:
+    """Build the query for the competition notices published on a day, or in [start, end).
+
+    Args:
+        start (date): Publication date, or first day of the period
+        end (date, optional): Day after the period
+        plan (str, optional): "lean" to resolve labels locally (see resolve), "cellar"
+                              to resolve them in the query
+
+    Returns:
+        str: The SPARQL query
+    """
+    template = LEAN_QUERY if plan == "lean" else CELLAR_QUERY
+    return template % {"form_type": COMPETITION, "date_filter": _date_filter(start, end)}
+
+
+def build_counts_query(start: date, end: date) -> str:
+    """Build the query counting the competition notices of [start, end) per day, procedure type and country."""
+    return COUNTS_QUERY % {"form_type": COMPETITION, "date_filter": _date_filter(start, end)}
+
+
+def build_buyers_query(start: date, end: date) -> str:
+    """Build the query counting the competition notices of [start, end) per day and buyer."""
+    return BUYERS_QUERY % {"form_type": COMPETITION, "date_filter": _date_filter(start, end)}
+
+
+def _lookup(uris: pd.Series, table: pd.Series) -> pd.Series:
+    # Resolve the few distinct URIs, falling back to the code at the end of the URI
+    # (e.g. .../country/DEU), then map every row at once
+    distinct = pd.Index(uris.dropna().unique())
+    codes = distinct.to_series().str.rsplit("/", n=1).str[-1]
+    resolved = table.reindex(distinct).fillna(codes)
+    return uris.map(resolved)
+
+
+def resolve_uris(frame: pd.DataFrame, labels: Optional[LabelStore] = None) -> pd.DataFrame:
+    """Replace the procedureTypeUri and countryUri columns of a frame by procedureType and country.
+
+    Procedure type URIs become their English label and country URIs their
+    identifier (ISO alpha-3 code). Concepts missing from the label store fall back
+    to the code at the end of their URI. Other columns are kept as they are.
+
+    Args:
+        frame (pd.DataFrame): Results of the lean or an aggregate query
+        labels (LabelStore, optional): Where to look up labels, defaults to the shared store
+
+    Returns:
+        pd.DataFrame: The frame with the resolved columns, renamed
+    """
+    labels = labels or get_label_store()
+    resolved = {}
+    if "procedureTypeUri" in frame.columns:
+        resolved["procedureTypeUri"] = _lookup(frame["procedureTypeUri"], labels.labels("procedure-type"))
+    if "countryUri" in frame.columns:
+        resolved["countryUri"] = _lookup(frame["countryUri"], labels.identifiers("country"))
+    return frame.assign(**resolved).rename(columns={"procedureTypeUri": "procedureType", "countryUri": "country"})
+
+
+def resolve(notices: pd.DataFrame, labels: Optional[LabelStore] = None) -> pd.DataFrame:
+    """Turn the results of the lean query into the columns of the cellar plan.
+
+    See resolve_uris for the lookups. Duplicate rows are dropped, as SELECT
+    DISTINCT would.
+
+    Args:
+        notices (pd.DataFrame): Results of the lean query
+        labels (LabelStore, optional): Where to look up labels, defaults to the shared store
+
+    Returns:
+        pd.DataFrame: publicationNumber, legalName, procedureType and country columns
+    """
+    if notices.empty or "procedureTypeUri" not in notices.columns:
+        return pd.DataFrame(columns=COLUMNS)
+    notices = notices[["publicationNumber", "legalName", "procedureTypeUri", "countryUri"]]
+    return resolve_uris(notices, labels).drop_duplicates(ignore_index=True)
+
+
+def country_procedure_counts(
+    notices: pd.DataFrame,
+    by: Sequence[str] = (),
+    value_column: Optional[str] = None,
+) -> pd.DataFrame:
+    """Count competition notices per buyer country and procedure type.
+
+    Notices of buyers outside COUNTRIES are left out; a missing procedure type is
+    counted as UNKNOWN.
+
+    Args:
+        notices (pd.DataFrame): Notices with country (alpha-3) and procedureType columns,
+                                as returned by resolve or resolve_uris
+        by (Sequence[str], optional): Further columns to count by, e.g. publicationDate
+        value_column (str, optional): Column to sum, e.g. noticeCount of the aggregate
+                                      queries, instead of counting rows
+
+    Returns:
+        pd.DataFrame: The by, country, id, name, procedureType and count columns, one
+                      row per group with notices
+    """
+    columns = list(by) + COUNT_COLUMNS
+    if notices.empty or not {"country", "procedureType", *by} <= set(notices.columns):
+        return pd.DataFrame(columns=columns)
+
+    keys = [notices[column] for column in by] + [
+        notices["country"].astype(COUNTRY_CODES),
+        notices["procedureType"].fillna(UNKNOWN),
+    ]
+    grouped = (notices[value_column] if value_column else notices).groupby(keys, observed=True)
+    counts = (grouped.sum() if value_column else grouped.size()).rename("count").reset_index()
+    return counts.join(COUNTRIES, on="country")[columns]
+
+
+def country_totals(counts: pd.DataFrame, by: Sequence[str] = ()) -> pd.DataFrame:
+    """Sum the counts of country_procedure_counts per country (and by columns), largest first."""
+    columns = ["country", "id", "name", *by]
+    if counts.empty:
+        return pd.DataFrame(columns=columns + ["count"])
+    return (
+        counts.groupby(columns, observed=True, as_index=False)["count"]
+        .sum()
+        .sort_values("count", ascending=False, ignore_index=True)
+    )
+
+
+def top_buyers(buyers: pd.DataFrame, n: int = TOP_BUYERS, value_column: Optional[str] = None) -> pd.DataFrame:
+    """Return the buyers with the most competition notices.
+
+    Args:
+        buyers (pd.DataFrame): Notices, or counts, with legalName and country columns
+        n (int, optional): Number of buyers to return
+        value_column (str, optional): Column to sum, e.g. noticeCount of BUYERS_QUERY,
+                                      instead of counting rows
+
+    Returns:
+        pd.DataFrame: legalName, country and count columns, largest count first
+    """
+    columns = ["legalName", "country"]
+    if buyers.empty or not set(columns) <= set(buyers.columns):
+        return pd.DataFrame(columns=columns + ["count"])
+
+    grouped = (buyers[value_column] if value_column else buyers).groupby(
+        [buyers["legalName"], buyers["country"].fillna(UNKNOWN)]
+    )
+    counts = grouped.sum() if value_column else grouped.size()
+    return counts.nlargest(n).rename("count").reset_index()
@@ -0,0 +1,140 @@
+"""
+Bounded concurrent execution of I/O-bound calls.
+
+Queries spend their time waiting on the network, so a small thread pool lets
+several of them run at once when the apps run in a Python process (marimo edit
+or run, scripts). The deployed apps run in Pyodide, which has no threads: there
+map_concurrently and gather run every call one after the other. Async cells
+use gather_async instead, with the async methods of the clients: in Pyodide
+those await the browser's fetch (see browser_fetch), so their requests are in
+flight at the same time; elsewhere they run the blocking call in a thread.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Iterable, List, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+DEFAULT_MAX_WORKERS = 4
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def threads_available() -> bool:
+    """Whether threads can be started (they cannot in Pyodide)."""
+    return sys.platform != "emscripten"
+
+
+def map_concurrently(fn: Callable[[T], R], items: Iterable[T], max_workers: int = DEFAULT_MAX_WORKERS) -> List[R]:
+    """Apply fn to every item on a bounded thread pool and return the results in order.
+
+    The first exception raised by a call is re-raised once all calls have finished.
+    Under Pyodide the calls run sequentially, in order.
+
+    Args:
+        fn (Callable): Function to call for each item
+        items (Iterable): The items
+        max_workers (int, optional): Maximum number of concurrent calls
+
+    Returns:
+        list: fn(item) for each item, in the order of items
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1 or not threads_available():
+        return [fn(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(fn, items))
+
+
+def gather(max_workers: int = DEFAULT_MAX_WORKERS, **calls: Callable[[], R]) -> Dict[str, R]:
+    """Run independent calls concurrently and return their results by name.
+
+    Under Pyodide (the deployed apps) the calls run sequentially, in order; async
+    cells can use gather_async to overlap them there too.
+
+    Example:
+        results = gather(
+            notices=lambda: do_query(notices_query),
+            ted=lambda: ted_client.count(ted_query),
+        )
+
+    Args:
+        max_workers (int, optional): Maximum number of concurrent calls
+        **calls (Callable): Functions without arguments, by result name
+
+    Returns:
+        dict: The result of every call, by name
+    """
+    names = list(calls)
+    results = map_concurrently(lambda name: calls[name](), names, max_workers=max_workers)
+    return dict(zip(names, results))
+
+
+async def run_blocking(fn: Callable[[], R]) -> R:
+    """Run a blocking call from a coroutine, in a thread where threads are available.
+
+    In Pyodide the call runs on the event loop and blocks it until it returns.
+    """
+    if not threads_available():
+        return fn()
+    return await asyncio.to_thread(fn)
+
+
+async def gather_async(**calls: Callable[[], Awaitable[R]]) -> Dict[str, R]:
+    """Await independent coroutines at the same time and return their results by name.
+
+    Unlike gather this also overlaps the calls in Pyodide, as long as they await
+    (e.g. browser_fetch) rather than block. The first exception is re-raised.
+
+    Example:
+        results = await gather_async(
+            notices=lambda: get_client().query_async(notices_query),
+            ted=lambda: ted_client.count_async(ted_query),
+        )
+
+    Args:
+        **calls (Callable): Functions without arguments returning a coroutine, by result name
+
+    Returns:
+        dict: The result of every call, by name
+    """
+    names = list(calls)
+    results = await asyncio.gather(*(calls[name]() for name in names))
+    return dict(zip(names, results))
+
+
+async def browser_fetch(url: str, retries: int = 3, backoff_factor: float = 0.5, **kwargs):
+    """Fetch a URL with the browser's fetch API, retrying RETRY_STATUSES and network errors.
+
+    Only available in Pyodide. The response is returned as is, whatever its status,
+    once it is not worth retrying or the retries are used up.
+
+    Args:
+        url (str): The URL
+        retries (int, optional): Number of retries
+        backoff_factor (float, optional): Base delay for the exponential backoff between retries
+        **kwargs: Passed on to pyodide.http.pyfetch (method, headers, body, ...)
+
+    Returns:
+        pyodide.http.FetchResponse: The response
+    """
+    from pyodide.http import pyfetch
+
+    for attempt in range(retries + 1):
+        try:
+            response = await pyfetch(url, **kwargs)
+        except OSError:
+            # pyfetch raises OSError when the request could not be sent
+            if attempt == retries:
+                raise
+        else:
+            if response.status not in RETRY_STATUSES or attempt == retries:
+                return response
+        await asyncio.sleep(backoff_factor * 2 ** attempt)
@@ -0,0 +1,178 @@
+"""
+Incremental store of per-day aggregates.
+
+Aggregates for past days hardly ever change, so instead of recomputing a
+whole period every time it moves, every table keeps its rows per day on disk
+together with the time each day was fetched. A request for a period only
+fetches the days that are missing, recent enough to still change and fetched
+too long ago, or fetched before they closed, and answers the rest from the
+store. The rows and fetch times of a table are kept in one Parquet file (the
+fetch times in its metadata), replaced atomically.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from .cache import DEFAULT_CACHE_DIR, RECENT_TTL, write_atomically
+
+Fetch = Callable[[date, date], pd.DataFrame]
+
+# Key of the fetch times of the days in the Parquet metadata of a table
+FETCHED_KEY = b"ted_open_data.fetched"
+
+
+def _days(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days)]
+
+
+def _runs(days: List[date]) -> List[Tuple[date, date]]:
+    """Group sorted days into half-open ranges of consecutive days."""
+    runs: List[Tuple[date, date]] = []
+    for day in days:
+        if runs and runs[-1][1] == day:
+            runs[-1] = (runs[-1][0], day + timedelta(days=1))
+        else:
+            runs.append((day, day + timedelta(days=1)))
+    return runs
+
+
+class DailyAggregateStore:
+    """Per-day aggregate tables kept as Parquet files, refreshed day by day.
+
+    Args:
+        directory (str | Path, optional): Where the tables are kept
+        open_days (int, optional): Number of days before today whose aggregates may still
+                                   change; those are refreshed once older than recent_ttl,
+                                   and once more after they closed
+        recent_ttl (float, optional): Age in seconds after which a recent day is fetched again
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path] = DEFAULT_CACHE_DIR / "daily",
+        open_days: int = 2,
+        recent_ttl: float = RECENT_TTL,
+    ):
+        self.directory = Path(directory)
+        self.open_days = open_days
+        self.recent_ttl = recent_ttl
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, table: str) -> Path:
+        return self.directory / f"{table}.parquet"
+
+    def _read(self, table: str) -> Tuple[Optional[pd.DataFrame], Dict[str, float]]:
+        import pyarrow.parquet as pq
+
+        try:
+            stored = pq.read_table(self._path(table))
+            fetched = json.loads((stored.schema.metadata or {})[FETCHED_KEY])
+        except (OSError, ValueError, KeyError):
+            # Missing, unreadable, or written before the fetch times were kept with the rows
+            return None, {}
+        return stored.replace_schema_metadata(None).to_pandas(), fetched
+
+    def _write(self, table: str, data: pd.DataFrame, fetched: Dict[str, float]) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        stored = pa.Table.from_pandas(data, preserve_index=False)
+        stored = stored.replace_schema_metadata({FETCHED_KEY: json.dumps(fetched)})
+        write_atomically(self._path(table), lambda tmp: pq.write_table(stored, tmp))
+
+    def missing_days(self, table: str, start: date, end: date) -> List[date]:
+        """Return the days of [start, end) that have to be fetched for a table."""
+        _, fetched = self._read(table)
+        return self._missing(fetched, start, end)
+
+    def _closes_at(self, day: date) -> float:
+        # A day stops changing once it is more than open_days before today
+        return datetime.combine(day + timedelta(days=self.open_days + 1), datetime.min.time()).timestamp()
+
+    def _missing(self, fetched: Dict[str, float], start: date, end: date) -> List[date]:
+        now = time.time()
+        missing = []
+        for day in _days(start, end):
+            fetched_at = fetched.get(day.isoformat())
+            if fetched_at is None:
+                missing.append(day)
+            elif fetched_at < self._closes_at(day):
+                # Fetched while still open: refresh when too old, and once after it closed
+                if now >= self._closes_at(day) or now - fetched_at > self.recent_ttl:
+                    missing.append(day)
+        return missing
+
+    def get(self, table: str, day_column: str, start: date, end: date, fetch: Fetch) -> pd.DataFrame:
+        """Return the rows of a table for the days in [start, end).
+
+        Missing and stale days are fetched first, one fetch call per run of
+        consecutive days. fetch must return the rows of every day in the range it
+        is given; days without rows are remembered as empty. When the fetched rows
+        do not have the columns of the stored ones (the query changed), the stored
+        rows are dropped and the rest of the period is fetched again.
+
+        Args:
+            table (str): Name of the table, e.g. "notice_counts"
+            day_column (str): Datetime column holding the day of each row
+            start (date): First day of the period
+            end (date): Day after the last day of the period
+            fetch (Callable): Returns the rows for a half-open range of days
+
+        Returns:
+            pd.DataFrame: The rows of the period, sorted by day
+        """
+        with self._lock:
+            data, fetched = self._read(table)
+            missing = self._missing(fetched, start, end)
+
+            if missing:
+                fetched_at = time.time()
+                fresh = [fetch(run_start, run_end) for run_start, run_end in _runs(missing)]
+
+                if data is not None and list(data.columns) != list(fresh[0].columns):
+                    # The query changed shape: start over, fetching the days stored before too
+                    data = None
+                    refetched = sorted(set(_days(start, end)) - set(missing))
+                    fresh += [fetch(run_start, run_end) for run_start, run_end in _runs(refetched)]
+                    missing += refetched
+
+                fresh = pd.concat(fresh, ignore_index=True) if len(fresh) > 1 else fresh[0]
+                if data is None:
+                    data, fetched = fresh.iloc[:0], {}
+
+                missing_keys = pd.DatetimeIndex([pd.Timestamp(day) for day in missing])
+                data = pd.concat(
+                    [data[~data[day_column].dt.normalize().isin(missing_keys)], fresh],
+                    ignore_index=True,
+                )
+                fetched.update({day.isoformat(): fetched_at for day in missing})
+                self._write(table, data, fetched)
+
+            if data is None:
+                return pd.DataFrame()
+
+            days = data[day_column].dt.normalize()
+            in_period = (days >= pd.Timestamp(start)) & (days < pd.Timestamp(end))
+            return data[in_period].sort_values(day_column, ignore_index=True)
+
+
+_default_store: Optional[DailyAggregateStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_daily_store() -> DailyAggregateStore:
+    """Return the process-wide daily aggregate store."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = DailyAggregateStore()
+        return _default_store
@@ -0,0 +1,212 @@
+"""
+Country geometry for the maps of the apps.
+
+The maps only show Europe, but the world TopoJSON of vega-datasets carries every
+country at full 110m detail, and the browser downloads and projects all of it.
+This module prepares a smaller topology once, at build time: countries and
+islands outside Europe are dropped, the remaining arcs are clamped to a box
+around Europe and quantized on a coarser grid, and countries keep their ISO 3166
+numeric id, so the apps can look up their data by id. The build script writes it
+next to the exported apps by running this module with their output directory::
+
+    python -m ted_open_data.geo _site/apps
+
+Only the standard library is used, so the build can run it without the
+dependencies of the apps.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import urllib.request
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+# World topology of vega-datasets (data.world_110m.url), with ISO 3166 numeric ids
+WORLD_TOPOLOGY_URL = "https://cdn.jsdelivr.net/npm/vega-datasets@v1.29.0/data/world-110m.json"
+
+# Path of the prepared topology, relative to the exported apps
+TOPOLOGY_PATH = "public/europe-110m.json"
+
+# Name of the countries object in both topologies, for alt.topo_feature
+FEATURE = "countries"
+
+# West, south, east, north, in degrees: Iceland to the Urals' foothills, Cyprus to North Cape
+EUROPE_BBOX = (-25.0, 34.0, 45.0, 72.0)
+
+# Grid the clamped arcs are quantized on, per axis
+QUANTIZATION = 5_000
+
+BBox = Tuple[float, float, float, float]
+
+
+def topology_url() -> str:
+    """Return the URL the maps load their countries from.
+
+    In the browser this is the prepared topology shipped next to the exported app;
+    elsewhere (e.g. marimo edit) the world topology, which has the same ids.
+    """
+    return TOPOLOGY_PATH if sys.platform == "emscripten" else WORLD_TOPOLOGY_URL
+
+
+def _decode_arcs(topology: dict) -> List[List[Tuple[float, float]]]:
+    # Undo the delta encoding and quantization of the arcs, to longitude/latitude
+    transform = topology.get("transform")
+    arcs = []
+    for arc in topology["arcs"]:
+        if transform is None:
+            arcs.append([(float(x), float(y)) for x, y, *_ in arc])
+            continue
+        (sx, sy), (tx, ty) = transform["scale"], transform["translate"]
+        x = y = 0
+        points = []
+        for dx, dy, *_ in arc:
+            x, y = x + dx, y + dy
+            points.append((x * sx + tx, y * sy + ty))
+        arcs.append(points)
+    return arcs
+
+
+def _polygons(geometry: dict) -> List[list]:
+    if geometry.get("type") == "Polygon":
+        return [geometry["arcs"]]
+    if geometry.get("type") == "MultiPolygon":
+        return geometry["arcs"]
+    return []
+
+
+def _ring_bbox(ring: Iterable[int], arcs: List[List[Tuple[float, float]]]) -> BBox:
+    points = [p for index in ring for p in arcs[index if index >= 0 else ~index]]
+    xs, ys = [p[0] for p in points], [p[1] for p in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _intersects(a: BBox, b: BBox) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _country_id(value) -> Union[int, str, None]:
+    # ISO 3166 numeric ids are strings like "040" in some topologies, ints in others
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def clip_topology(
+    world: dict,
+    bbox: BBox = EUROPE_BBOX,
+    quantization: int = QUANTIZATION,
+    feature: str = FEATURE,
+) -> dict:
+    """Keep the countries of a topology that lie in a bounding box, with simplified arcs.
+
+    Polygons (e.g. overseas territories) whose outer ring does not meet the box are
+    dropped, and countries left without polygons with them. The points of the kept
+    arcs are clamped to the box, so the parts of a country outside it collapse onto
+    its edge, then quantized on a quantization x quantization grid over the box;
+    consecutive points falling on the same grid cell are merged. Arcs shared by two
+    countries are transformed identically, so the topology stays seamless.
+
+    Args:
+        world (dict): TopoJSON topology with a GeometryCollection of countries
+        bbox (BBox, optional): West, south, east and north bounds, in degrees
+        quantization (int, optional): Number of grid steps per axis
+        feature (str, optional): Name of the countries object
+
+    Returns:
+        dict: TopoJSON topology with the countries object only
+    """
+    arcs = _decode_arcs(world)
+    west, south, east, north = bbox
+    kx = (east - west) / (quantization - 1)
+    ky = (north - south) / (quantization - 1)
+
+    remap: Dict[int, int] = {}
+    kept_arcs: List[list] = []
+
+    def keep(index: int) -> int:
+        # Index of the arc in the new topology, negative (~index) when reversed
+        absolute = index if index >= 0 else ~index
+        if absolute not in remap:
+            remap[absolute] = len(kept_arcs)
+            kept_arcs.append(arcs[absolute])
+        new = remap[absolute]
+        return new if index >= 0 else ~new
+
+    geometries = []
+    for geometry in world["objects"][feature]["geometries"]:
+        polygons = [p for p in _polygons(geometry) if p and _intersects(_ring_bbox(p[0], arcs), bbox)]
+        if not polygons:
+            continue
+        clipped = {
+            "type": "MultiPolygon",
+            "arcs": [[[keep(i) for i in ring] for ring in polygon] for polygon in polygons],
+        }
+        if "id" in geometry:
+            clipped["id"] = _country_id(geometry["id"])
+        if geometry.get("properties"):
+            clipped["properties"] = geometry["properties"]
+        geometries.append(clipped)
+
+    encoded = []
+    for points in kept_arcs:
+        grid = [
+            (
+                round((min(max(x, west), east) - west) / kx),
+                round((min(max(y, south), north) - south) / ky),
+            )
+            for x, y in points
+        ]
+        deduped = [grid[0]] + [p for previous, p in zip(grid, grid[1:]) if p != previous]
+        if len(deduped) < 2:
+            # A TopoJSON arc needs two points, even when it collapsed to one
+            deduped.append(deduped[0])
+        encoded.append(
+            [list(deduped[0])] + [[x - px, y - py] for (px, py), (x, y) in zip(deduped, deduped[1:])]
+        )
+
+    return {
+        "type": "Topology",
+        "bbox": list(bbox),
+        "transform": {"scale": [kx, ky], "translate": [west, south]},
+        "objects": {feature: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": encoded,
+    }
+
+
+def fetch_world(cache_path: Optional[Path] = None, url: str = WORLD_TOPOLOGY_URL) -> dict:
+    """Download the world topology, or read it from cache_path when it was downloaded before.
+
+    Args:
+        cache_path (Path, optional): Where to keep the downloaded topology
+        url (str, optional): URL of the world topology
+
+    Returns:
+        dict: The world topology
+    """
+    if cache_path is not None and cache_path.exists():
+        return json.loads(cache_path.read_text(encoding="utf-8"))
+
+    with urllib.request.urlopen(url, timeout=60) as response:
+        text = response.read().decode("utf-8")
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_text(text, encoding="utf-8")
+    return json.loads(text)
+
+
+if __name__ == "__main__":
+    # Write the Europe topology under the given output directory of the apps, keeping the
+    # download in an optional cache path
+    output = (Path(sys.argv[1]) if len(sys.argv) > 1 else Path(".")) / TOPOLOGY_PATH
+    cache = Path(sys.argv[2]) if len(sys.argv) > 2 else None
+    world = fetch_world(cache)
+    topology = clip_topology(world)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(topology, separators=(",", ":")), encoding="utf-8")
+    print(
+        f"Wrote {len(topology['objects'][FEATURE]['geometries'])} countries and "
+        f"{len(topology['arcs'])} arcs to {output}"
+    )
@@ -0,0 +1,240 @@
+"""
+Label store for the EU controlled vocabularies used by the notebooks.
+
+The notice-type, form-type, procedure-type and country authority tables
+almost never change, so instead of querying Cellar for their labels on every
+page load the notebooks read them from a versioned JSON snapshot. The
+snapshot bundled with the package is written by running this module::
+
+    python -m ted_open_data.labels
+
+A refreshed copy is kept in the cache directory. If no snapshot is available
+the tables are fetched from Cellar once, with a single query for all schemes.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from importlib import resources
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import pandas as pd
+
+from .cache import DEFAULT_CACHE_DIR
+from .sparql import SparqlClient, get_client
+
+AUTHORITY = "http://publications.europa.eu/resource/authority/"
+
+# Authority tables in the store, by the short name used for lookups
+SCHEMES: Dict[str, str] = {
+    "notice-type": AUTHORITY + "notice-type",
+    "form-type": AUTHORITY + "form-type",
+    "procedure-type": AUTHORITY + "procurement-procedure-type",
+    "country": AUTHORITY + "country",
+}
+
+SNAPSHOT_FORMAT = 1
+
+SNAPSHOT_NAME = "labels.json"
+
+# Snapshots older than this are refreshed in the background
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+
+LABELS_QUERY = """
+PREFIX dc: <http://purl.org/dc/elements/1.1/>
+PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
+
+SELECT ?scheme ?uri ?label ?identifier
+WHERE {
+  VALUES ?scheme { %s }
+  ?uri skos:topConceptOf ?scheme ;
+      skos:prefLabel ?label .
+  FILTER (lang(?label) = "en")
+  OPTIONAL { ?uri dc:identifier ?identifier }
+}
+""" % " ".join(f"<{uri}>" for uri in SCHEMES.values())
+
+
+def fetch_snapshot(client: Optional[SparqlClient] = None) -> dict:
+    """Fetch all authority tables from Cellar and return them as a snapshot document."""
+    rows = (client or get_client()).query(LABELS_QUERY)
+    scheme_names = {uri: name for name, uri in SCHEMES.items()}
+
+    tables: Dict[str, dict] = {name: {"labels": {}, "identifiers": {}} for name in SCHEMES}
+    for scheme, uri, label, identifier in rows[["scheme", "uri", "label", "identifier"]].itertuples(index=False):
+        table = tables[scheme_names[scheme]]
+        table["labels"][uri] = label
+        if isinstance(identifier, str):
+            table["identifiers"][uri] = identifier
+
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "version": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "tables": tables,
+    }
+
+
+def _read_snapshot(path) -> Optional[dict]:
+    try:
+        snapshot = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return snapshot if snapshot.get("format") == SNAPSHOT_FORMAT else None
+
+
+def _bundled_snapshot() -> Optional[dict]:
+    return _read_snapshot(resources.files(__package__) / "data" / SNAPSHOT_NAME)
+
+
+def _snapshot_age(snapshot: dict) -> float:
+    return time.time() - datetime.fromisoformat(snapshot["version"]).timestamp()
+
+
+class LabelStore:
+    """Lazily loaded URI -> label (and identifier) lookups for the authority tables.
+
+    Args:
+        cache_path (str | Path, optional): Where the refreshed snapshot is kept
+        max_age (float, optional): Age in seconds after which the snapshot is refreshed
+                                   in the background, None to never refresh
+        client (SparqlClient, optional): Client used to fetch the tables from Cellar
+    """
+
+    def __init__(
+        self,
+        cache_path: Union[str, Path] = DEFAULT_CACHE_DIR / SNAPSHOT_NAME,
+        max_age: Optional[float] = DEFAULT_MAX_AGE,
+        client: Optional[SparqlClient] = None,
+    ):
+        self.cache_path = Path(cache_path)
+        self.max_age = max_age
+        self.client = client
+        self._snapshot: Optional[dict] = None
+        self._series: Dict[tuple, pd.Series] = {}
+        self._lock = threading.Lock()
+        self._refreshing: Optional[threading.Thread] = None
+
+    @property
+    def version(self) -> str:
+        """Version (fetch time) of the snapshot in use."""
+        return self._load()["version"]
+
+    def _load(self) -> dict:
+        with self._lock:
+            if self._snapshot is None:
+                candidates = [s for s in (_read_snapshot(self.cache_path), _bundled_snapshot()) if s]
+                if candidates:
+                    self._snapshot = max(candidates, key=lambda s: s["version"])
+                else:
+                    self._snapshot = self._store(fetch_snapshot(self.client))
+            snapshot = self._snapshot
+
+        if self.max_age is not None and _snapshot_age(snapshot) > self.max_age:
+            self.refresh(background=True)
+        return snapshot
+
+    def _store(self, snapshot: dict) -> dict:
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self.cache_path.write_text(json.dumps(snapshot), encoding="utf-8")
+        except OSError:
+            pass
+        return snapshot
+
+    def refresh(self, background: bool = False) -> None:
+        """Fetch the tables from Cellar again and replace the snapshot in use.
+
+        Args:
+            background (bool, optional): Run the refresh in a daemon thread. Ignored in
+                                         the browser, where threads are not available.
+        """
+        if background and sys.platform != "emscripten":
+            with self._lock:
+                if self._refreshing is not None and self._refreshing.is_alive():
+                    return
+                self._refreshing = threading.Thread(target=self._refresh, daemon=True)
+                self._refreshing.start()
+        elif not background:
+            self._refresh()
+
+    def _refresh(self) -> None:
+        try:
+            snapshot = self._store(fetch_snapshot(self.client))
+        except Exception:
+            return
+        with self._lock:
+            self._snapshot = snapshot
+            self._series.clear()
+
+    def _table(self, scheme: str, field: str) -> pd.Series:
+        snapshot = self._load()
+        with self._lock:
+            key = (snapshot["version"], scheme, field)
+            if key not in self._series:
+                self._series[key] = pd.Series(snapshot["tables"][scheme][field], dtype=object)
+            return self._series[key]
+
+    def labels(self, scheme: str) -> pd.Series:
+        """Return the labels of a table as a Series indexed by concept URI."""
+        return self._table(scheme, "labels")
+
+    def identifiers(self, scheme: str) -> pd.Series:
+        """Return the identifiers (dc:identifier) of a table as a Series indexed by concept URI."""
+        return self._table(scheme, "identifiers")
+
+    def map(self, uris: pd.Series, scheme: str) -> pd.Series:
+        """Map a Series of concept URIs to their labels; unknown URIs become missing values."""
+        return uris.map(self.labels(scheme))
+
+    def dictionary(self, uris, scheme: str) -> "pyarrow.DictionaryArray":
+        """Map an Arrow array of concept URIs to a dictionary-encoded array of their labels.
+
+        Only the distinct URIs are looked up, and the labels are stored once each, so
+        no string is materialised per row. Unknown URIs become nulls.
+
+        Args:
+            uris (pyarrow.Array | pyarrow.ChunkedArray): Concept URIs
+            scheme (str): Table to look the labels up in, e.g. "notice-type"
+
+        Returns:
+            pyarrow.DictionaryArray: The labels, with int32 indices
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        if isinstance(uris, pa.ChunkedArray):
+            uris = uris.combine_chunks()
+        encoded = uris.dictionary_encode()
+
+        # One label per distinct URI; labels shared by several URIs are stored once
+        codes, labels = pd.factorize(self.labels(scheme).reindex(encoded.dictionary.to_pandas()))
+        indices = pc.take(pa.array(codes, type=pa.int32()), pc.cast(encoded.indices, pa.int32()))
+        indices = pc.if_else(pc.equal(indices, -1), pa.scalar(None, type=pa.int32()), indices)
+        return pa.DictionaryArray.from_arrays(indices, pa.array(labels, type=pa.string()))
+
+
+_default_store: Optional[LabelStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_label_store() -> LabelStore:
+    """Return the process-wide label store shared by all notebooks."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = LabelStore()
+        return _default_store
+
+
+if __name__ == "__main__":
+    # Write a fresh snapshot next to this module (or to the given path) for bundling
+    output = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "data" / SNAPSHOT_NAME
+    output.parent.mkdir(parents=True, exist_ok=True)
+    snapshot = fetch_snapshot()
+    output.write_text(json.dumps(snapshot, sort_keys=True, separators=(",", ":")), encoding="utf-8")
+    print(f"Wrote {sum(len(t['labels']) for t in snapshot['tables'].values())} labels to {output}")
@@ -0,0 +1,153 @@
+"""
+Timings of the queries sent to Cellar and the TED API.
+
+Every query made by SparqlClient.query and TedApiClient.search is recorded as a
+QueryProfile: how long the endpoint took to answer, how many bytes came over the
+wire, how many rows were decoded and how long decoding took, and whether the
+results came from the cache or a baked snapshot instead. The profiles are kept
+in memory for the performance panel of the apps and logged as JSON lines to the
+"ted_open_data.profiling" logger.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator, List, NamedTuple, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Number of profiles kept in memory
+MAX_PROFILES = 500
+
+
+class QueryProfile(NamedTuple):
+    """Measurements of one query.
+
+    Times are in seconds. latency is the time until the response headers arrived,
+    download the time spent reading the body, decode the time spent turning it
+    into columns. Fields that were not measured (e.g. on a cache hit) are None.
+    outcome is "snapshot" or "hit" when the results came from a baked snapshot or
+    the cache, "miss" or "uncached" when the endpoint was queried (and the results
+    cached or not), and "error" when the query failed.
+    """
+
+    source: str
+    query: str
+    started: float
+    total: float
+    outcome: str
+    latency: Optional[float] = None
+    download: Optional[float] = None
+    decode: Optional[float] = None
+    bytes: Optional[int] = None
+    rows: Optional[int] = None
+    error: Optional[str] = None
+
+
+class Profiler:
+    """Thread-safe, bounded record of QueryProfiles.
+
+    Args:
+        max_profiles (int, optional): Number of most recent profiles kept
+    """
+
+    def __init__(self, max_profiles: int = MAX_PROFILES):
+        self._profiles: deque = deque(maxlen=max_profiles)
+        self._lock = threading.Lock()
+
+    def record(self, profile: QueryProfile) -> None:
+        """Keep a profile and log it."""
+        with self._lock:
+            self._profiles.append(profile)
+        logger.info(json.dumps(profile._asdict()))
+
+    @contextmanager
+    def measure(self, source: str, query: str) -> Iterator[dict]:
+        """Measure a query, see QueryProfile for the fields the caller can fill in.
+
+        Yields a dict for the measurements of the caller. outcome defaults to "miss",
+        and is "error" when the block raises.
+        """
+        measurements: dict = {"outcome": "miss"}
+        started = time.time()
+        start = time.perf_counter()
+        try:
+            yield measurements
+        except Exception as e:
+            measurements.update(outcome="error", error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            self.record(QueryProfile(
+                source=source,
+                query=" ".join(query.split())[:200],
+                started=started,
+                total=time.perf_counter() - start,
+                **measurements,
+            ))
+
+    def profiles(self) -> List[QueryProfile]:
+        """Return the recorded profiles, oldest first."""
+        with self._lock:
+            return list(self._profiles)
+
+    def frame(self, since: Optional[float] = None) -> pd.DataFrame:
+        """Return the profiles as a DataFrame, newest first.
+
+        Args:
+            since (float, optional): Only the profiles of queries started after this time
+        """
+        profiles = [p for p in self.profiles() if since is None or p.started >= since]
+        frame = pd.DataFrame(profiles, columns=QueryProfile._fields)
+        frame["started"] = pd.to_datetime(frame["started"], unit="s")
+        return frame.iloc[::-1].reset_index(drop=True)
+
+    def summary(self, since: Optional[float] = None) -> pd.DataFrame:
+        """Return the number of queries, total time, bytes and rows per source and outcome."""
+        return (
+            self.frame(since)
+            .groupby(["source", "outcome"], as_index=False)
+            .agg(
+                queries=("query", "size"),
+                total=("total", "sum"),
+                latency=("latency", "sum"),
+                decode=("decode", "sum"),
+                bytes=("bytes", "sum"),
+                rows=("rows", "sum"),
+            )
+        )
+
+    def clear(self) -> None:
+        """Forget every profile."""
+        with self._lock:
+            self._profiles.clear()
+
+
+_default_profiler: Optional[Profiler] = None
+_default_profiler_lock = threading.Lock()
+
+
+def get_profiler() -> Profiler:
+    """Return the process-wide profiler shared by all clients."""
+    global _default_profiler
+    with _default_profiler_lock:
+        if _default_profiler is None:
+            _default_profiler = Profiler()
+        return _default_profiler
+
+
+def wire_bytes(response) -> Optional[int]:
+    """Return the number of bytes of a requests response read from the connection.
+
+    This is the compressed size for gzip/deflate encoded responses.
+    """
+    try:
+        return response.raw.tell()
+    except (AttributeError, ValueError):
+        return len(response.content) if response.content is not None else None
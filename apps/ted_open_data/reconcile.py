@@ -0,0 +1,150 @@
+"""
+Notice-by-notice reconciliation of Cellar against the TED Search API.
+
+For a period, the publication numbers published in Cellar are fetched with a
+single streamed query and those known to TED with one paginated search per day
+asking for publication numbers only, both at the same time. Comparing the two
+sets gives, per day, the notices missing on either side.
+"""
+
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Callable, NamedTuple, Optional
+
+import pandas as pd
+
+from .cache import ttl_for_dates
+from .concurrency import gather, map_concurrently
+from .sparql import do_query
+from .ted_api import MAX_PAGE_SIZE, TedApiClient, build_ted_range_query, get_ted_client
+
+CELLAR_NOTICES_QUERY = """
+PREFIX epo: <http://data.europa.eu/a4g/ontology#>
+PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+
+SELECT DISTINCT ?publicationNumber ?publicationDate ?noticeTypeUri
+WHERE {
+  GRAPH ?g {
+    ?notice a epo:Notice ;
+            epo:hasPublicationDate ?publicationDate ;
+            epo:hasNoticePublicationNumber ?publicationNumber ;
+            epo:hasNoticeType ?noticeTypeUri .
+  }
+  FILTER (?publicationDate >= "%s"^^xsd:date && ?publicationDate < "%s"^^xsd:date)
+}
+"""
+
+COLUMNS = ["publicationNumber", "publicationDate", "noticeType"]
+
+
+class Reconciliation(NamedTuple):
+    """Result of a reconciliation.
+
+    summary has one row per publication date with the number of notices in Cellar
+    and in TED and how many are missing on either side. differences lists every
+    notice found on one side only, with a "missingIn" column ("Cellar" or "TED").
+    """
+
+    summary: pd.DataFrame
+    differences: pd.DataFrame
+
+
+def cellar_notices(start: date, end: date, query: Callable[..., pd.DataFrame] = do_query) -> pd.DataFrame:
+    """Return the notices published in Cellar in [start, end), one row per publication number.
+
+    A notice found in several graphs, or with several notice types, would otherwise
+    be counted more than once and show up as missing in TED.
+    """
+    notices = query(
+        CELLAR_NOTICES_QUERY % (start.isoformat(), end.isoformat()),
+        stream=True,
+        dtypes={"publicationDate": "date"},
+        ttl=ttl_for_dates(end - timedelta(days=1)),
+    )
+    if notices.empty:
+        return pd.DataFrame(columns=COLUMNS)
+    return notices.assign(
+        noticeType=notices["noticeTypeUri"].str.rsplit("/", n=1).str[-1],
+    )[COLUMNS].drop_duplicates("publicationNumber", ignore_index=True)
+
+
+def _first(value):
+    # Some search API fields come back as lists
+    return value[0] if isinstance(value, list) and value else value
+
+
+def ted_notices(start: date, end: date, client: Optional[TedApiClient] = None) -> pd.DataFrame:
+    """Return the notices published in TED in [start, end).
+
+    Only publication numbers are requested, with the largest page size the API
+    allows, one search per day so that the day of every notice is known without
+    asking for it. The notice type of notices found in TED only is not known.
+    """
+    client = client or get_ted_client()
+
+    def day_notices(day: date) -> list:
+        query = build_ted_range_query(day, day)
+        return [
+            (_first(n.get("publication-number")), day)
+            for n in client.iter_notices(query, fields=["publication-number"], page_size=MAX_PAGE_SIZE)
+        ]
+
+    days = [start + timedelta(days=i) for i in range((end - start).days)]
+    rows = [row for notices in map_concurrently(day_notices, days) for row in notices]
+    notices = pd.DataFrame(rows, columns=["publicationNumber", "publicationDate"])
+    notices["publicationDate"] = pd.to_datetime(notices["publicationDate"])
+    notices["noticeType"] = pd.Series(None, index=notices.index, dtype=object)
+    return notices[COLUMNS].drop_duplicates("publicationNumber", ignore_index=True)
+
+
+def compare(cellar: pd.DataFrame, ted: pd.DataFrame) -> Reconciliation:
+    """Compare the notices of Cellar and TED by publication number."""
+    merged = cellar.merge(ted, on="publicationNumber", how="outer", suffixes=("Cellar", "Ted"), indicator=True)
+    merged["publicationDate"] = merged["publicationDateCellar"].fillna(merged["publicationDateTed"])
+    merged["noticeType"] = merged["noticeTypeCellar"].fillna(merged["noticeTypeTed"])
+
+    side = merged["_merge"].astype(str)
+    merged["missingIn"] = side.map({"left_only": "TED", "right_only": "Cellar"})
+
+    summary = (
+        pd.DataFrame({
+            "publicationDate": merged["publicationDate"],
+            "cellarCount": side != "right_only",
+            "tedCount": side != "left_only",
+            "missingInCellar": side == "right_only",
+            "missingInTed": side == "left_only",
+        })
+        .groupby("publicationDate", as_index=False)
+        .sum()
+    )
+
+    differences = (
+        merged.loc[merged["missingIn"].notna(), ["publicationDate", "publicationNumber", "noticeType", "missingIn"]]
+        .sort_values(["publicationDate", "publicationNumber"], ignore_index=True)
+    )
+    return Reconciliation(summary=summary, differences=differences)
+
+
+def reconcile(
+    start: date,
+    end: date,
+    query: Callable[..., pd.DataFrame] = do_query,
+    ted_client: Optional[TedApiClient] = None,
+) -> Reconciliation:
+    """Reconcile the notices published in Cellar and in TED in [start, end).
+
+    Args:
+        start (date): First publication date
+        end (date): Day after the last publication date
+        query (Callable, optional): Function running a SPARQL query, defaults to sparql.do_query
+        ted_client (TedApiClient, optional): TED API client, defaults to the shared one
+
+    Returns:
+        Reconciliation: Per-day summary and the notices missing on either side
+    """
+    fetched = gather(
+        cellar=lambda: cellar_notices(start, end, query=query),
+        ted=lambda: ted_notices(start, end, client=ted_client),
+    )
+    return compare(fetched["cellar"], fetched["ted"])
@@ -0,0 +1,135 @@
+"""
+Date-range sharding for aggregate queries.
+
+Aggregate queries over long periods hit the endpoint timeouts. Instead, the
+period is split into week or month shards, the query is run for every shard
+on a bounded worker pool and the partial GROUP BY results are merged back
+into the frame the single query would have returned.
+"""
+
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Literal, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+from .concurrency import DEFAULT_MAX_WORKERS, map_concurrently
+from .sparql import do_query
+
+Frequency = Literal["week", "month"]
+
+
+class ShardQueryError(RuntimeError):
+    """Raised by sharded_query when the query failed for some shards.
+
+    Args:
+        failed (list): (shard_start, shard_end, exception) of every failed shard
+    """
+
+    def __init__(self, failed: List[Tuple[date, date, Exception]]):
+        self.failed = failed
+        ranges = ", ".join(f"[{start}, {end}): {error}" for start, end, error in failed)
+        super().__init__(f"The query failed for {len(failed)} shard(s): {ranges}")
+
+
+def date_shards(start: date, end: date, freq: Frequency = "month") -> List[Tuple[date, date]]:
+    """Split the half-open range [start, end) into consecutive half-open shards.
+
+    Shards are aligned on Mondays (freq="week") or on the first day of the month
+    (freq="month"); the first and last shard are clipped to the range.
+
+    Args:
+        start (date): First day of the range
+        end (date): Day after the last day of the range
+        freq (str, optional): "week" or "month"
+
+    Returns:
+        list: (shard_start, shard_end) pairs covering the range
+    """
+    shards = []
+    current = start
+    while current < end:
+        if freq == "week":
+            boundary = current + timedelta(days=7 - current.weekday())
+        elif freq == "month":
+            boundary = date(current.year + current.month // 12, current.month % 12 + 1, 1)
+        else:
+            raise ValueError(f"Unknown shard frequency: {freq}")
+        shards.append((current, min(boundary, end)))
+        current = boundary
+    return shards
+
+
+def merge_partials(frames: Sequence[pd.DataFrame], keys: List[str], aggregations: Dict[str, str]) -> pd.DataFrame:
+    """Merge partial GROUP BY results, e.g. summing counts and taking min/max of dates.
+
+    Frames without columns (shards without results) add no rows.
+
+    Args:
+        frames (Sequence[pd.DataFrame]): The partial results
+        keys (list): The GROUP BY columns
+        aggregations (dict): Pandas aggregation ("sum", "min", "max", ...) per value column
+
+    Returns:
+        pd.DataFrame: One row per distinct key, sorted by the keys
+    """
+    frames = [f for f in frames if len(f.columns)]
+    if not frames:
+        return pd.DataFrame(columns=keys + list(aggregations))
+    return (
+        pd.concat(frames, ignore_index=True)
+        .groupby(keys, as_index=False, dropna=False)
+        .agg(aggregations)
+    )
+
+
+def sharded_query(
+    build_query: Callable[[date, date], str],
+    start: date,
+    end: date,
+    keys: List[str],
+    aggregations: Dict[str, str],
+    freq: Frequency = "month",
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    ttl: Union[float, None, Callable[[date], Optional[float]]] = 0,
+    query: Callable[..., pd.DataFrame] = do_query,
+    **query_kwargs,
+) -> pd.DataFrame:
+    """Run a date-filtered aggregate query shard by shard and merge the results.
+
+    Args:
+        build_query (Callable): Returns the query for a half-open range [shard_start, shard_end)
+        start (date): First day of the period
+        end (date): Day after the last day of the period
+        keys (list): The GROUP BY columns of the query
+        aggregations (dict): How to merge each value column across shards, see merge_partials
+        freq (str, optional): Shard size, "week" or "month"
+        max_workers (int, optional): Maximum number of shards queried concurrently
+        ttl (float | None | Callable, optional): Cache TTL for each shard query, or a function
+                                                 returning it for the last day of the shard
+                                                 (e.g. cache.ttl_for_dates)
+        query (Callable, optional): Function running a query, defaults to sparql.do_query
+        **query_kwargs: Passed on to query (e.g. stream, dtypes)
+
+    Returns:
+        pd.DataFrame: The merged results, with the same columns as the unsharded query
+
+    Raises:
+        ShardQueryError: When the query failed for any shard, naming their date ranges;
+                         a partial merge would silently under-count the period
+    """
+    def run(shard: Tuple[date, date]) -> Union[pd.DataFrame, Exception]:
+        shard_start, shard_end = shard
+        shard_ttl = ttl(shard_end - timedelta(days=1)) if callable(ttl) else ttl
+        try:
+            return query(build_query(shard_start, shard_end), ttl=shard_ttl, **query_kwargs)
+        except Exception as e:
+            return e
+
+    shards = date_shards(start, end, freq)
+    results = map_concurrently(run, shards, max_workers=max_workers)
+    failed = [(s, e, r) for (s, e), r in zip(shards, results) if isinstance(r, Exception)]
+    if failed:
+        raise ShardQueryError(failed)
+    return merge_partials(results, keys, aggregations)
@@ -0,0 +1,150 @@
+"""
+Query results baked into the site at build time, for a fast first paint.
+
+build.py runs every app once as a script with TED_OPEN_DATA_RECORD_SNAPSHOTS
+pointing to public/snapshots/<app>/, and every Cellar query of that run is written
+there as a Parquet file named after its cache key. In the browser the bootstrap
+cell downloads the snapshots of its app (see fetch_snapshots) before the first
+query, so the default view is answered without querying Cellar. Other dates or
+periods give other queries, which are not in the snapshot and go to Cellar.
+Results that may still change (a ttl other than None, see cache.ttl_for_dates)
+are only answered from a snapshot baked less than ttl seconds ago, so recent
+days are not frozen at the state of the build.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import pandas as pd
+
+RECORD_ENV = "TED_OPEN_DATA_RECORD_SNAPSHOTS"
+
+# Where the browser keeps the downloaded snapshots
+BROWSER_SNAPSHOT_DIR = "/tmp/ted_open_data_snapshots"
+
+
+class SnapshotStore:
+    """Query results by cache key, kept as Parquet files next to an index.
+
+    Unlike ResultCache the entries are not removed when they expire: a snapshot
+    belongs to the build of the site that shipped it. The index keeps the time every
+    entry was baked, so that get can ignore entries too old for the query.
+
+    Args:
+        directory (str | Path): Where the Parquet files and the index are kept
+        record (bool, optional): Whether the results of live queries should be added
+    """
+
+    INDEX = "index.json"
+
+    def __init__(self, directory: Union[str, Path], record: bool = False):
+        self.directory = Path(directory)
+        self.record = record
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        try:
+            self._index: Dict[str, dict] = json.loads((self.directory / self.INDEX).read_text())
+        except (OSError, ValueError):
+            self._index = {}
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.parquet"
+
+    def get(self, key: str, dtype_backend: Optional[str] = None, ttl: Optional[float] = None) -> Optional[pd.DataFrame]:
+        """Return the snapshot of a query, or None if it is not in the snapshot or too old.
+
+        Args:
+            key (str): Cache key of the query
+            dtype_backend (str, optional): "pyarrow" for pyarrow-backed columns
+            ttl (float | None, optional): How long the results of the query stay valid, in
+                                          seconds; None (results that no longer change)
+                                          accepts a snapshot of any age
+        """
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        if ttl is not None and time.time() - entry.get("baked", 0) > ttl:
+            return None
+        try:
+            kwargs = {"dtype_backend": dtype_backend} if dtype_backend else {}
+            return pd.read_parquet(self._path(key), **kwargs)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, frame: pd.DataFrame) -> None:
+        """Add the results of a query to the snapshot."""
+        with self._lock:
+            path = self._path(key)
+            frame.to_parquet(path, index=False)
+            self._index[key] = {"rows": len(frame), "size": path.stat().st_size, "baked": time.time()}
+            (self.directory / self.INDEX).write_text(json.dumps(self._index, indent=1, sort_keys=True))
+
+
+async def fetch_snapshots(url: str, directory: Union[str, Path] = BROWSER_SNAPSHOT_DIR) -> Optional[SnapshotStore]:
+    """Download the snapshots published at a URL and use them for the queries of the app.
+
+    Only meant to run in the browser (Pyodide). A missing or unreadable snapshot is not
+    an error: the app then queries Cellar as usual.
+
+    Args:
+        url (str): URL of the snapshot directory of the app, holding index.json
+        directory (str | Path, optional): Where to keep the downloaded files
+
+    Returns:
+        SnapshotStore | None: The downloaded snapshots, None if there are none
+    """
+    from pyodide.http import pyfetch
+
+    try:
+        response = await pyfetch(f"{url}/{SnapshotStore.INDEX}")
+        if not response.ok:
+            return None
+        index = await response.json()
+    except Exception:
+        return None
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    async def download(key: str) -> None:
+        response = await pyfetch(f"{url}/{key}.parquet")
+        if response.ok:
+            (directory / f"{key}.parquet").write_bytes(await response.bytes())
+
+    await asyncio.gather(*(download(key) for key in index), return_exceptions=True)
+    available = {key: entry for key, entry in index.items() if (directory / f"{key}.parquet").exists()}
+    (directory / SnapshotStore.INDEX).write_text(json.dumps(available))
+
+    store = SnapshotStore(directory)
+    set_snapshot_store(store)
+    return store
+
+
+_default_store: Optional[SnapshotStore] = None
+_default_store_lock = threading.Lock()
+
+
+def set_snapshot_store(store: Optional[SnapshotStore]) -> None:
+    """Set the snapshots used by the shared SPARQL client (see sparql.get_client)."""
+    global _default_store
+    with _default_store_lock:
+        _default_store = store
+
+
+def get_snapshot_store() -> Optional[SnapshotStore]:
+    """Return the process-wide snapshots, recording into $TED_OPEN_DATA_RECORD_SNAPSHOTS if set."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None and os.environ.get(RECORD_ENV):
+            _default_store = SnapshotStore(os.environ[RECORD_ENV], record=True)
+        return _default_store
@@ -0,0 +1,542 @@
+"""
+Pooled SPARQL client for the Cellar endpoint.
+
+A single ``requests.Session`` is shared by every query so that repeated
+queries reuse the same keep-alive connections instead of paying a new
+TCP+TLS handshake each time. Transient failures are retried with exponential
+backoff and responses are requested gzip/deflate compressed.
+
+Results are decoded column by column into typed pandas columns, using the
+``datatype`` of the bindings (xsd:date, xsd:integer, ...) to pick the dtype.
+Large SELECTs can be streamed instead: the response is then requested as
+SPARQL CSV and parsed incrementally from the socket into fixed-size chunks.
+Decoded results can be kept in a ResultCache (see cache.py) for a given TTL,
+and queries baked into the site at build time are answered from their snapshot
+(see snapshots.py). Every query is measured by a Profiler (see profiling.py).
+query_async lets async cells overlap queries, also in Pyodide, where it sends
+the request with the browser's fetch (see concurrency.gather_async).
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+from typing import Dict, Iterator, List, Literal, Optional, Tuple, Union
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .cache import ResultCache, cache_key, get_cache
+from .concurrency import RETRY_STATUSES, browser_fetch, run_blocking
+from .profiling import Profiler, get_profiler, wire_bytes
+from .snapshots import SnapshotStore, get_snapshot_store
+
+# Can be pointed to a stand-in, e.g. benchmarks/fake_endpoint.py
+SPARQL_SERVICE_URL = os.environ.get("TED_OPEN_DATA_SPARQL_URL", "https://publications.europa.eu/webapi/rdf/sparql")
+
+SPARQL_JSON = "application/sparql-results+json"
+SPARQL_CSV = "text/csv"
+
+# Number of rows per chunk when streaming results
+DEFAULT_CHUNK_SIZE = 50_000
+
+# (connect timeout, read timeout) in seconds
+DEFAULT_TIMEOUT: Tuple[float, float] = (10, 300)
+
+XSD = "http://www.w3.org/2001/XMLSchema#"
+
+# Column kinds by XSD datatype; anything else is decoded as a string
+XSD_KINDS: Dict[str, str] = {
+    **{XSD + t: "integer" for t in (
+        "integer", "int", "long", "short", "byte", "nonNegativeInteger",
+        "positiveInteger", "nonPositiveInteger", "negativeInteger",
+        "unsignedLong", "unsignedInt", "unsignedShort", "unsignedByte",
+    )},
+    **{XSD + t: "decimal" for t in ("decimal", "double", "float")},
+    XSD + "date": "date",
+    XSD + "dateTime": "dateTime",
+    XSD + "boolean": "boolean",
+}
+
+DtypeBackend = Optional[Literal["pyarrow"]]
+
+
+class SparqlClient:
+    """A SPARQL client that keeps its HTTP connections alive between queries.
+
+    Args:
+        endpoint (str): URL of the SPARQL endpoint
+        timeout (float | tuple): Timeout passed to requests, either a single value
+                                 or a (connect, read) tuple
+        retries (int): Number of retries for connection errors and 429/5xx responses
+        backoff_factor (float): Base delay for the exponential backoff between retries
+        pool_maxsize (int): Maximum number of connections kept open to the endpoint
+        cache (ResultCache, optional): Cache for query results, None disables caching
+        snapshots (SnapshotStore, optional): Results baked at build time, looked up before
+                                             the cache when not older than the ttl of the
+                                             query; live results are added when recording
+        profiler (Profiler, optional): Where the timings of the queries are recorded,
+                                       defaults to the process-wide profiler
+    """
+
+    def __init__(
+        self,
+        endpoint: str = SPARQL_SERVICE_URL,
+        timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        pool_maxsize: int = 10,
+        cache: Optional[ResultCache] = None,
+        snapshots: Optional[SnapshotStore] = None,
+        profiler: Optional[Profiler] = None,
+    ):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.cache = cache
+        self.snapshots = snapshots
+        self.profiler = profiler or get_profiler()
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({"GET", "POST"}),
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept-Encoding": "gzip, deflate",
+            "User-Agent": "Sparql Wrapper",
+        })
+
+    def _get(self, sparql_query: str, accept: str, **kwargs) -> requests.Response:
+        response = self.session.get(
+            self.endpoint,
+            params={"query": sparql_query},
+            headers={"Accept": accept},
+            timeout=self.timeout,
+            **kwargs,
+        )
+        response.raise_for_status()
+        return response
+
+    def query_json(self, sparql_query: str) -> dict:
+        """Run a query and return the parsed SPARQL JSON results document."""
+        return self._get(sparql_query, SPARQL_JSON).json()
+
+    def query(
+        self,
+        sparql_query: str,
+        dtype_backend: DtypeBackend = None,
+        stream: bool = False,
+        dtypes: Optional[Dict[str, str]] = None,
+        ttl: Optional[float] = 0,
+    ) -> pd.DataFrame:
+        """Run a query and return its results as a typed DataFrame.
+
+        By default the whole SPARQL JSON document is fetched and decoded with
+        bindings_to_frame. With stream=True the results are fetched as CSV and decoded
+        chunk by chunk (see iter_query), so the full response never exists as Python
+        dicts. CSV carries no datatypes, so pass dtypes for non-string columns.
+
+        Args:
+            sparql_query (str): The SPARQL query
+            dtype_backend (str, optional): "pyarrow" for pyarrow-backed columns
+            stream (bool, optional): Whether to stream the results as CSV. Defaults to False.
+            dtypes (dict, optional): Column kind per variable, see bindings_to_frame
+            ttl (float | None, optional): How long to cache the results, in seconds. 0 (the
+                                          default) bypasses the cache, None caches forever.
+
+        Returns:
+            pd.DataFrame: The query results
+        """
+        with self.profiler.measure("cellar", sparql_query) as measured:
+            key = cache_key(sparql_query, self.endpoint)
+            frame = self._stored(key, ttl, dtype_backend, measured)
+            if frame is None:
+                frame = self._query(sparql_query, dtype_backend, stream, dtypes, measured)
+            self._keep(key, frame, ttl, measured)
+            return frame
+
+    async def query_async(
+        self,
+        sparql_query: str,
+        dtype_backend: DtypeBackend = None,
+        stream: bool = False,
+        dtypes: Optional[Dict[str, str]] = None,
+        ttl: Optional[float] = 0,
+    ) -> pd.DataFrame:
+        """Run a query like query, without blocking the event loop while waiting for Cellar.
+
+        In Pyodide the request is sent with the browser's fetch, so the queries of
+        several coroutines are in flight at the same time (see gather_async); the
+        response is then read whole, also with stream=True. Elsewhere query runs in a
+        worker thread.
+
+        Args:
+            sparql_query (str): The SPARQL query
+            dtype_backend (str, optional): "pyarrow" for pyarrow-backed columns
+            stream (bool, optional): Whether to request the results as CSV
+            dtypes (dict, optional): Column kind per variable, see bindings_to_frame
+            ttl (float | None, optional): How long to cache the results, see query
+
+        Returns:
+            pd.DataFrame: The query results
+        """
+        if sys.platform != "emscripten":
+            return await run_blocking(lambda: self.query(sparql_query, dtype_backend, stream, dtypes, ttl))
+
+        with self.profiler.measure("cellar", sparql_query) as measured:
+            key = cache_key(sparql_query, self.endpoint)
+            frame = self._stored(key, ttl, dtype_backend, measured)
+            if frame is None:
+                frame = await self._query_async(sparql_query, dtype_backend, stream, dtypes, measured)
+            self._keep(key, frame, ttl, measured)
+            return frame
+
+    def _stored(
+        self,
+        key: str,
+        ttl: Optional[float],
+        dtype_backend: DtypeBackend,
+        measured: dict,
+    ) -> Optional[pd.DataFrame]:
+        # The results from the snapshot or the cache, None when the query has to run
+        if self.snapshots is not None:
+            frame = self.snapshots.get(key, dtype_backend=dtype_backend, ttl=ttl)
+            if frame is not None:
+                measured["outcome"] = "snapshot"
+                return frame
+        if ttl == 0 or self.cache is None:
+            measured["outcome"] = "uncached"
+            return None
+        frame = self.cache.get(key, dtype_backend=dtype_backend)
+        measured["outcome"] = "miss" if frame is None else "hit"
+        return frame
+
+    def _keep(self, key: str, frame: pd.DataFrame, ttl: Optional[float], measured: dict) -> None:
+        if measured["outcome"] == "miss":
+            self.cache.put(key, frame, ttl=ttl)
+        if self.snapshots is not None and self.snapshots.record:
+            self.snapshots.put(key, frame)
+        measured["rows"] = len(frame)
+
+    def _query(
+        self,
+        sparql_query: str,
+        dtype_backend: DtypeBackend,
+        stream: bool,
+        dtypes: Optional[Dict[str, str]],
+        measured: dict,
+    ) -> pd.DataFrame:
+        start = time.perf_counter()
+        if not stream:
+            response = self._get(sparql_query, SPARQL_JSON)
+            response.content  # read the body
+            measured["latency"] = response.elapsed.total_seconds()
+            measured["download"] = time.perf_counter() - start - measured["latency"]
+            measured["bytes"] = wire_bytes(response)
+
+            start = time.perf_counter()
+            frame = bindings_to_frame(response.json(), dtype_backend=dtype_backend, dtypes=dtypes)
+            measured["decode"] = time.perf_counter() - start
+            return frame
+
+        chunks = list(self._iter_query(sparql_query, DEFAULT_CHUNK_SIZE, dtypes or {}, dtype_backend, False, measured))
+        frame = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+        measured["download"] = time.perf_counter() - start - measured["latency"] - measured["decode"]
+        return frame
+
+    async def _query_async(
+        self,
+        sparql_query: str,
+        dtype_backend: DtypeBackend,
+        stream: bool,
+        dtypes: Optional[Dict[str, str]],
+        measured: dict,
+    ) -> pd.DataFrame:
+        start = time.perf_counter()
+        response = await browser_fetch(
+            f"{self.endpoint}?{urlencode({'query': sparql_query})}",
+            retries=self.retries,
+            backoff_factor=self.backoff_factor,
+            headers={"Accept": SPARQL_CSV if stream else SPARQL_JSON},
+        )
+        measured["latency"] = time.perf_counter() - start
+        if not response.ok:
+            raise requests.HTTPError(f"{response.status} {response.status_text} for url: {self.endpoint}")
+        body = await response.bytes()
+        # The browser has already decompressed the body, so this is its decoded size
+        measured.update(download=time.perf_counter() - start - measured["latency"], bytes=len(body))
+
+        start = time.perf_counter()
+        if not stream:
+            frame = bindings_to_frame(json.loads(body), dtype_backend=dtype_backend, dtypes=dtypes)
+        else:
+            reader = csv.reader(io.StringIO(body.decode("utf-8"), newline=""))
+            header = next(reader, [])
+            chunks = []
+            while True:
+                rows = list(itertools.islice(reader, DEFAULT_CHUNK_SIZE))
+                if rows or not chunks:
+                    chunks.append(_rows_to_chunk(header, rows, dtypes or {}, dtype_backend, False))
+                if len(rows) < DEFAULT_CHUNK_SIZE:
+                    break
+            frame = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+        measured["decode"] = time.perf_counter() - start
+        return frame
+
+    def iter_query(
+        self,
+        sparql_query: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        dtypes: Optional[Dict[str, str]] = None,
+        dtype_backend: DtypeBackend = None,
+        as_arrow: bool = False,
+    ) -> Iterator[Union[pd.DataFrame, "pyarrow.RecordBatch"]]:
+        """Stream the results of a query in chunks of at most chunk_size rows.
+
+        The results are requested as SPARQL CSV and parsed incrementally while they
+        are read from the connection, so memory use depends on chunk_size and not on
+        the number of rows returned. Empty CSV fields are decoded as missing values.
+        At least one (possibly empty) chunk is always yielded.
+
+        Args:
+            sparql_query (str): The SPARQL query
+            chunk_size (int, optional): Maximum number of rows per chunk
+            dtypes (dict, optional): Column kind per variable ("integer", "decimal", "date",
+                                     "dateTime", "boolean"); other columns are strings
+            dtype_backend (str, optional): "pyarrow" for pyarrow-backed DataFrame chunks
+            as_arrow (bool, optional): Yield pyarrow RecordBatches instead of DataFrames
+
+        Yields:
+            pd.DataFrame | pyarrow.RecordBatch: The next chunk of results
+        """
+        return self._iter_query(sparql_query, chunk_size, dtypes or {}, dtype_backend, as_arrow, {})
+
+    def _iter_query(
+        self,
+        sparql_query: str,
+        chunk_size: int,
+        dtypes: Dict[str, str],
+        dtype_backend: DtypeBackend,
+        as_arrow: bool,
+        measured: dict,
+    ) -> Iterator[Union[pd.DataFrame, "pyarrow.RecordBatch"]]:
+        decode = 0.0
+
+        def to_chunk(rows: List[List[str]]) -> Union[pd.DataFrame, "pyarrow.RecordBatch"]:
+            nonlocal decode
+            start = time.perf_counter()
+            chunk = _rows_to_chunk(header, rows, dtypes, dtype_backend, as_arrow)
+            decode += time.perf_counter() - start
+            return chunk
+
+        with self._get(sparql_query, SPARQL_CSV, stream=True) as response:
+            measured["latency"] = response.elapsed.total_seconds()
+            response.raw.decode_content = True
+            response.raw.auto_close = False  # let TextIOWrapper see EOF instead of a closed file
+            reader = csv.reader(io.TextIOWrapper(response.raw, encoding="utf-8", newline=""))
+            header = next(reader, [])
+
+            rows: List[List[str]] = []
+            yielded = False
+            for row in reader:
+                rows.append(row)
+                if len(rows) == chunk_size:
+                    yield to_chunk(rows)
+                    yielded = True
+                    rows = []
+
+            if rows or not yielded:
+                yield to_chunk(rows)
+
+            measured.update(bytes=wire_bytes(response), decode=decode)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def bindings_to_frame(
+    result: dict,
+    dtype_backend: DtypeBackend = None,
+    dtypes: Optional[Dict[str, str]] = None,
+) -> pd.DataFrame:
+    """Convert a SPARQL JSON results document to a typed DataFrame.
+
+    Every variable of the result becomes one column, built in a single pass over
+    the bindings. Unbound (OPTIONAL) variables become missing values. The column
+    dtype follows the datatype of the bindings: xsd integers become int64 (Int64
+    when values are missing), xsd decimals float64, xsd:date and xsd:dateTime
+    datetime64 and everything else strings.
+
+    Args:
+        result (dict): Parsed SPARQL JSON results document
+        dtype_backend (str, optional): "pyarrow" to return pyarrow-backed columns,
+                                       None for numpy-backed columns
+        dtypes (dict, optional): Column kind ("integer", "decimal", "date", "dateTime",
+                                 "boolean" or "string") per variable, overriding the
+                                 datatype found in the bindings
+
+    Returns:
+        pd.DataFrame: One column per variable, in the order of the result head
+    """
+    bindings = result["results"]["bindings"]
+    variables = result["head"].get("vars") or list(dict.fromkeys(v for b in bindings for v in b))
+    dtypes = dtypes or {}
+
+    columns = {}
+    for var in variables:
+        cells = [b.get(var) for b in bindings]
+        values = [None if c is None else c["value"] for c in cells]
+        kind = dtypes.get(var)
+        if kind is None:
+            datatype = next((c.get("datatype") for c in cells if c is not None), None)
+            kind = XSD_KINDS.get(datatype, "string")
+        columns[var] = decode_column(values, kind, dtype_backend)
+
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(bindings)))
+
+
+def decode_column(values: List[Optional[str]], kind: str, dtype_backend: DtypeBackend = None) -> pd.Series:
+    """Decode the lexical values of one result column to a typed Series.
+
+    Args:
+        values (list): Lexical values, None for unbound values
+        kind (str): Column kind, one of the values of XSD_KINDS or "string"
+        dtype_backend (str, optional): "pyarrow" for a pyarrow-backed Series
+
+    Returns:
+        pd.Series: The decoded column
+    """
+    if dtype_backend == "pyarrow":
+        return _decode_column_arrow(values, kind)
+
+    if kind == "integer":
+        numbers = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce")
+        return numbers.astype("Int64" if numbers.isna().any() else "int64")
+    if kind == "decimal":
+        return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").astype("float64")
+    if kind == "date":
+        # xsd:date may carry a timezone ("2024-01-31+01:00"), keep the calendar date only
+        days = [None if v is None else v[:10] for v in values]
+        return pd.Series(pd.to_datetime(days, format="%Y-%m-%d", errors="coerce"))
+    if kind == "dateTime":
+        try:
+            return pd.Series(pd.to_datetime(values, format="ISO8601", errors="coerce"))
+        except ValueError:
+            # Mixed timezone offsets, normalise to UTC
+            return pd.Series(pd.to_datetime(values, format="ISO8601", errors="coerce", utc=True))
+    if kind == "boolean":
+        return pd.Series([None if v is None else v in ("true", "1") for v in values], dtype="boolean")
+    return pd.Series(values, dtype=object)
+
+
+def _decode_column_arrow(values: List[Optional[str]], kind: str) -> pd.Series:
+    return pd.Series(pd.arrays.ArrowExtensionArray(_decode_array(values, kind)))
+
+
+def _decode_array(values: List[Optional[str]], kind: str) -> "pyarrow.Array":
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    array = pa.array(values, type=pa.string())
+    if kind == "integer":
+        array = pc.cast(array, pa.int64())
+    elif kind == "decimal":
+        array = pc.cast(array, pa.float64())
+    elif kind == "date":
+        array = pc.strptime(pc.utf8_slice_codeunits(array, 0, 10), format="%Y-%m-%d", unit="s")
+    elif kind == "dateTime":
+        try:
+            array = pc.cast(array, pa.timestamp("us"))
+        except pa.ArrowInvalid:
+            array = pc.cast(array, pa.timestamp("us", tz="UTC"))
+    elif kind == "boolean":
+        array = pc.is_in(array, value_set=pa.array(["true", "1"]))
+    return array
+
+
+def _rows_to_chunk(
+    header: List[str],
+    rows: List[List[str]],
+    dtypes: Dict[str, str],
+    dtype_backend: DtypeBackend,
+    as_arrow: bool,
+) -> Union[pd.DataFrame, "pyarrow.RecordBatch"]:
+    # Transpose the CSV rows to columns; empty fields are unbound values
+    columns = list(zip(*rows)) if rows else [()] * len(header)
+    values = {
+        var: [v if v != "" else None for v in column]
+        for var, column in zip(header, columns)
+    }
+
+    if as_arrow:
+        import pyarrow as pa
+
+        return pa.RecordBatch.from_arrays(
+            [_decode_array(values[var], dtypes.get(var, "string")) for var in header],
+            names=header,
+        )
+
+    return pd.DataFrame(
+        {var: decode_column(values[var], dtypes.get(var, "string"), dtype_backend) for var in header},
+        index=pd.RangeIndex(len(rows)),
+    )
+
+
+_default_client: Optional[SparqlClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_client() -> SparqlClient:
+    """Return the process-wide client shared by all notebooks."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = SparqlClient(cache=get_cache(), snapshots=get_snapshot_store())
+        return _default_client
+
+
+def do_query(
+    sparql_query: str,
+    dtype_backend: DtypeBackend = None,
+    stream: bool = False,
+    dtypes: Optional[Dict[str, str]] = None,
+    ttl: Optional[float] = 0,
+) -> pd.DataFrame:
+    """Run a query against Cellar with the shared client, see SparqlClient.query."""
+    return get_client().query(sparql_query, dtype_backend=dtype_backend, stream=stream, dtypes=dtypes, ttl=ttl)
+
+
+async def do_query_async(
+    sparql_query: str,
+    dtype_backend: DtypeBackend = None,
+    stream: bool = False,
+    dtypes: Optional[Dict[str, str]] = None,
+    ttl: Optional[float] = 0,
+) -> pd.DataFrame:
+    """Run a query against Cellar with the shared client, see SparqlClient.query_async."""
+    return await get_client().query_async(
+        sparql_query, dtype_backend=dtype_backend, stream=stream, dtypes=dtypes, ttl=ttl
+    )
+
+
+def iter_query(sparql_query: str, **kwargs) -> Iterator[Union[pd.DataFrame, "pyarrow.RecordBatch"]]:
+    """Stream the results of a query with the shared client, see SparqlClient.iter_query."""
+    return get_client().iter_query(sparql_query, **kwargs)
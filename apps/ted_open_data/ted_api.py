@@ -0,0 +1,267 @@
+"""
+Pooled client for the TED Search API (v3).
+
+Like the SPARQL client, every call goes through one ``requests.Session`` so
+that connections are kept alive. Rate limiting (HTTP 429) and transient
+server errors are retried, honouring the Retry-After header. Every search
+request is measured by a Profiler (see profiling.py). search_async and
+count_async let async cells overlap requests, also in Pyodide, where they use
+the browser's fetch (see concurrency.gather_async).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+import datetime
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .concurrency import RETRY_STATUSES, browser_fetch, run_blocking
+from .profiling import Profiler, get_profiler, wire_bytes
+
+# Can be pointed to a stand-in, e.g. benchmarks/fake_endpoint.py
+TED_API_URL = os.environ.get("TED_OPEN_DATA_TED_API_URL", "https://api.acceptance.ted.europa.eu/v3/notices/search")
+
+# (connect timeout, read timeout) in seconds
+DEFAULT_TIMEOUT: Tuple[float, float] = (10, 120)
+
+# Largest page the search API returns
+MAX_PAGE_SIZE = 250
+
+
+def build_ted_query(date: str, notice_types: Optional[Sequence[str]] = None) -> str:
+    """Build an expert query for the notices published on a date (YYYY-MM-DD).
+
+    Args:
+        date (str): Publication date in ISO format
+        notice_types (Sequence[str], optional): Only match these notice types
+
+    Returns:
+        str: The query string
+    """
+    date_formatted = date.replace("-", "")
+    # Base condition
+    conditions = [f"publication-date = {date_formatted}"]
+
+    # Add notice type filter if provided
+    if notice_types:
+        type_conditions = [f"notice-type = {nt}" for nt in notice_types]
+        conditions.append("(" + " or ".join(type_conditions) + ")")
+
+    return " and ".join(conditions)
+
+
+def build_ted_range_query(
+    first_day: datetime.date,
+    last_day: datetime.date,
+    notice_types: Optional[Sequence[str]] = None,
+) -> str:
+    """Build an expert query for the notices published between two dates, both included.
+
+    Args:
+        first_day (date): First publication date
+        last_day (date): Last publication date
+        notice_types (Sequence[str], optional): Only match these notice types
+
+    Returns:
+        str: The query string
+    """
+    conditions = [
+        f"publication-date >= {first_day.strftime('%Y%m%d')}",
+        f"publication-date <= {last_day.strftime('%Y%m%d')}",
+    ]
+    if notice_types:
+        conditions.append("(" + " or ".join(f"notice-type = {nt}" for nt in notice_types) + ")")
+    return " and ".join(conditions)
+
+
+class TedApiClient:
+    """A TED Search API client that keeps its HTTP connections alive between calls.
+
+    Args:
+        url (str): URL of the notice search endpoint
+        timeout (float | tuple): Timeout passed to requests, either a single value
+                                 or a (connect, read) tuple
+        retries (int): Number of retries for connection errors and 429/5xx responses
+        backoff_factor (float): Base delay for the exponential backoff between retries
+        pool_maxsize (int): Maximum number of connections kept open to the API
+        profiler (Profiler, optional): Where the timings of the requests are recorded,
+                                       defaults to the process-wide profiler
+    """
+
+    def __init__(
+        self,
+        url: str = TED_API_URL,
+        timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT,
+        retries: int = 5,
+        backoff_factor: float = 1.0,
+        pool_maxsize: int = 10,
+        profiler: Optional[Profiler] = None,
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.profiler = profiler or get_profiler()
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({"POST"}),
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+        })
+
+    def search(self, query: str, fields: List[str], limit: int = MAX_PAGE_SIZE, scope: str = "ALL", **body) -> dict:
+        """Run one search request and return the decoded response.
+
+        Args:
+            query (str): Expert query, see build_ted_query
+            fields (list): Notice fields to return
+            limit (int, optional): Page size
+            scope (str, optional): "ALL", "ACTIVE" or "LATEST"
+            **body: Other request body members (page, paginationMode, iterationNextToken, ...)
+
+        Returns:
+            dict: The response, with "notices" and "totalNoticeCount"
+        """
+        request_body = {"query": query, "fields": fields, "limit": limit, "scope": scope, **body}
+        with self.profiler.measure("ted", query) as measured:
+            start = time.perf_counter()
+            response = self.session.post(self.url, json=request_body, timeout=self.timeout)
+            response.raise_for_status()
+            response.content  # read the body
+            measured.update(
+                outcome="uncached",
+                latency=response.elapsed.total_seconds(),
+                download=time.perf_counter() - start - response.elapsed.total_seconds(),
+                bytes=wire_bytes(response),
+            )
+
+            start = time.perf_counter()
+            result = response.json()
+            measured.update(decode=time.perf_counter() - start, rows=len(result.get("notices", [])))
+            return result
+
+    async def search_async(
+        self,
+        query: str,
+        fields: List[str],
+        limit: int = MAX_PAGE_SIZE,
+        scope: str = "ALL",
+        **body,
+    ) -> dict:
+        """Run one search request like search, without blocking the event loop.
+
+        In Pyodide the request is sent with the browser's fetch, so the requests of
+        several coroutines are in flight at the same time; elsewhere search runs in a
+        worker thread.
+        """
+        if sys.platform != "emscripten":
+            return await run_blocking(lambda: self.search(query, fields, limit, scope, **body))
+
+        request_body = {"query": query, "fields": fields, "limit": limit, "scope": scope, **body}
+        with self.profiler.measure("ted", query) as measured:
+            start = time.perf_counter()
+            response = await browser_fetch(
+                self.url,
+                retries=self.retries,
+                backoff_factor=self.backoff_factor,
+                method="POST",
+                headers={"Accept": "application/json", "Content-Type": "application/json"},
+                body=json.dumps(request_body),
+            )
+            latency = time.perf_counter() - start
+            if not response.ok:
+                raise requests.HTTPError(f"{response.status} {response.status_text} for url: {self.url}")
+            content = await response.bytes()
+            measured.update(
+                outcome="uncached",
+                latency=latency,
+                download=time.perf_counter() - start - latency,
+                bytes=len(content),
+            )
+
+            start = time.perf_counter()
+            result = json.loads(content)
+            measured.update(decode=time.perf_counter() - start, rows=len(result.get("notices", [])))
+            return result
+
+    def count(self, query: str, scope: str = "ALL") -> int:
+        """Return the number of notices matching a query, fetching a single one-field notice."""
+        return self.search(query, fields=["publication-number"], limit=1, scope=scope)["totalNoticeCount"]
+
+    async def count_async(self, query: str, scope: str = "ALL") -> int:
+        """Return the number of notices matching a query like count, without blocking the event loop."""
+        result = await self.search_async(query, fields=["publication-number"], limit=1, scope=scope)
+        return result["totalNoticeCount"]
+
+    def iter_notices(
+        self,
+        query: str,
+        fields: List[str],
+        page_size: int = MAX_PAGE_SIZE,
+        scope: str = "ALL",
+    ) -> Iterator[dict]:
+        """Stream all notices matching a query, page by page.
+
+        Uses the API's iteration pagination, so the number of notices is not limited
+        by the page-number window of the API.
+
+        Args:
+            query (str): Expert query, see build_ted_query
+            fields (list): Notice fields to return
+            page_size (int, optional): Number of notices per request
+            scope (str, optional): "ALL", "ACTIVE" or "LATEST"
+
+        Yields:
+            dict: The next notice
+        """
+        token = None
+        while True:
+            page = self.search(
+                query,
+                fields=fields,
+                limit=page_size,
+                scope=scope,
+                paginationMode="ITERATION",
+                iterationNextToken=token,
+            )
+            notices = page.get("notices", [])
+            yield from notices
+
+            token = page.get("iterationNextToken")
+            if not notices or not token:
+                return
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_default_client: Optional[TedApiClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_ted_client() -> TedApiClient:
+    """Return the process-wide TED API client shared by all notebooks."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = TedApiClient()
+        return _default_client
@@ -0,0 +1,456 @@
+# /// script
+# requires-python = ">=3.9"
+# dependencies = [
+#     "fire==0.7.0",
+#     "pandas",
+#     "pyarrow",
+# ]
+# ///
+
+"""
+Offline stand-in for the Cellar SPARQL endpoint and the TED Search API.
+
+The server answers the queries of the apps without network access, so that the
+query layer, the caches and the notebook cells can be benchmarked reproducibly.
+SPARQL queries are not evaluated: the projected variables, the GROUP BY clause
+and the date filters of a query are enough to generate plausible, deterministic
+results for it. Row-level queries return --notices notices per day in the filtered
+range; aggregated queries return one row per day and group. Results recorded by
+the build (public/snapshots/<app>/, see ted_open_data/snapshots.py) can be replayed
+instead with --fixtures.
+
+Both SPARQL JSON and CSV are served, gzip compressed when asked for, with an
+optional latency before each response. POST /ted answers TED Search API requests
+with the same publication numbers as Cellar, minus a --missing fraction.
+
+Usage:
+    uv run benchmarks/fake_endpoint.py --notices 100000 --latency 0.2
+    TED_OPEN_DATA_SPARQL_URL=http://127.0.0.1:8890/sparql \\
+    TED_OPEN_DATA_TED_API_URL=http://127.0.0.1:8890/ted \\
+        uvx marimo run --sandbox apps/01-cellar-daily.py
+"""
+
+import contextlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import fire
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "apps"))
+
+from ted_open_data.cache import cache_key  # noqa: E402
+from ted_open_data.snapshots import SnapshotStore  # noqa: E402
+
+# Endpoint the fixtures were recorded against, part of their cache key
+CELLAR_URL = "https://publications.europa.eu/webapi/rdf/sparql"
+
+AUTHORITY = "http://publications.europa.eu/resource/authority/"
+XSD = "http://www.w3.org/2001/XMLSchema#"
+
+NOTICE_TYPES = [
+    "cn-standard", "can-standard", "pin-only", "cn-social", "can-social",
+    "veat", "can-modif", "corr", "pin-buyer", "subco",
+]
+FORM_TYPES = ["competition", "result", "planning", "change", "dir-awa-pre", "cont-modif"]
+PROCEDURE_TYPES = {
+    "open": "Open procedure",
+    "restricted": "Restricted procedure",
+    "neg-w-call": "Negotiated with prior publication of a call for competition / competitive with negotiation",
+    "neg-wo-call": "Negotiated without prior call for competition",
+    "comp-dial": "Competitive dialogue",
+    "innovation": "Innovation partnership",
+    "oth-single": "Other single stage procedure",
+}
+COUNTRIES = [
+    "AUT", "BEL", "BGR", "HRV", "CYP", "CZE", "DNK", "EST", "FIN", "FRA", "DEU",
+    "GRC", "HUN", "ISL", "IRL", "ITA", "LVA", "LTU", "LUX", "MLT", "NLD", "NOR",
+    "POL", "PRT", "ROU", "SVK", "SVN", "ESP", "SWE", "CHE",
+]
+# Buyers of the per-buyer aggregates
+BUYERS = [f"Contracting authority {i}" for i in range(1, 21)]
+
+# Rows are written to the connection in batches of this size
+BATCH_ROWS = 10_000
+
+SELECT_RE = re.compile(r"\bSELECT\s+(?:DISTINCT\s+|REDUCED\s+)?(.*?)\s*(?:FROM\b|WHERE\b|\{)", re.S | re.I)
+PROJECTION_RE = re.compile(r"\((?:[^()]|\([^()]*\))*?\bAS\s+\?(\w+)\s*\)|\?(\w+)", re.I)
+GROUP_BY_RE = re.compile(r"\bGROUP\s+BY\s+((?:\?\w+\s*)+)", re.I)
+DATE_RE = re.compile(r'"(\d{4}-\d{2}-\d{2})(?:T[\d:.]+Z?)?"\^\^xsd:date(?:Time)?')
+TED_DATE_RE = re.compile(r"publication-date\s*(>=|<=|=)\s*(\d{8})")
+TED_TYPES_RE = re.compile(r"notice-type\s*=\s*([\w-]+)")
+
+
+def _pick(options: list, *key) -> object:
+    """Deterministically pick one of the options for a key."""
+    return options[zlib.crc32(repr(key).encode()) % len(options)]
+
+
+def _number(day: date, index: int) -> str:
+    """Publication number of the index-th notice of a day, shared by Cellar and TED."""
+    return f"{day.timetuple().tm_yday * 1_000_000 + index:08d}-{day.year}"
+
+
+def projection(query: str) -> List[str]:
+    """Return the variables projected by a SELECT query, in order."""
+    match = SELECT_RE.search(query)
+    if not match:
+        return []
+    return [m.group(1) or m.group(2) for m in PROJECTION_RE.finditer(match.group(1))]
+
+
+def filtered_days(query: str, default_days: int = 7) -> List[date]:
+    """Return the days a query is filtered on.
+
+    One date literal is a single day, two are a half-open [start, end) range. Queries
+    without dates cover the last default_days days.
+    """
+    dates = sorted(date.fromisoformat(d) for d in DATE_RE.findall(query))
+    if not dates:
+        end = date.today()
+        start = end - timedelta(days=default_days)
+    elif len(dates) == 1 or dates[0] == dates[-1]:
+        start, end = dates[0], dates[0] + timedelta(days=1)
+    else:
+        start, end = dates[0], dates[-1]
+    return [start + timedelta(days=i) for i in range((end - start).days)]
+
+
+class SyntheticData:
+    """Generates deterministic ePO/CDM-like results for the queries of the apps.
+
+    Args:
+        notices (int): Number of notices published per day
+        missing (float): Fraction of the Cellar notices the TED API does not know
+    """
+
+    def __init__(self, notices: int = 1_000, missing: float = 0.0):
+        self.notices = notices
+        self.missing = missing
+
+    def value(self, var: str, day: date, index: int, choice: Optional[str] = None) -> Tuple[str, Optional[str]]:
+        """Return the (value, kind) of a variable for one notice.
+
+        kind is "uri", "date", "integer" or None for plain literals. choice forces the
+        code of coded variables (notice type, country, ...), e.g. for GROUP BY keys.
+        """
+        name = var.lower()
+        if name == "publicationnumber":
+            return _number(day, index), None
+        if name == "noticetypeuri":
+            return AUTHORITY + "notice-type/" + (choice or _pick(NOTICE_TYPES, day, index)), "uri"
+        if name == "formtypeuri":
+            return AUTHORITY + "form-type/" + (choice or _pick(FORM_TYPES, day, index)), "uri"
+        if name == "proceduretypeuri":
+            code = choice or _pick(list(PROCEDURE_TYPES), day, index)
+            return AUTHORITY + "procurement-procedure-type/" + code, "uri"
+        if name == "proceduretype":
+            return PROCEDURE_TYPES[choice or _pick(list(PROCEDURE_TYPES), day, index)], None
+        if name == "countryuri":
+            return AUTHORITY + "country/" + (choice or _pick(COUNTRIES, day, index)), "uri"
+        if name == "country":
+            return (choice or _pick(COUNTRIES, day, index)), None
+        if name == "legalname":
+            return choice or f"Contracting authority {_pick(range(1, 5001), day, index)}", None
+        if name.startswith("min") and "date" in name:
+            return (day - timedelta(days=_pick(range(1, 60), var, day))).isoformat(), "date"
+        if "date" in name:
+            return day.isoformat(), "date"
+        if "count" in name:
+            return str(_pick(range(1, max(2, self.notices // 5)), var, day, index)), "integer"
+        if name.endswith("uri") or name == "uri":
+            return f"http://example.org/{var}/{index}", "uri"
+        return f"{var} {index}", None
+
+    def rows(self, query: str) -> Tuple[List[str], Iterator[List[Tuple[str, Optional[str]]]]]:
+        """Return the variables and the rows of results of a query."""
+        variables = projection(query)
+        days = filtered_days(query)
+
+        if variables == ["scheme", "uri", "label", "identifier"]:
+            return variables, self._labels()
+
+        group_by = GROUP_BY_RE.search(query)
+        if group_by:
+            keys = re.findall(r"\?(\w+)", group_by.group(1))
+            return variables, self._groups(variables, keys, days)
+
+        def notices():
+            for day in days:
+                for index in range(self.notices):
+                    yield [self.value(var, day, index) for var in variables]
+        return variables, notices()
+
+    def _groups(self, variables: List[str], keys: List[str], days: List[date]):
+        # One row per day for date keys, times the possible values of the other keys
+        groups = {
+            "noticetypeuri": NOTICE_TYPES,
+            "formtypeuri": FORM_TYPES,
+            "proceduretypeuri": list(PROCEDURE_TYPES),
+            "country": COUNTRIES,
+            "countryuri": COUNTRIES,
+            "legalname": BUYERS,
+        }
+        others = [key for key in keys if "date" not in key.lower()]
+        combinations = [{}]
+        for key in others:
+            combinations = [{**c, key: v} for c in combinations for v in groups.get(key.lower(), [None])]
+
+        for day in days:
+            for index, combination in enumerate(combinations):
+                yield [self.value(var, day, index, combination.get(var)) for var in variables]
+
+    def _labels(self):
+        tables = {
+            "notice-type": {code: code.replace("-", " ").capitalize() for code in NOTICE_TYPES},
+            "form-type": {code: code.replace("-", " ").capitalize() for code in FORM_TYPES},
+            "procurement-procedure-type": PROCEDURE_TYPES,
+            "country": {code: code for code in COUNTRIES},
+        }
+        for scheme, labels in tables.items():
+            for code, label in labels.items():
+                yield [
+                    (AUTHORITY + scheme, "uri"),
+                    (f"{AUTHORITY}{scheme}/{code}", "uri"),
+                    (label, None),
+                    (code, None),
+                ]
+
+    def ted_search(self, request: dict) -> dict:
+        """Answer a TED Search API request with the notices of the days it is filtered on."""
+        query = request.get("query", "")
+        bounds = {op: datetime.strptime(d, "%Y%m%d").date() for op, d in TED_DATE_RE.findall(query)}
+        first = bounds.get("=", bounds.get(">=", date.today()))
+        last = bounds.get("=", bounds.get("<=", first))
+        types = set(TED_TYPES_RE.findall(query))
+
+        def known(day: date, index: int) -> bool:
+            if types and _pick(NOTICE_TYPES, day, index) not in types:
+                return False
+            return zlib.crc32(f"ted:{day}:{index}".encode()) % 10_000 >= self.missing * 10_000
+
+        days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        matching = [(day, index) for day in days for index in range(self.notices) if known(day, index)]
+
+        offset = int(request.get("iterationNextToken") or 0)
+        limit = int(request.get("limit", 250))
+        page = matching[offset:offset + limit]
+        notices = [
+            {
+                "publication-number": _number(day, index),
+                "publication-date": f"{day.isoformat()}+01:00",
+                "notice-type": _pick(NOTICE_TYPES, day, index),
+            }
+            for day, index in page
+        ]
+        response = {"notices": notices, "totalNoticeCount": len(matching)}
+        if request.get("paginationMode") == "ITERATION" and offset + limit < len(matching):
+            response["iterationNextToken"] = str(offset + limit)
+        return response
+
+
+def _json_term(value: str, kind: Optional[str]) -> dict:
+    if kind == "uri":
+        return {"type": "uri", "value": value}
+    if kind in ("date", "integer"):
+        return {"type": "typed-literal", "datatype": XSD + kind, "value": value}
+    return {"type": "literal", "value": value}
+
+
+def _csv_field(value: str) -> str:
+    if any(c in value for c in ',"\n\r'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def serialise(variables: List[str], rows, csv: bool) -> Iterator[bytes]:
+    """Serialise rows of (value, kind) as SPARQL CSV or JSON, batch by batch."""
+    batch: List[str] = []
+
+    if csv:
+        yield (",".join(variables) + "\r\n").encode()
+        for row in rows:
+            batch.append(",".join(_csv_field(value) for value, _ in row) + "\r\n")
+            if len(batch) == BATCH_ROWS:
+                yield "".join(batch).encode()
+                batch = []
+        yield "".join(batch).encode()
+        return
+
+    yield ('{"head": {"vars": ' + json.dumps(variables) + '}, "results": {"bindings": [').encode()
+    first = True
+    for row in rows:
+        binding = {var: _json_term(value, kind) for var, (value, kind) in zip(variables, row) if value is not None}
+        batch.append(("" if first else ",") + json.dumps(binding))
+        first = False
+        if len(batch) == BATCH_ROWS:
+            yield "".join(batch).encode()
+            batch = []
+    yield ("".join(batch) + "]}}").encode()
+
+
+def _frame_rows(frame) -> Iterator[List[Tuple[Optional[str], Optional[str]]]]:
+    # Replay a recorded frame: URIs are recognised by their scheme, dates by their type
+    kinds = {}
+    for column in frame.columns:
+        if "date" in str(frame[column].dtype) or "datetime" in str(frame[column].dtype):
+            kinds[column] = "date"
+        elif "int" in str(frame[column].dtype).lower():
+            kinds[column] = "integer"
+    for record in frame.itertuples(index=False):
+        row = []
+        for column, value in zip(frame.columns, record):
+            if value is None or value != value:
+                row.append((None, None))
+            elif kinds.get(column) == "date":
+                row.append((str(value)[:10], "date"))
+            elif isinstance(value, str) and value.startswith("http"):
+                row.append((value, "uri"))
+            else:
+                row.append((str(value), kinds.get(column)))
+        yield row
+
+
+def make_handler(data: SyntheticData, latency: float, jitter: float, fixtures: Optional[SnapshotStore]):
+    """Return a request handler class serving the given data."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _wait(self):
+            if latency or jitter:
+                time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+        def _send(self, content_type: str, chunks: Iterator[bytes]):
+            compress = "gzip" in self.headers.get("Accept-Encoding", "")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Transfer-Encoding", "chunked")
+            if compress:
+                self.send_header("Content-Encoding", "gzip")
+            self.end_headers()
+
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+            for chunk in chunks:
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    self.wfile.write(b"%X\r\n%s\r\n" % (len(chunk), chunk))
+            if compressor:
+                tail = compressor.flush()
+                self.wfile.write(b"%X\r\n%s\r\n" % (len(tail), tail))
+            self.wfile.write(b"0\r\n\r\n")
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query).get("query", [""])[0]
+            if not query:
+                self.send_error(400, "Missing query parameter")
+                return
+
+            self._wait()
+            csv = "csv" in self.headers.get("Accept", "")
+            frame = fixtures.get(cache_key(query, CELLAR_URL)) if fixtures is not None else None
+            if frame is not None:
+                variables, rows = list(frame.columns), _frame_rows(frame)
+            else:
+                variables, rows = data.rows(query)
+
+            content_type = "text/csv" if csv else "application/sparql-results+json"
+            self._send(content_type, serialise(variables, rows, csv=csv))
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self._wait()
+            response = json.dumps(data.ted_search(json.loads(body or b"{}"))).encode()
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                self._send("application/json", iter([response]))
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+
+    return Handler
+
+
+def make_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    notices: int = 1_000,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    missing: float = 0.0,
+    fixtures: Optional[str] = None,
+) -> ThreadingHTTPServer:
+    """Create the server, see main for the arguments. Port 0 picks a free port."""
+    store = SnapshotStore(fixtures) if fixtures else None
+    handler = make_handler(SyntheticData(notices, missing), latency, jitter, store)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+@contextlib.contextmanager
+def running(**kwargs) -> Iterator[Dict[str, str]]:
+    """Run a server in a background thread, see make_server for the arguments.
+
+    Yields:
+        dict: The "sparql" and "ted" URLs of the server
+    """
+    server = make_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    try:
+        yield {"sparql": f"http://{host}:{port}/sparql", "ted": f"http://{host}:{port}/ted"}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main(
+    host: str = "127.0.0.1",
+    port: int = 8890,
+    notices: int = 1_000,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    missing: float = 0.0,
+    fixtures: Optional[str] = None,
+) -> None:
+    """Serve synthetic Cellar and TED API results until interrupted.
+
+    Args:
+        host (str): Interface to listen on
+        port (int): Port to listen on
+        notices (int): Number of notices published per day
+        latency (float): Seconds to wait before answering each request
+        jitter (float): Random variation of the latency, in seconds
+        missing (float): Fraction of the Cellar notices missing from the TED API
+        fixtures (str, optional): Directory of recorded results to replay (a snapshot
+                                  directory of the build); other queries get synthetic results
+    """
+    server = make_server(host, port, notices, latency, jitter, missing, fixtures)
+    print(f"SPARQL endpoint: http://{host}:{server.server_address[1]}/sparql")
+    print(f"TED Search API:  http://{host}:{server.server_address[1]}/ted")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,327 @@
+# /// script
+# requires-python = ">=3.9"
+# dependencies = [
+#     "altair==5.4.1",
+#     "fire==0.7.0",
+#     "loguru==0.7.0",
+#     "marimo",
+#     "pandas",
+#     "pyarrow",
+#     "requests==2.32.5",
+#     "vega-datasets==0.9.0",
+# ]
+# ///
+
+"""
+Benchmarks of the data paths of the apps at production data scale.
+
+Every benchmark drives a pure function of the apps or of the shared package with a
+synthetic result set of growing size (see fake_endpoint.SyntheticData), and
+reports its throughput and its peak memory use: Python allocations (tracemalloc,
+which also sees NumPy buffers) and, separately, the Arrow memory pool, which
+tracemalloc does not see. The functions of the notebooks
+are imported from the notebook files, where they are defined with @app.function.
+
+The results can be written to a JSON file and compared with a previous one, so
+regressions of the hot paths show up in CI (see .github/workflows/benchmarks.yml).
+
+Usage:
+    uv run benchmarks/run_benchmarks.py [--sizes 10000,100000,1000000] [--only NAME]
+                                        [--output results.json] [--baseline previous.json]
+"""
+
+import gc
+import importlib.util
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Union
+
+import fire
+import pyarrow as pa
+from loguru import logger
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "apps"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import fake_endpoint  # noqa: E402
+from ted_open_data.charts import binned_cube, count_by  # noqa: E402
+from ted_open_data.competition import (  # noqa: E402
+    build_competition_query,
+    country_procedure_counts,
+    country_totals,
+    resolve,
+)
+from ted_open_data.geo import TOPOLOGY_PATH  # noqa: E402
+from ted_open_data.labels import LabelStore, fetch_snapshot  # noqa: E402
+from ted_open_data.sparql import SparqlClient, _rows_to_chunk, bindings_to_frame  # noqa: E402
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+# Day the synthetic notices are published on
+DAY = date(2024, 1, 31)
+
+NOTICES_QUERY = """
+SELECT ?publicationNumber ?noticeTypeUri ?formTypeUri
+WHERE { FILTER (?publicationDate = "%s"^^xsd:date) }
+""" % DAY.isoformat()
+
+COMPETITION_QUERY = build_competition_query(DAY)
+
+NOTICE_COUNTS_QUERY = """
+SELECT ?publicationDate ?noticeTypeUri (COUNT(?notice) AS ?documentCount)
+WHERE { FILTER (?publicationDate >= "%s"^^xsd:date && ?publicationDate < "%s"^^xsd:date) }
+GROUP BY ?publicationDate ?noticeTypeUri
+"""
+
+
+class Benchmark(NamedTuple):
+    """A function to measure, and how to build its arguments for a number of rows.
+
+    per_row is False when the input of the function does not grow with the number of
+    rows (e.g. one row per country), so that no throughput is reported for it.
+    """
+
+    name: str
+    setup: Callable[[int], tuple]
+    run: Callable
+    per_row: bool = True
+
+
+class Measurement(NamedTuple):
+    """Best wall time of a call, in seconds, and its peak memory use, in bytes."""
+
+    seconds: float
+    peak_bytes: int
+    arrow_peak_bytes: int
+
+
+def load_notebook(path: Path):
+    """Import a marimo notebook as a module, exposing its @app.function functions."""
+    spec = importlib.util.spec_from_file_location(path.stem.replace("-", "_"), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def results_document(query: str, rows: int) -> dict:
+    """Return a SPARQL JSON results document with synthetic results of a query."""
+    data = fake_endpoint.SyntheticData(notices=rows)
+    variables, values = data.rows(query)
+    text = b"".join(fake_endpoint.serialise(variables, values, csv=False))
+    return json.loads(text)
+
+
+def notice_counts_query(rows: int) -> str:
+    # One row per day and notice type
+    days = max(1, rows // len(fake_endpoint.NOTICE_TYPES))
+    return NOTICE_COUNTS_QUERY % (DAY.isoformat(), (DAY + timedelta(days=days)).isoformat())
+
+
+def benchmarks(labels: LabelStore) -> List[Benchmark]:
+    """Return every benchmark."""
+    daily = load_notebook(ROOT / "apps" / "01-cellar-daily.py")
+    period = load_notebook(ROOT / "apps" / "02-cellar-period.py")
+    competition = load_notebook(ROOT / "apps" / "03-competition-notices-daily.py")
+
+    def csv_rows(rows: int) -> tuple:
+        document = results_document(NOTICES_QUERY, rows)
+        header = document["head"]["vars"]
+        values = [[b[var]["value"] for var in header] for b in document["results"]["bindings"]]
+        return header, values, {}, None, False
+
+    def notices(rows: int) -> tuple:
+        return bindings_to_frame(results_document(NOTICES_QUERY, rows), "pyarrow"), labels
+
+    def competition_uris(rows: int) -> tuple:
+        return bindings_to_frame(results_document(COMPETITION_QUERY, rows)), labels
+
+    def competition_notices(rows: int) -> tuple:
+        return (resolve(*competition_uris(rows)),)
+
+    def notice_counts(rows: int) -> tuple:
+        document = results_document(notice_counts_query(rows), rows)
+        return bindings_to_frame(document), labels.labels("notice-type")
+
+    def labelled_notice_counts(rows: int) -> tuple:
+        return (period.label_notice_types(*notice_counts(rows)),)
+
+    def create_country_map(df):
+        # The spec is what the browser receives
+        return competition.create_country_map(df, TOPOLOGY_PATH).to_dict()
+
+    return [
+        Benchmark("sparql_json_decode", lambda n: (results_document(NOTICES_QUERY, n),), bindings_to_frame),
+        Benchmark(
+            "sparql_json_decode_pyarrow",
+            lambda n: (results_document(NOTICES_QUERY, n), "pyarrow"),
+            bindings_to_frame,
+        ),
+        Benchmark("sparql_csv_decode", csv_rows, _rows_to_chunk),
+        Benchmark("01_enrich_notices", notices, daily.enrich_notices),
+        Benchmark(
+            "01_count_by_notice_type",
+            lambda n: (daily.enrich_notices(*notices(n)), "noticeType"),
+            count_by,
+        ),
+        Benchmark("02_label_notice_types", notice_counts, period.label_notice_types),
+        Benchmark(
+            "02_binned_cube",
+            labelled_notice_counts,
+            lambda df: binned_cube(df, "publicationDate", "noticeTypeLabel", "documentCount"),
+        ),
+        Benchmark("03_resolve_competition", competition_uris, resolve),
+        Benchmark("03_country_procedure_counts", competition_notices, country_procedure_counts),
+        Benchmark(
+            "03_create_country_map",
+            lambda n: (country_totals(country_procedure_counts(*competition_notices(n))),),
+            create_country_map,
+            per_row=False,
+        ),
+    ]
+
+
+# Memory pools used to measure calls; buffers a call keeps alive may still refer to them
+_pools: List[pa.MemoryPool] = []
+
+
+def measure(run: Callable, args: tuple, repeat: int) -> Measurement:
+    """Return the best wall time of a call and its peak Python and Arrow memory use."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run(*args)
+        times.append(time.perf_counter() - start)
+
+    # tracemalloc slows the call down, so memory is measured in a separate call. Arrow
+    # allocations go to a fresh pool, with statistics of its own, for the peak of that call
+    gc.collect()
+    parent = pa.default_memory_pool()
+    pool = pa.proxy_memory_pool(parent)
+    _pools.append(pool)
+    pa.set_memory_pool(pool)
+    tracemalloc.start()
+    try:
+        run(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        pa.set_memory_pool(parent)
+    return Measurement(min(times), peak, pool.max_memory())
+
+
+def compare(results: Dict[str, dict], baseline_path: Path, threshold: float) -> List[str]:
+    """Compare results with a previous run and log the regressions.
+
+    Args:
+        results (Dict[str, dict]): Results of this run, by benchmark and size
+        baseline_path (Path): Path to the results of the previous run
+        threshold (float): Allowed relative growth, e.g. 0.2 for 20%
+
+    Returns:
+        List[str]: Description of every regression found
+    """
+    try:
+        baseline = json.loads(baseline_path.read_text())["results"]
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Could not read baseline results {baseline_path}: {e}")
+        return []
+
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        for metric in ("seconds", "peak_bytes", "arrow_peak_bytes"):
+            if previous.get(metric) and result[metric] > previous[metric] * (1 + threshold):
+                regressions.append(f"{key}: {metric} {previous[metric]:.6g} -> {result[metric]:.6g}")
+
+    for regression in regressions:
+        logger.warning(f"Regression: {regression}")
+    if not regressions:
+        logger.info(f"No regressions above {threshold:.0%} compared to {baseline_path}")
+    return regressions
+
+
+def main(
+    sizes: Union[str, int, tuple] = DEFAULT_SIZES,
+    only: Optional[str] = None,
+    repeat: int = 3,
+    output: Optional[str] = None,
+    baseline: Optional[str] = None,
+    regression_threshold: float = 0.2,
+    fail_on_regression: bool = False,
+) -> None:
+    """Run the benchmarks.
+
+    Args:
+        sizes: Numbers of rows to run every benchmark with, e.g. 10000,100000
+        only (str, optional): Only run the benchmarks whose name contains this
+        repeat (int): Number of timed calls, the fastest one is reported
+        output (str, optional): Where to write the results as JSON
+        baseline (str, optional): Previous results to compare with
+        regression_threshold (float): Allowed relative growth of time and memory
+        fail_on_regression (bool): Exit with status 1 when a regression is found
+
+    Returns:
+        None
+    """
+    # fire passes "10000,100000" as a tuple, a single size as an int
+    if isinstance(sizes, str):
+        sizes = sizes.split(",")
+    sizes = [int(s) for s in (sizes if isinstance(sizes, (list, tuple)) else [sizes])]
+
+    # Labels of the synthetic authority tables, served by the stand-in endpoint
+    with tempfile.TemporaryDirectory() as cache_dir, fake_endpoint.running() as urls:
+        snapshot_path = Path(cache_dir) / "labels.json"
+        snapshot_path.write_text(json.dumps(fetch_snapshot(SparqlClient(urls["sparql"]))))
+        labels = LabelStore(snapshot_path, max_age=None)
+
+        results: Dict[str, dict] = {}
+        for benchmark in benchmarks(labels):
+            if only and only not in benchmark.name:
+                continue
+            for rows in sizes:
+                args = benchmark.setup(rows)
+                measured = measure(benchmark.run, args, repeat)
+                rows_per_second = rows / measured.seconds if benchmark.per_row and measured.seconds else None
+                results[f"{benchmark.name}[{rows}]"] = {
+                    "rows": rows,
+                    "seconds": measured.seconds,
+                    "rows_per_second": rows_per_second,
+                    "peak_bytes": measured.peak_bytes,
+                    "arrow_peak_bytes": measured.arrow_peak_bytes,
+                }
+                del args
+                throughput = f"{rows_per_second:>12,.0f} rows/s" if rows_per_second else f"{'-':>12} rows/s"
+                logger.info(
+                    f"{benchmark.name:<28} {rows:>9} rows {measured.seconds:>9.4f}s {throughput} "
+                    f"{measured.peak_bytes / 2**20:>9.1f} MB peak {measured.arrow_peak_bytes / 2**20:>9.1f} MB Arrow peak"
+                )
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if output:
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        Path(output).write_text(json.dumps(report, indent=2, sort_keys=True))
+        logger.info(f"Wrote benchmark results to {output}")
+
+    if baseline:
+        regressions = compare(results, Path(baseline), regression_threshold)
+        if regressions and fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    fire.Fire(main)